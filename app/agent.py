@@ -1,12 +1,21 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Any, Optional
-import time, os, json, re
+from typing import List, Dict, Any, Optional, Tuple, Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+import time, os, json, re, threading
 import numpy as np
 try:
     from openai import OpenAI
 except Exception:  # pragma: no cover
     OpenAI = None  # type: ignore[assignment]
-from app.retriever import Retriever
+from app.retriever import Retriever, MicroBatcher
+from app.corpora import CorpusCache
+from app.bm25 import rrf_fuse
+from app.embeddings import EmbeddingBackend, make_backend
+from app.notes import NotesEngine, new_notes, set_section, tail
+from app.summarizer import HierarchicalSummarizer, new_tree
+from app.planner import STAGES, Plan, plan_turn
+from app.cache import EmbeddingCache, ClassifierCache, grown_from, normalize_text
+import copy
 
 # -------- OpenAI client (reads OPENAI_API_KEY from env) --------
 _oai: Optional[OpenAI] = None
@@ -18,28 +27,42 @@ def _oai_client() -> OpenAI:
         _oai = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
     return _oai
 
-# -------- Embedding via OpenAI (keeps Codespace tiny) --------
-EMBED_MODEL = "text-embedding-3-small"  # 1536-dim
+# -------- Query embeddings (backend chosen by EMBED_BACKEND, see app/embeddings.py) --------
+EMBEDDER: EmbeddingBackend = make_backend()
+
+# Speculative and final turns often embed the same text; see EMBED_CACHE_* in README.
+EMBED_CACHE = EmbeddingCache.from_env()
 
 def embed_query(text: str, *, state: Optional["AgentState"] = None) -> np.ndarray:
-    client = _oai_client()
-    rsp = client.embeddings.create(model=EMBED_MODEL, input=text)
-    u = getattr(rsp, "usage", None)
-    if state is not None and u is not None:
-        # Embeddings charge only input tokens; prefer prompt_tokens for consistency
-        # with chat models, but fall back to total_tokens if needed.
-        emb_prompt = _safe_int(
-            getattr(u, "prompt_tokens", getattr(u, "total_tokens", 0))
-        )
+    backend = EMBEDDER
+    if not backend.remote:
+        # CPU-local: cheaper to recompute than to cache.
+        return backend.embed([text])[0][0]
+    hit = EMBED_CACHE.get(backend.name, text)
+    if hit is not None:
+        vec, tokens = hit
+        _record_cache(state, "embed_cache", hit=True, model=backend.name, prompt_tokens_saved=tokens)
+        return vec
+    vecs, emb_prompt = backend.embed([text])
+    if state is not None:
         _record_usage(
             state,
-            model=EMBED_MODEL,
+            model=backend.name,
             prompt_tokens=emb_prompt,
             completion_tokens=0,
             feature="embed",
         )
-    emb = rsp.data[0].embedding
-    return np.array(emb, dtype="float32")
+    emb = vecs[0]
+    EMBED_CACHE.put(backend.name, text, emb, emb_prompt)
+    _record_cache(state, "embed_cache", hit=False)
+    return emb.copy()
+
+def embedder_matches(retriever: Retriever) -> bool:
+    """True if query vectors from EMBEDDER can be searched against `retriever`'s index."""
+    built_with = retriever.info.get("embed_model")
+    if built_with and built_with != EMBEDDER.name:
+        return False
+    return retriever.index is None or retriever.index.d == EMBEDDER.dim
 
 # -------- Minimal runtime state --------
 @dataclass
@@ -48,6 +71,7 @@ class AgentState:
     buffer_text: str = ""
     buffer_speaker: str = "Speaker 1"
     mode: str = "coach"  # "coach" | "notes" (or "hybrid" later)
+    corpus: Optional[str] = None  # per-user store under CORPORA_DIR; None = the shared store/
     created_at: float = field(default_factory=lambda: time.time())
     last_seen_at: float = field(default_factory=lambda: time.time())
     last_emit_ts: float = 0.0
@@ -73,20 +97,17 @@ class AgentState:
         "turn": {"by_model": {}, "cost_usd": 0.0},
     })
 
-    notes: Dict[str, Any] = field(default_factory=lambda: {
-        "bullets": [],
-        "action_items": [],
-        "decisions": [],
-        "follow_ups": [],
-        "topics": [],
-        "summary_so_far": None,
-        "current_topic": None,
-        "open_questions": [],
-    })
+    notes: Dict[str, Any] = field(default_factory=new_notes)  # list sections are bounded deques
+    summary: Dict[str, Any] = field(default_factory=new_tree)  # whole-meeting summary tree (USE_OAI_NOTES)
 
     # Logical speaker roles per session, e.g. {"Me": "candidate", "Interviewer": "interviewer"}
     roles: Dict[str, str] = field(default_factory=lambda: {})
 
+    # Runtime-only handles; not part of the session's data.
+    turn_lock: Optional[Any] = field(default=None, repr=False, compare=False, metadata={"runtime": True})
+    classify_cache: Optional[ClassifierCache] = field(default=None, repr=False, compare=False, metadata={"runtime": True})
+    prefetch: Optional["Prefetch"] = field(default=None, repr=False, compare=False, metadata={"runtime": True})
+
 class EndOfThought:
     def __init__(self, pause_ms: int = 900, stable_n: int = 2, min_words: int = 10, max_words: int = 60):
         self.pause_ms = pause_ms
@@ -133,6 +154,10 @@ def _safe_int(x: Any) -> int:
         return 0
 
 
+# Classifier and retrieval may record usage from different threads (see _classify_and_retrieve).
+_USAGE_LOCK = threading.Lock()
+
+
 def _record_usage(
     state: AgentState,
     *,
@@ -140,6 +165,75 @@ def _record_usage(
     prompt_tokens: int,
     completion_tokens: int,
     feature: str = "core",
+    in_turn: bool = True,
+) -> None:
+    """`in_turn=False` for background calls (notes refinement): session totals only, never
+    the ledger of whatever turn is running."""
+    with _USAGE_LOCK:
+        _record_usage_locked(
+            state, model=model, prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens, feature=feature, in_turn=in_turn,
+        )
+
+
+def _record_cache(
+    state: Optional[AgentState],
+    name: str,
+    *,
+    hit: bool,
+    model: Optional[str] = None,
+    prompt_tokens_saved: int = 0,
+    completion_tokens_saved: int = 0,
+) -> None:
+    """Hit/miss counters for a model-call cache, with the tokens and cost a hit avoided."""
+    if state is None:
+        return
+    with _USAGE_LOCK:
+        row = state.usage.setdefault(
+            name, {"hits": 0, "misses": 0, "tokens_saved": 0, "cost_usd_saved": 0.0}
+        )
+        if not hit:
+            row["misses"] += 1
+            return
+        row["hits"] += 1
+        row["tokens_saved"] += _safe_int(prompt_tokens_saved) + _safe_int(completion_tokens_saved)
+        price = PRICES_PER_1M_TOKENS.get(model or "")
+        if price:
+            saved = (
+                (_safe_int(prompt_tokens_saved) / 1_000_000.0) * price.get("input", 0.0)
+                + (_safe_int(completion_tokens_saved) / 1_000_000.0) * price.get("output", 0.0)
+            )
+            row["cost_usd_saved"] = round(float(row.get("cost_usd_saved", 0.0)) + saved, 6)
+
+
+def _record_timing(state: Optional[AgentState], stage: str, ms: float) -> None:
+    """Per-turn stage latency, reported under usage.turn.timings_ms."""
+    if state is None:
+        return
+    with _USAGE_LOCK:
+        turn = state.usage.setdefault("turn", {"by_model": {}, "cost_usd": 0.0})
+        turn.setdefault("timings_ms", {})[stage] = round(ms, 1)
+
+
+def _record_stage(state: Optional[AgentState], stage: str) -> None:
+    """Drop a stage that ran from usage.turn.skipped_stages."""
+    if state is None:
+        return
+    with _USAGE_LOCK:
+        turn = state.usage.setdefault("turn", {"by_model": {}, "cost_usd": 0.0})
+        skipped = turn.get("skipped_stages")
+        if skipped and stage in skipped:
+            skipped.remove(stage)
+
+
+def _record_usage_locked(
+    state: AgentState,
+    *,
+    model: str,
+    prompt_tokens: int,
+    completion_tokens: int,
+    feature: str,
+    in_turn: bool = True,
 ) -> None:
     by_model = state.usage.setdefault("by_model", {})
     row = by_model.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0})
@@ -155,14 +249,15 @@ def _record_usage(
         )
         state.usage["cost_usd_total"] = round(float(state.usage.get("cost_usd_total", 0.0)) + row_delta_cost, 6)
 
-        turn = state.usage.setdefault("turn", {"by_model": {}, "cost_usd": 0.0})
-        turn["cost_usd"] = round(float(turn.get("cost_usd", 0.0)) + row_delta_cost, 6)
-        t_by_model = turn.setdefault("by_model", {})
-        trow = t_by_model.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0})
-        trow["prompt_tokens"] += _safe_int(prompt_tokens)
-        trow["completion_tokens"] += _safe_int(completion_tokens)
-        trow["total_tokens"] += _safe_int(prompt_tokens) + _safe_int(completion_tokens)
-        trow["cost_usd"] = round(float(trow.get("cost_usd", 0.0)) + row_delta_cost, 6)
+        if in_turn:
+            turn = state.usage.setdefault("turn", {"by_model": {}, "cost_usd": 0.0})
+            turn["cost_usd"] = round(float(turn.get("cost_usd", 0.0)) + row_delta_cost, 6)
+            t_by_model = turn.setdefault("by_model", {})
+            trow = t_by_model.setdefault(model, {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost_usd": 0.0})
+            trow["prompt_tokens"] += _safe_int(prompt_tokens)
+            trow["completion_tokens"] += _safe_int(completion_tokens)
+            trow["total_tokens"] += _safe_int(prompt_tokens) + _safe_int(completion_tokens)
+            trow["cost_usd"] = round(float(trow.get("cost_usd", 0.0)) + row_delta_cost, 6)
 
         # Aggregate by feature as well (coach vs notes vs embed, etc.)
         by_feature = state.usage.setdefault("by_feature", {})
@@ -227,17 +322,353 @@ def classify_question(text: str, *, state: Optional[AgentState] = None) -> Dict[
             "error": str(e),
         }
 
+# -------- Classifier result reuse --------
+# A speculative emit and the final that follows usually carry the same utterance plus a
+# few words; reuse the speculative classification instead of paying for it twice.
+CLASSIFY_CACHE_GROWTH_WORDS = int(os.getenv("CLASSIFY_CACHE_GROWTH_WORDS", "4"))
+GLOBAL_CLASSIFY_CACHE: Optional[ClassifierCache] = (
+    ClassifierCache(max_entries=int(os.getenv("CLASSIFY_GLOBAL_CACHE_SIZE", "1024")), prefix_match=False)
+    if os.getenv("CLASSIFY_GLOBAL_CACHE", "false").lower() in ("1", "true", "yes")
+    else None
+)
+
+
+def classify_cached(text: str, *, state: Optional[AgentState] = None) -> Dict[str, Any]:
+    session_cache = None
+    if state is not None:
+        if state.classify_cache is None:
+            state.classify_cache = ClassifierCache(max_growth_words=CLASSIFY_CACHE_GROWTH_WORDS)
+        session_cache = state.classify_cache
+    hit = session_cache.lookup(text) if session_cache is not None else None
+    if hit is None and GLOBAL_CLASSIFY_CACHE is not None:
+        hit = GLOBAL_CLASSIFY_CACHE.lookup(text)
+    if hit is not None:
+        _record_cache(state, "classifier_cache", hit=True)
+        return copy.deepcopy(hit)
+
+    cls = classify_question(text, state=state)
+    if "error" not in cls:
+        if session_cache is not None:
+            session_cache.store(text, copy.deepcopy(cls))
+        if GLOBAL_CLASSIFY_CACHE is not None:
+            GLOBAL_CLASSIFY_CACHE.store(text, copy.deepcopy(cls))
+    _record_cache(state, "classifier_cache", hit=False)
+    return cls
+
 # -------- Retriever (injected at startup by server.py) --------
 RETRIEVER: Optional[Retriever] = None
 
-def retrieve_context(query: str, k: int = 4, *, state: Optional[AgentState] = None) -> List[Dict[str, Any]]:
-    if RETRIEVER is None: 
+# Sessions with a `corpus` search their own store instead; loaded on first use and cached.
+CORPORA: CorpusCache = CorpusCache.from_env()
+
+def resolve_retriever(state: Optional[AgentState]) -> Optional[Retriever]:
+    """The session's corpus if it has one (None if that corpus is not built), else RETRIEVER.
+
+    A missing corpus never falls back to the shared store, so one user's questions are
+    not answered from someone else's documents.
+    """
+    corpus = getattr(state, "corpus", None) if state is not None else None
+    if corpus:
+        return CORPORA.get(corpus)
+    return RETRIEVER
+
+# Concurrent turns across sessions share FAISS calls: searches arriving within
+# RETRIEVER_BATCH_WINDOW_MS are issued as one (n, d) index.search. Opt-in: 0 (default) disables.
+_BATCH_WINDOW_MS = float(os.getenv("RETRIEVER_BATCH_WINDOW_MS", "0"))
+SEARCH_BATCHER: Optional[MicroBatcher] = (
+    MicroBatcher(window_ms=_BATCH_WINDOW_MS, max_batch=int(os.getenv("RETRIEVER_BATCH_MAX", "64")))
+    if _BATCH_WINDOW_MS > 0 else None
+)
+
+_MISMATCH_WARNED: set = set()
+
+def _warn_embedder_mismatch(retriever: Retriever) -> None:
+    if retriever.store_dir in _MISMATCH_WARNED:
+        return
+    _MISMATCH_WARNED.add(retriever.store_dir)
+    print(f"[retrieve] {retriever.store_dir} was built with {retriever.info.get('embed_model')!r} "
+          f"(dim {retriever.index.d}) but EMBED_BACKEND is {EMBEDDER.name!r} (dim {EMBEDDER.dim}); "
+          "using keyword search only. Rebuild the index with the same backend.", flush=True)
+
+# Stores built with bm25.json: vector and keyword hits are fused by reciprocal rank, and
+# speculative turns can rank by keywords alone (no embedding round trip).
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+SPECULATIVE_LEXICAL = os.getenv("SPECULATIVE_LEXICAL", "true").lower() in ("1", "true", "yes")
+
+def retrieve_context(
+    query: str,
+    k: int = 4,
+    *,
+    state: Optional[AgentState] = None,
+    lexical_only: bool = False,
+) -> List[Dict[str, Any]]:
+    """Top-k chunks for `query`. With `lexical_only`, BM25 alone ranks the chunks when the
+    store has a keyword index; without one the query is still embedded."""
+    retriever = resolve_retriever(state)
+    if retriever is None:
         return []
+    if not embedder_matches(retriever):
+        # Built with another embedding backend: only the keyword index is usable.
+        _warn_embedder_mismatch(retriever)
+        lexical_only = True
+        if retriever.bm25 is None:
+            return []
+    hybrid = retriever.bm25 is not None and (HYBRID_RETRIEVAL or lexical_only)
+    _record_stage(state, "retrieve")
+    if hybrid and lexical_only:
+        t0 = time.perf_counter()
+        hits = retriever.search_lexical(query, k=k)
+        _record_timing(state, "lexical", (time.perf_counter() - t0) * 1000.0)
+        return hits
+    t0 = time.perf_counter()
     qv = embed_query(query, state=state)
-    return RETRIEVER.search(qv, k=k)
+    _record_stage(state, "embed")
+    t1 = time.perf_counter()
+    kk = 2 * k if hybrid else k  # fuse from a deeper candidate list
+    if SEARCH_BATCHER is not None:
+        hits = SEARCH_BATCHER.search(retriever, qv, k=kk)
+    else:
+        hits = retriever.search(qv, k=kk)
+    t2 = time.perf_counter()
+    _record_timing(state, "embed", (t1 - t0) * 1000.0)
+    _record_timing(state, "search", (t2 - t1) * 1000.0)
+    if hybrid:
+        lexical = retriever.search_lexical(query, k=kk)
+        vector_ids = {h["id"] for h in hits}
+        if retriever.min_score > 0 and retriever.min_lexical_score <= 0:
+            # Only RETRIEVER_MIN_LEXICAL_SCORE admits keyword-only hits past a vector threshold.
+            lexical = [h for h in lexical if h["id"] in vector_ids]
+        # Keyword-only hits have no cosine score; keep "score" on one scale for confidence().
+        hits = [
+            h if h["id"] in vector_ids else dict(h, score=0.0, lexical_score=h["score"])
+            for h in rrf_fuse([hits, lexical], k)
+        ]
+        _record_timing(state, "lexical", (time.perf_counter() - t2) * 1000.0)
+    return hits
+
+
+# -------- Classify + retrieve fan-out --------
+# The classifier and the embedding round trip have no data dependency, so by default
+# they run concurrently and a turn pays max(classify, embed + search) instead of the sum.
+PARALLEL_FANOUT = os.getenv("PARALLEL_FANOUT", "true").lower() in ("1", "true", "yes")
+_FANOUT_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("FANOUT_WORKERS", "8")), thread_name_prefix="fanout"
+)
+
+
+def _timed(fn, *args, **kwargs) -> Tuple[Any, float]:
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return out, (time.perf_counter() - t0) * 1000.0
+
+
+def _classify_and_retrieve(
+    state: AgentState,
+    text: str,
+    *,
+    k: int = 4,
+    timings: bool = True,
+    lexical_only: bool = False,
+    classify: bool = True,
+    retrieve: bool = True,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """`classify` / `retrieve` False skip that call (see app/planner.py)."""
+    t0 = time.perf_counter()
+    if classify:
+        _record_stage(state, "classify")
+    if PARALLEL_FANOUT and classify and retrieve:
+        # Classifier on the pool, retrieval on the calling thread.
+        f_cls = _FANOUT_POOL.submit(_timed, classify_cached, text, state=state)
+        ctx, ctx_ms = _timed(retrieve_context, text, k=k, state=state, lexical_only=lexical_only)
+        cls, cls_ms = f_cls.result()
+    else:
+        cls, cls_ms = _timed(classify_cached, text, state=state) if classify else (_unclassified(), None)
+        ctx, ctx_ms = (
+            _timed(retrieve_context, text, k=k, state=state, lexical_only=lexical_only)
+            if retrieve else ([], None)
+        )
+    if timings:
+        if cls_ms is not None:
+            _record_timing(state, "classify", cls_ms)
+        if ctx_ms is not None:
+            _record_timing(state, "retrieve", ctx_ms)
+        if classify or retrieve:
+            _record_timing(state, "fanout", (time.perf_counter() - t0) * 1000.0)
+    return cls, ctx
+
+
+def _unclassified() -> Dict[str, Any]:
+    """Stand-in classification for turns whose plan skips the classifier."""
+    return {
+        "intent": "unknown",
+        "entities": {"company": None, "role": None, "skills": [], "numbers": [], "dates": [], "times": []},
+        "confidence": 0.0,
+    }
+
+
+def plan_for(state: AgentState, kind: str) -> Plan:
+    return plan_turn(
+        getattr(state, "mode", "coach") or "coach", kind,
+        lexical_speculative=SPECULATIVE_LEXICAL, refine_notes=USE_OAI_NOTES,
+    )
+
+
+# -------- Speculative prefetch (opt-in) --------
+# While the buffer is still growing, start classify + retrieve in the background once it
+# crosses min_words. The eventual emit reuses the in-flight or finished work when its text
+# is the prefetched text plus a few words; prefetches for diverged text are dropped.
+PREFETCH = os.getenv("PREFETCH", "false").lower() in ("1", "true", "yes")
+PREFETCH_MAX_GROWTH_WORDS = int(os.getenv("PREFETCH_MAX_GROWTH_WORDS", "4"))
+# Separate pool: prefetch jobs wait on classifier futures submitted to _FANOUT_POOL.
+_PREFETCH_POOL = ThreadPoolExecutor(
+    max_workers=int(os.getenv("PREFETCH_WORKERS", "4")), thread_name_prefix="prefetch"
+)
+
+
+class _UsageBuffer:
+    """Stands in for the session in background work: attributes read and write through to
+    the session, but usage lands in a private ledger. It is merged into the session only
+    if the work is used, so an abandoned prefetch bills nothing and a running turn's
+    `usage.turn` is never touched from another thread."""
+
+    def __init__(self, state: AgentState):
+        object.__setattr__(self, "_state", state)
+        object.__setattr__(self, "usage", {
+            "by_model": {}, "by_feature": {}, "cost_usd_total": 0.0,
+            "turn": {"by_model": {}, "cost_usd": 0.0, "skipped_stages": list(STAGES)},
+        })
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._state, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._state, name, value)
+
+
+def _merge_usage(dst: Dict[str, Any], src: Dict[str, Any]) -> None:
+    for k, v in src.items():
+        if k == "timings_ms":
+            continue  # latencies of background work are not the turn's
+        if k == "skipped_stages":
+            # A stage the reused work ran is not skipped by the turn either.
+            dst[k] = [s for s in dst.get(k, []) if s in v]
+        elif isinstance(v, dict):
+            _merge_usage(dst.setdefault(k, {}), v)
+        elif isinstance(v, float):
+            dst[k] = round(float(dst.get(k, 0.0)) + v, 6)
+        elif isinstance(v, int):
+            dst[k] = int(dst.get(k, 0)) + v
+
+
+@dataclass
+class Prefetch:
+    text: str
+    words: List[str]
+    future: Future
+    ledger: Optional[_UsageBuffer] = None  # the prefetch's usage, billed only on reuse
+
+
+def prefetch(state: AgentState, *, min_words: int) -> None:
+    """Start (or keep) a background classify + retrieve for the current buffer."""
+    if not PREFETCH:
+        return
+    plan = plan_for(state, "final")
+    if not (plan.needs("classify") or plan.needs("retrieve")):
+        return  # nothing to get ahead on (e.g. notes mode)
+    text = state.buffer_text.strip()
+    words = normalize_text(text).split()
+    if len(words) < min_words:
+        return
+    cur = state.prefetch
+    if cur is not None:
+        if grown_from(words, cur.words, PREFETCH_MAX_GROWTH_WORDS):
+            return  # still covers the buffer
+        cur.future.cancel()  # no-op if already running; its result is simply not used
+    ledger = _UsageBuffer(state)
+    state.prefetch = Prefetch(
+        text=text,
+        words=words,
+        future=_PREFETCH_POOL.submit(_classify_and_retrieve, ledger, text, k=4, timings=False),
+        ledger=ledger,
+    )
+
+
+def _take_prefetch(
+    state: AgentState, text: str
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    pf, state.prefetch = state.prefetch, None
+    if pf is None:
+        return None
+    if pf.future.cancelled() or not grown_from(normalize_text(text).split(), pf.words, PREFETCH_MAX_GROWTH_WORDS):
+        pf.future.cancel()
+        _record_cache(state, "prefetch", hit=False)
+        return None
+    t0 = time.perf_counter()
+    try:
+        out = pf.future.result()
+    except Exception as e:
+        print("[prefetch] error:", e, flush=True)
+        _record_cache(state, "prefetch", hit=False)
+        return None
+    _record_timing(state, "prefetch_wait", (time.perf_counter() - t0) * 1000.0)
+    if pf.ledger is not None:
+        with _USAGE_LOCK:
+            _merge_usage(state.usage, pf.ledger.usage)
+    _record_cache(state, "prefetch", hit=True)
+    return out
 
 # -------- Drafting: OpenAI (optional) or local template --------
 USE_OAI_DRAFTER = os.getenv("USE_OAI_DRAFTER", "false").lower() in ("1","true","yes")
+# When the caller can forward partials (the /ws handler), stream the drafter so options
+# reach the client as each one completes instead of after the whole completion.
+STREAM_DRAFTER = os.getenv("STREAM_DRAFTER", "true").lower() in ("1", "true", "yes")
+
+_JSON_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def _partial_options(buf: str) -> List[str]:
+    """Completed strings of the "options" array in a JSON object that is still streaming."""
+    m = re.search(r'"options"\s*:\s*\[', buf)
+    if not m:
+        return []
+    out: List[str] = []
+    pos = m.end()
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= len(buf) or buf[pos] != '"':
+            return out  # end of array, or the next string has not started
+        sm = _JSON_STRING.match(buf, pos)
+        if not sm:
+            return out  # string still open
+        try:
+            out.append(json.loads(sm.group(0)))
+        except ValueError:
+            return out
+        pos = sm.end()
+
+
+def _stream_completion(client, on_options: Callable[[List[str]], None], **kwargs) -> Tuple[str, Any]:
+    """Run a streaming chat completion; report each newly completed option. Returns (content, usage)."""
+    stream = client.chat.completions.create(stream=True, stream_options={"include_usage": True}, **kwargs)
+    parts: List[str] = []
+    usage = None
+    seen = 0
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        choices = getattr(chunk, "choices", None) or []
+        delta = getattr(choices[0].delta, "content", None) if choices else None
+        if not delta:
+            continue
+        parts.append(delta)
+        if '"' in delta:
+            opts = _partial_options("".join(parts))
+            if len(opts) > seen:
+                seen = len(opts)
+                on_options(opts[:3])
+    return "".join(parts), usage
+
 
 def _draft_with_openai(
     text: str,
@@ -245,6 +676,7 @@ def _draft_with_openai(
     prefs: Dict[str, Any],
     *,
     state: Optional[AgentState] = None,
+    on_options: Optional[Callable[[List[str]], None]] = None,
 ) -> Dict[str, Any]:
     client = _oai_client()
     ctx_txt = "\n\n".join(f"[{i+1}] {c['text']}" for i, c in enumerate(ctx[:4])) or "No context."
@@ -255,18 +687,22 @@ def _draft_with_openai(
         "Return JSON with keys: options (2-3 strings), follow_up (string), bridge (string).\n"
         "First-person, concise, each option <= 2 sentences. If context is weak, say 'Context is limited'."
     )
+    request = dict(
+        model=DRAFTER_MODEL,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": f"Utterance: {text}\n\nContext:\n{ctx_txt}\n\nPrefs: {prefs}"}
+        ],
+        max_tokens=300,
+        temperature=0.3,
+    )
     try:
-        rsp = client.chat.completions.create(
-            model=DRAFTER_MODEL,
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_msg},
-                {"role": "user", "content": f"Utterance: {text}\n\nContext:\n{ctx_txt}\n\nPrefs: {prefs}"}
-            ],
-            max_tokens=300,
-            temperature=0.3,
-        )
-        u = getattr(rsp, "usage", None)
+        if on_options is not None and STREAM_DRAFTER:
+            raw, u = _stream_completion(client, on_options, **request)
+        else:
+            rsp = client.chat.completions.create(**request)
+            raw, u = rsp.choices[0].message.content, getattr(rsp, "usage", None)
         if state is not None and u is not None:
             _record_usage(
                 state,
@@ -275,8 +711,7 @@ def _draft_with_openai(
                 completion_tokens=_safe_int(getattr(u, "completion_tokens", 0)),
                 feature=f"{getattr(state, 'mode', 'coach')}_drafter",
             )
-        raw = rsp.choices[0].message.content or "{}"
-        data = json.loads(raw)
+        data = json.loads(raw or "{}")
         options = (data.get("options") or [])[:3]
         follow_up = data.get("follow_up") or "Would it help to go deeper on metrics or rollout?"
         bridge = data.get("bridge") or "Happy to share specifics."
@@ -319,21 +754,24 @@ def draft_answer(
     *,
     state: Optional[AgentState] = None,
     fast_only: bool = False,
+    on_options: Optional[Callable[[List[str]], None]] = None,
 ) -> Dict[str, Any]:
     # For speculative emits, stay on the local path to avoid extra latency.
     if fast_only or not USE_OAI_DRAFTER:
         return _draft_local(text, ctx, prefs)
-    return _draft_with_openai(text, ctx, prefs, state=state)
+    return _draft_with_openai(text, ctx, prefs, state=state, on_options=on_options)
 
 def refine_answer(draft: Dict[str, Any], ctx: List[Dict[str, Any]]) -> Dict[str, Any]:
     return draft
 
+def _clamp(s: str) -> str:
+    s = s.replace("utilize", "use")
+    if len(s.split()) > 40:
+        s = " ".join(s.split()[:40]) + "..."
+    return s
+
 def style_adapter(draft: Dict[str, Any], prefs: Dict[str, Any]) -> Dict[str, Any]:
-    def clamp(s: str) -> str:
-        s = s.replace("utilize", "use")
-        if len(s.split()) > 40:
-            s = " ".join(s.split()[:40]) + "..."
-        return s
+    clamp = _clamp
     out = draft.copy()
     out["options"]   = [clamp(o) for o in draft["options"]]
     out["follow_up"] = clamp(draft["follow_up"])
@@ -341,7 +779,7 @@ def style_adapter(draft: Dict[str, Any], prefs: Dict[str, Any]) -> Dict[str, Any
     return out
 
 def confidence(ctx: List[Dict[str, Any]], cls_conf: float) -> float:
-    top = ctx[0]["score"] if ctx else 0.0
+    top = max((c["score"] for c in ctx), default=0.0)
     return round(0.5*cls_conf + 0.5*top, 2)
 
 
@@ -390,23 +828,50 @@ def _draft_framework(text: str, intent: str, *, state: Optional[AgentState] = No
     }
 
 
-def process_turn(state: AgentState, *, kind: str = "final") -> Optional[Dict[str, Any]]:
+class TurnCancelled(Exception):
+    """Raised by process_turn when its `cancel` event was set before the turn committed."""
+
+
+def process_turn(
+    state: AgentState,
+    *,
+    kind: str = "final",
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> Optional[Dict[str, Any]]:
+    """Run one turn. `on_partial` (coach finals only) receives coach_final partial payloads
+    with the suggestions completed so far while the drafter streams. If `cancel` is set
+    by the time classification/retrieval return, the turn raises TurnCancelled before it
+    touches intents, notes or the buffer."""
+    mode = getattr(state, "mode", "coach") or "coach"
+    plan = plan_for(state, kind)
     # Reset per-turn usage ledger
-    state.usage["turn"] = {"by_model": {}, "cost_usd": 0.0}
+    # Stages drop out of skipped_stages as they run (see _record_stage).
+    state.usage["turn"] = {"by_model": {}, "cost_usd": 0.0, "skipped_stages": list(STAGES)}
 
-    cls = classify_question(state.buffer_text, state=state)
+    reused = _take_prefetch(state, state.buffer_text)
+    if reused is not None:
+        cls, ctx = reused
+    else:
+        # Without the embed stage (speculative themes), retrieval is keyword search only.
+        cls, ctx = _classify_and_retrieve(
+            state, state.buffer_text, k=4,
+            lexical_only=not plan.needs("embed"),
+            classify=plan.needs("classify"), retrieve=plan.needs("retrieve"),
+        )
+    if cancel is not None and cancel.is_set():
+        raise TurnCancelled()
     state.intent_history.append(cls["intent"])
-    ctx = retrieve_context(state.buffer_text, k=4, state=state)
     state.retrieval_cache = {"last_query": state.buffer_text, "doc_ids": [c["id"] for c in ctx]}
-    mode = getattr(state, "mode", "coach") or "coach"
     speaker = getattr(state, "buffer_speaker", "Speaker 1")
 
+    # LLM refinement (USE_OAI_NOTES) runs after the emit, see app/refiner.py.
     _update_notes(state, speaker=speaker, text=state.buffer_text)
-    if kind == "final":
-        _enhance_notes_with_llm(state)
 
     # -------- Notes mode: explicit notes_final payload --------
     if mode == "notes":
+        if plan.needs("notes_refine"):
+            _record_stage(state, "notes_refine")  # scheduled by the caller, see app/refiner.py
         notes_obj = _notes_payload(state)
         return _emit_payload(
             kind=kind,
@@ -418,7 +883,7 @@ def process_turn(state: AgentState, *, kind: str = "final") -> Optional[Dict[str
         )
 
     # -------- Coach mode --------
-    if kind == "speculative":
+    if not plan.needs("draft"):
         # Lightweight: no drafter; only classifier + retrieval summary.
         spec = _build_speculative_coach(cls, ctx)
         return _emit_payload(
@@ -432,11 +897,25 @@ def process_turn(state: AgentState, *, kind: str = "final") -> Optional[Dict[str
 
     # Final coach: route behavioral/background -> retrieval; technical/conceptual -> framework
     intent = cls.get("intent", "unknown")
+    _record_stage(state, "draft")
     if intent in FRAMEWORK_INTENTS:
         draft = _draft_framework(state.buffer_text, intent, state=state)
     else:
+        on_options = None
+        if on_partial is not None:
+            transcript = state.buffer_text
+
+            def on_options(opts: List[str]) -> None:
+                on_partial(_emit_payload(
+                    kind="final",
+                    response_type="coach_final",
+                    speaker=speaker,
+                    transcript=transcript,
+                    usage=None,
+                    coach_final={"suggestions": [_clamp(o) for o in opts]},
+                ))
         draft = draft_answer(
-            state.buffer_text, ctx, state.prefs, state=state, fast_only=False,
+            state.buffer_text, ctx, state.prefs, state=state, fast_only=False, on_options=on_options,
         )
     final = style_adapter(refine_answer(draft, ctx), state.prefs)
     score = confidence(ctx, cls.get("confidence", 0.5))
@@ -459,14 +938,14 @@ def process_turn(state: AgentState, *, kind: str = "final") -> Optional[Dict[str
 def _notes_payload(state: AgentState) -> Dict[str, Any]:
     n = state.notes
     return {
-        "bullets": n.get("bullets", [])[-60:],
-        "topics": n.get("topics", [])[-40:],
-        "action_items": n.get("action_items", [])[-30:],
-        "decisions": n.get("decisions", [])[-20:],
-        "follow_ups": n.get("follow_ups", [])[-20:],
+        "bullets": tail(n.get("bullets"), 60),
+        "topics": tail(n.get("topics"), 40),
+        "action_items": tail(n.get("action_items"), 30),
+        "decisions": tail(n.get("decisions"), 20),
+        "follow_ups": tail(n.get("follow_ups"), 20),
         "summary_so_far": n.get("summary_so_far"),
         "current_topic": n.get("current_topic"),
-        "open_questions": n.get("open_questions", [])[-15:],
+        "open_questions": tail(n.get("open_questions"), 15),
     }
 
 
@@ -476,7 +955,7 @@ def _emit_payload(
     response_type: str,
     speaker: str,
     transcript: str,
-    usage: Dict[str, Any],
+    usage: Optional[Dict[str, Any]],
     coach_speculative: Optional[Dict[str, Any]] = None,
     coach_final: Optional[Dict[str, Any]] = None,
     notes_final: Optional[Dict[str, Any]] = None,
@@ -486,8 +965,9 @@ def _emit_payload(
         "response_type": response_type,
         "speaker": speaker,
         "transcript": transcript,
-        "usage": usage,
     }
+    if usage is not None:
+        out["usage"] = usage
     if coach_speculative is not None:
         out["coach_speculative"] = coach_speculative
     if coach_final is not None:
@@ -497,124 +977,176 @@ def _emit_payload(
     return out
 
 
-def _update_notes(state: AgentState, *, speaker: str, text: str) -> None:
-    t = (text or "").strip()
-    if not t:
-        return
-
-    # Lightweight notes so we don't add extra model calls.
-    bullet = f"{speaker}: {t}"
-    state.notes["bullets"].append(bullet)
-    state.notes["bullets"] = state.notes["bullets"][-60:]
-
-    tl = t.lower()
-    if any(p in tl for p in ["we decided", "decision:", "let's go with", "we will proceed with"]):
-        state.notes["decisions"].append(bullet)
-        state.notes["decisions"] = state.notes["decisions"][-20:]
-
-    if any(p in tl for p in ["action item", "todo", "we need to", "we should", "i will", "i'll"]):
-        state.notes["action_items"].append(bullet)
-        state.notes["action_items"] = state.notes["action_items"][-30:]
+# Cue rules live in app/notes.py; swap in NotesEngine(rules) to extend them.
+NOTES_ENGINE = NotesEngine()
 
-    if "follow up" in tl or "follow-up" in tl:
-        state.notes["follow_ups"].append(bullet)
-        state.notes["follow_ups"] = state.notes["follow_ups"][-30:]
 
-    # Extremely lightweight topic labeling: intent plus a coarse tag.
-    topics = state.notes.setdefault("topics", [])
+def _update_notes(state: AgentState, *, speaker: str, text: str) -> None:
+    # Lightweight notes so we don't add extra model calls.
     intent = state.intent_history[-1] if state.intent_history else "unknown"
-    coarse = "other"
-    if any(k in tl for k in ["deadline", "date", "next week", "q", "quarter"]):
-        coarse = "timing"
-    elif any(k in tl for k in ["metric", "kpi", "impact", "result", "%", "percent"]):
-        coarse = "impact"
-    elif any(k in tl for k in ["roadmap", "plan", "strategy"]):
-        coarse = "planning"
-    topics.append({"intent": intent, "tag": coarse})
-    state.notes["topics"] = topics[-80:]
-    state.notes["current_topic"] = coarse
-    if "?" in t:
-        state.notes.setdefault("open_questions", []).append(bullet)
-        state.notes["open_questions"] = state.notes["open_questions"][-15:]
+    bullet = NOTES_ENGINE.update(state.notes, speaker=speaker, text=text, intent=intent)
+    # Queue for the meeting summary only when a refiner pass will drain it (notes mode).
+    if bullet and plan_for(state, "final").needs("notes_refine"):
+        SUMMARIZER.add(state.summary, bullet)
 
 
 USE_OAI_NOTES = os.getenv("USE_OAI_NOTES", "false").lower() in ("1", "true", "yes")
+NOTES_MODEL = os.getenv("NOTES_MODEL", "gpt-4.1-nano")
 
+_NOTES_PROMPT = (
+    "You are a concise meeting notes assistant.\n"
+    "Given recent bullets, action items, decisions, and (when present) earlier_summary of the\n"
+    "meeting before these bullets, return JSON with keys:\n"
+    "summary (string, <= 3 sentences, covering earlier_summary and the bullets),\n"
+    "current_topic (string, one short label),\n"
+    "open_questions (array of strings, unresolved questions from the conversation),\n"
+    "action_items (array of {text, owner?, due?}),\n"
+    "decisions (array of strings),\n"
+    "follow_ups (array of strings),\n"
+    "topics (array of short labels).\n"
+    "Be conservative and never hallucinate owners or dates; leave them null when unsure."
+)
 
-def _enhance_notes_with_llm(state: AgentState) -> None:
-    """Optional, LLM-based notes refinement. Only runs when USE_OAI_NOTES is true.
 
-    It summarizes the last few bullets and refines action items/decisions/follow-ups/topics.
-    """
-    if not USE_OAI_NOTES:
-        return
+def notes_refine_request(state: AgentState) -> Optional[Dict[str, Any]]:
+    """Inputs for one refinement call, copied out of the notes; None if there are no bullets."""
     if not state.notes.get("bullets"):
-        return
+        return None
+    request = {
+        "bullets": tail(state.notes.get("bullets"), 12),
+        "action_items": tail(state.notes.get("action_items"), 12),
+        "decisions": tail(state.notes.get("decisions"), 12),
+    }
+    if state.summary.get("meeting"):
+        request["earlier_summary"] = state.summary["meeting"]
+    return request
 
+
+def refine_notes(request: Dict[str, Any], *, state: Optional[AgentState] = None) -> Optional[Dict[str, Any]]:
+    """One notes-model call on `notes_refine_request` output; None on error. Safe off the turn lock."""
     client = _oai_client()
-    bullets = state.notes.get("bullets", [])[-12:]
-    existing_actions = state.notes.get("action_items", [])[-12:]
-    existing_decisions = state.notes.get("decisions", [])[-12:]
-    prompt = (
-        "You are a concise meeting notes assistant.\n"
-        "Given recent bullets, action items, and decisions, return JSON with keys:\n"
-        "summary (string, <= 3 sentences),\n"
-        "current_topic (string, one short label),\n"
-        "open_questions (array of strings, unresolved questions from the conversation),\n"
-        "action_items (array of {text, owner?, due?}),\n"
-        "decisions (array of strings),\n"
-        "follow_ups (array of strings),\n"
-        "topics (array of short labels).\n"
-        "Be conservative and never hallucinate owners or dates; leave them null when unsure."
-    )
     try:
         rsp = client.chat.completions.create(
-            model=os.getenv("NOTES_MODEL", "gpt-4.1-nano"),
+            model=NOTES_MODEL,
             response_format={"type": "json_object"},
             messages=[
-                {"role": "system", "content": prompt},
-                {"role": "user", "content": json.dumps({
-                    "bullets": bullets,
-                    "action_items": existing_actions,
-                    "decisions": existing_decisions,
-                })}
+                {"role": "system", "content": _NOTES_PROMPT},
+                {"role": "user", "content": json.dumps(request)},
             ],
             max_tokens=400,
             temperature=0.2,
         )
-        raw = rsp.choices[0].message.content or "{}"
-        data = json.loads(raw)
-        if "summary" in data:
-            state.notes["summary_so_far"] = data["summary"]
-        if "action_items" in data:
-            # Store plain strings for now for UI simplicity.
-            items = []
-            for it in data.get("action_items", []):
-                if isinstance(it, str):
-                    items.append(it)
-                elif isinstance(it, dict) and it.get("text"):
-                    owner = it.get("owner")
-                    due = it.get("due")
-                    extra = []
-                    if owner:
-                        extra.append(f"owner={owner}")
-                    if due:
-                        extra.append(f"due={due}")
-                    suffix = f" ({', '.join(extra)})" if extra else ""
-                    items.append(f"{it['text']}{suffix}")
-            state.notes["action_items"] = items[-40:]
-        if "decisions" in data:
-            state.notes["decisions"] = [str(d) for d in data.get("decisions", [])][-40:]
-        if "follow_ups" in data:
-            state.notes["follow_ups"] = [str(f) for f in data.get("follow_ups", [])][-40:]
-        if "topics" in data:
-            cur = [t for t in state.notes.get("topics", []) if isinstance(t, dict)]
-            for label in data.get("topics", []):
-                cur.append({"intent": state.intent_history[-1] if state.intent_history else "unknown", "tag": str(label)})
-            state.notes["topics"] = cur[-80:]
-        if "current_topic" in data and data["current_topic"]:
-            state.notes["current_topic"] = str(data["current_topic"])
-        if "open_questions" in data:
-            state.notes["open_questions"] = [str(q) for q in data.get("open_questions", [])][-15:]
+        u = getattr(rsp, "usage", None)
+        if state is not None and u is not None:
+            _record_usage(
+                state,
+                model=NOTES_MODEL,
+                prompt_tokens=_safe_int(getattr(u, "prompt_tokens", 0)),
+                completion_tokens=_safe_int(getattr(u, "completion_tokens", 0)),
+                feature="notes_refine",
+                in_turn=False,
+            )
+        return json.loads(rsp.choices[0].message.content or "{}")
     except Exception as e:
         print("[notes-llm] error:", e, flush=True)
+        return None
+
+
+# Sections a refinement replaces wholesale (topics are appended to instead).
+REFINED_SECTIONS = ("action_items", "decisions", "follow_ups", "open_questions")
+
+
+def notes_refine_base(state: AgentState) -> Dict[str, List[Any]]:
+    """The replaced sections as they were when a refinement request was taken."""
+    return {k: list(state.notes.get(k) or []) for k in REFINED_SECTIONS}
+
+
+def apply_notes_refinement(
+    state: AgentState, data: Dict[str, Any], *, base: Optional[Dict[str, List[Any]]] = None
+) -> None:
+    """Apply a refine_notes result. With `base` (notes_refine_base at request time), items
+    that turns appended to a replaced section while the call ran are kept after the
+    model's items."""
+
+    def replace(name: str, items: List[Any]) -> None:
+        if base is not None:
+            seen = set(base.get(name, []))
+            items = items + [x for x in state.notes.get(name) or [] if x not in seen]
+        set_section(state.notes, name, items)
+
+    if "summary" in data:
+        state.notes["summary_so_far"] = data["summary"]
+    if "action_items" in data:
+        # Store plain strings for now for UI simplicity.
+        items = []
+        for it in data.get("action_items", []):
+            if isinstance(it, str):
+                items.append(it)
+            elif isinstance(it, dict) and it.get("text"):
+                owner = it.get("owner")
+                due = it.get("due")
+                extra = []
+                if owner:
+                    extra.append(f"owner={owner}")
+                if due:
+                    extra.append(f"due={due}")
+                suffix = f" ({', '.join(extra)})" if extra else ""
+                items.append(f"{it['text']}{suffix}")
+        replace("action_items", items)
+    if "decisions" in data:
+        replace("decisions", [str(d) for d in data.get("decisions", [])])
+    if "follow_ups" in data:
+        replace("follow_ups", [str(f) for f in data.get("follow_ups", [])])
+    if "topics" in data:
+        cur = [t for t in state.notes.get("topics", []) if isinstance(t, dict)]
+        for label in data.get("topics", []):
+            cur.append({"intent": state.intent_history[-1] if state.intent_history else "unknown", "tag": str(label)})
+        set_section(state.notes, "topics", cur)
+    if "current_topic" in data and data["current_topic"]:
+        state.notes["current_topic"] = str(data["current_topic"])
+    if "open_questions" in data:
+        replace("open_questions", [str(q) for q in data.get("open_questions", [])])
+
+
+# -------- Hierarchical meeting summary (see app/summarizer.py) --------
+_SUMMARY_PROMPTS = {
+    "segment": "Summarize this stretch of a meeting transcript (speaker: text bullets)",
+    "merge": "Merge these consecutive summaries of one meeting, oldest first,",
+    "meeting": "Combine these summaries of consecutive parts of one meeting, oldest first,",
+}
+
+
+def summarize_notes(kind: str, texts: List[str], state: Optional[AgentState] = None) -> str:
+    """One summary call for the hierarchical summarizer; raises on error (the pass is retried later)."""
+    client = _oai_client()
+    rsp = client.chat.completions.create(
+        model=NOTES_MODEL,
+        messages=[
+            {"role": "system", "content": (
+                f"{_SUMMARY_PROMPTS[kind]} into one plain-text summary of at most 4 sentences. "
+                "Keep decisions, owners, numbers and open questions; never invent details."
+            )},
+            {"role": "user", "content": "\n".join(texts)},
+        ],
+        max_tokens=200,
+        temperature=0.2,
+    )
+    u = getattr(rsp, "usage", None)
+    if state is not None and u is not None:
+        _record_usage(
+            state,
+            model=NOTES_MODEL,
+            prompt_tokens=_safe_int(getattr(u, "prompt_tokens", 0)),
+            completion_tokens=_safe_int(getattr(u, "completion_tokens", 0)),
+            feature="notes_summary",
+            in_turn=False,
+        )
+    return rsp.choices[0].message.content or ""
+
+
+SUMMARIZER = HierarchicalSummarizer(
+    summarize_notes,
+    segment_turns=int(os.getenv("SUMMARY_SEGMENT_TURNS", "12")),
+    fanin=int(os.getenv("SUMMARY_FANIN", "4")),
+    max_chars=int(os.getenv("SUMMARY_MAX_CHARS", "600")),
+)
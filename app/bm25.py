@@ -0,0 +1,120 @@
+# app/bm25.py
+"""Local BM25 keyword index, stored next to the FAISS index as `bm25.json`.
+
+Lets retrieval rank chunks with no embedding call, either alone (speculative turns)
+or fused with vector hits by reciprocal rank.
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import sys
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+BM25_FILE = "bm25.json"
+# Per-term objects besides the posting data: two array headers, the tuple, the idf float
+# and the dict slot.
+_TERM_OVERHEAD = 2 * 112 + 64 + 24 + 48
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by did do does for from had has have how i if in into is it its "
+    "me my of on or our so than that the their them then there these they this to was we were "
+    "what when where which who why will with you your".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+def build_bm25(texts: Sequence[str], faiss_ids: Sequence[int], *, k1: float = 1.5, b: float = 0.75) -> Dict[str, Any]:
+    """Inverted index over `texts`; row i is reported as `faiss_ids[i]`."""
+    postings: Dict[str, Tuple[List[int], List[int]]] = {}
+    doc_len: List[int] = []
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            rows, tfs = postings.setdefault(term, ([], []))
+            rows.append(row)
+            tfs.append(tf)
+    return {
+        "k1": k1,
+        "b": b,
+        "ids": [int(i) for i in faiss_ids],
+        "doc_len": doc_len,
+        "postings": {t: [rows, tfs] for t, (rows, tfs) in postings.items()},
+    }
+
+
+def write_bm25(out_dir: str, data: Dict[str, Any]) -> None:
+    path = os.path.join(out_dir, BM25_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+class BM25Index:
+    def __init__(self, data: Dict[str, Any]):
+        self.k1 = float(data["k1"])
+        self.b = float(data["b"])
+        self.ids = np.asarray(data["ids"], dtype="int64")
+        self.doc_len = np.asarray(data["doc_len"], dtype="float32")
+        n = len(self.ids)
+        self.avgdl = float(self.doc_len.mean()) if n else 0.0
+        self._norm = self.k1 * (1 - self.b + self.b * self.doc_len / max(self.avgdl, 1e-9))
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray, float]] = {}
+        for term, (rows, tfs) in data["postings"].items():
+            df = len(rows)
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            self._postings[term] = (np.asarray(rows, dtype="int64"), np.asarray(tfs, dtype="float32"), idf)
+
+    @classmethod
+    def load(cls, store_dir: str) -> "BM25Index":
+        with open(os.path.join(store_dir, BM25_FILE), "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def nbytes(self) -> int:
+        """Approximate resident size: every posting list plus per-term object overhead."""
+        total = self.ids.nbytes + self.doc_len.nbytes + self._norm.nbytes
+        for term, (rows, tfs, _) in self._postings.items():
+            total += sys.getsizeof(term) + rows.nbytes + tfs.nbytes + _TERM_OVERHEAD
+        return total
+
+    def search(self, text: str, k: int = 4) -> List[Tuple[int, float]]:
+        """Top-k (faiss id, BM25 score), best first; only chunks sharing a term with `text`."""
+        if not len(self.ids):
+            return []
+        scores = np.zeros(len(self.ids), dtype="float32")
+        for term in set(tokenize(text)):
+            p = self._postings.get(term)
+            if p is None:
+                continue
+            rows, tfs, idf = p
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._norm[rows])
+        hit = np.flatnonzero(scores)
+        if not len(hit):
+            return []
+        top = hit[np.argsort(-scores[hit], kind="stable")[:k]]
+        return [(int(self.ids[r]), float(scores[r])) for r in top]
+
+
+def rrf_fuse(ranked: Iterable[List[Dict[str, Any]]], k: int, *, c: int = 60) -> List[Dict[str, Any]]:
+    """Reciprocal-rank fusion of hit lists (by "id"); the first list's hit dict wins on ties."""
+    fused: Dict[str, float] = {}
+    first: Dict[str, Dict[str, Any]] = {}
+    for hits in ranked:
+        for rank, h in enumerate(hits):
+            fused[h["id"]] = fused.get(h["id"], 0.0) + 1.0 / (c + rank + 1)
+            first.setdefault(h["id"], h)
+    order = sorted(fused, key=lambda i: -fused[i])[:k]
+    return [first[i] for i in order]
@@ -0,0 +1,253 @@
+# app/cache.py
+"""Caches in front of paid model calls."""
+from __future__ import annotations
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def normalize_text(text: str) -> str:
+    """Cache-key normalization: collapse whitespace and casefold."""
+    return " ".join((text or "").split()).casefold()
+
+
+def grown_from(words: list, base: list, max_growth_words: int, *, min_prefix: int = 3) -> bool:
+    """True if `words` is `base` plus at most `max_growth_words` words.
+
+    Every word of `base` must match: a revised word can change the question
+    ("...about yourself" vs "...about compensation"), so it is never a hit. Bases
+    shorter than `min_prefix` words only match exactly.
+    """
+    if len(words) < len(base) or words[: len(base)] != base:
+        return False
+    if len(words) > len(base) and len(base) < min_prefix:
+        return False
+    return len(words) - len(base) <= max_growth_words
+
+
+class EmbeddingCache:
+    """LRU + TTL cache of embedding vectors keyed by (model, normalized text).
+
+    Vectors live in one float32 matrix of `max_entries` rows. With `persist_dir`
+    the matrix is a memory-mapped file (`embeddings.f32`) and the key -> row index
+    is written to `embeddings.json`, so the cache survives restarts. The index is only
+    flushed every FLUSH_EVERY puts, so each row's key digest is stored next to it
+    (`embeddings.keys`) and checked on read: after a crash, an index entry whose row
+    was reused since the last flush is a miss, not another text's vector.
+    """
+
+    FLUSH_EVERY = 16
+
+    def __init__(self, max_entries: int = 2048, ttl_s: float = 3600.0, persist_dir: Optional[str] = None):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.persist_dir = persist_dir
+        self._lock = threading.Lock()
+        # key -> (row, created_at, tokens); order is LRU (oldest first)
+        self._entries: "OrderedDict[str, Tuple[int, float, int]]" = OrderedDict()
+        self._free: list = []
+        self._vecs: Optional[np.ndarray] = None
+        self._keys: Optional[np.ndarray] = None  # row -> sha1 digest of its key
+        self._dim = 0
+        self._dirty = 0
+        if persist_dir and self.max_entries:
+            self._load()
+            atexit.register(self.flush)
+
+    @classmethod
+    def from_env(cls) -> "EmbeddingCache":
+        return cls(
+            max_entries=int(os.getenv("EMBED_CACHE_SIZE", "2048")),
+            ttl_s=float(os.getenv("EMBED_CACHE_TTL_S", "3600")),
+            persist_dir=os.getenv("EMBED_CACHE_DIR") or None,
+        )
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha1(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, model: str, text: str) -> Optional[Tuple[np.ndarray, int]]:
+        """Return (vector copy, prompt tokens of the original call) or None."""
+        if not self.max_entries:
+            return None
+        k = self.key(model, text)
+        with self._lock:
+            ent = self._entries.get(k)
+            if ent is None:
+                return None
+            row, created, tokens = ent
+            if self.ttl_s > 0 and time.time() - created > self.ttl_s:
+                del self._entries[k]
+                self._free.append(row)
+                self._dirty += 1
+                return None
+            if bytes(self._keys[row]) != bytes.fromhex(k):
+                del self._entries[k]  # row reused after the index was last flushed
+                self._dirty += 1
+                return None
+            self._entries.move_to_end(k)
+            return np.array(self._vecs[row], dtype="float32"), tokens
+
+    def put(self, model: str, text: str, vec: np.ndarray, tokens: int = 0) -> None:
+        if not self.max_entries:
+            return
+        v = np.asarray(vec, dtype="float32").reshape(-1)
+        k = self.key(model, text)
+        with self._lock:
+            if self._vecs is None:
+                self._allocate(v.shape[0])
+            if v.shape[0] != self._dim:
+                return  # a different embedding size than the cache was created with
+            ent = self._entries.pop(k, None)
+            if ent is not None:
+                row = ent[0]
+            elif self._free:
+                row = self._free.pop()
+            elif len(self._entries) < self.max_entries:
+                row = len(self._entries)
+            else:
+                _, (row, _, _) = self._entries.popitem(last=False)
+            # Clear the digest first: a write cut short leaves a row no key matches.
+            self._keys[row] = 0
+            self._vecs[row] = v
+            self._keys[row] = np.frombuffer(bytes.fromhex(k), dtype="uint8")
+            self._entries[k] = (row, time.time(), int(tokens))
+            self._dirty += 1
+            if self.persist_dir and self._dirty >= self.FLUSH_EVERY:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    # -------- persistence --------
+    def _paths(self) -> Tuple[str, str, str]:
+        return (
+            os.path.join(self.persist_dir, "embeddings.f32"),
+            os.path.join(self.persist_dir, "embeddings.json"),
+            os.path.join(self.persist_dir, "embeddings.keys"),
+        )
+
+    def _allocate(self, dim: int) -> None:
+        self._dim = int(dim)
+        if self.persist_dir:
+            os.makedirs(self.persist_dir, exist_ok=True)
+            vec_path, _, key_path = self._paths()
+            self._vecs = np.memmap(vec_path, dtype="float32", mode="w+", shape=(self.max_entries, self._dim))
+            self._keys = np.memmap(key_path, dtype="uint8", mode="w+", shape=(self.max_entries, 20))
+        else:
+            self._vecs = np.zeros((self.max_entries, self._dim), dtype="float32")
+            self._keys = np.zeros((self.max_entries, 20), dtype="uint8")
+
+    def _load(self) -> None:
+        vec_path, idx_path, key_path = self._paths()
+        if not all(os.path.exists(p) for p in (vec_path, idx_path, key_path)):
+            return
+        try:
+            with open(idx_path, "r", encoding="utf-8") as f:
+                idx = json.load(f)
+            dim, cap = int(idx["dim"]), int(idx["capacity"])
+            if cap != self.max_entries:
+                return  # resized: start fresh rather than remapping rows
+            self._vecs = np.memmap(vec_path, dtype="float32", mode="r+", shape=(cap, dim))
+            self._keys = np.memmap(key_path, dtype="uint8", mode="r+", shape=(cap, 20))
+            self._dim = dim
+            used = set()
+            for k, row, created, tokens in idx.get("entries", []):
+                self._entries[k] = (int(row), float(created), int(tokens))
+                used.add(int(row))
+            top = max(used) + 1 if used else 0
+            self._free = [r for r in range(top) if r not in used]
+        except Exception as e:
+            print(f"[embed-cache] ignoring unreadable cache at {self.persist_dir}: {e}", flush=True)
+            self._entries.clear()
+            self._free = []
+            self._vecs = None
+            self._keys = None
+            self._dim = 0
+
+    def _flush_locked(self) -> None:
+        if not self.persist_dir or self._vecs is None or not self._dirty:
+            return
+        _, idx_path, _ = self._paths()
+        if isinstance(self._vecs, np.memmap):
+            self._vecs.flush()
+            self._keys.flush()
+        idx = {
+            "dim": self._dim,
+            "capacity": self.max_entries,
+            "entries": [[k, row, created, tokens] for k, (row, created, tokens) in self._entries.items()],
+        }
+        tmp = idx_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(idx, f)
+        os.replace(tmp, idx_path)
+        self._dirty = 0
+
+
+class ClassifierCache:
+    """Recent classifier results, reusable while an utterance only grows.
+
+    With `prefix_match`, a lookup hits when the cached text is a word-level prefix of
+    the new text and the new text adds at most `max_growth_words`. Without it, only exact normalized
+    matches hit, which is what the cross-session cache uses.
+    """
+
+    MIN_PREFIX_WORDS = 3
+
+    def __init__(self, max_entries: int = 8, max_growth_words: int = 4, ttl_s: float = 600.0, prefix_match: bool = True):
+        self.max_entries = max(0, int(max_entries))
+        self.max_growth_words = int(max_growth_words)
+        self.ttl_s = float(ttl_s)
+        self.prefix_match = prefix_match
+        self._lock = threading.Lock()
+        # normalized text -> (created_at, result); order is LRU (oldest first)
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _matches(self, words: list, cached: list) -> bool:
+        return grown_from(words, cached, self.max_growth_words, min_prefix=self.MIN_PREFIX_WORDS)
+
+    def lookup(self, text: str) -> Optional[dict]:
+        if not self.max_entries:
+            return None
+        norm = normalize_text(text)
+        now = time.time()
+        with self._lock:
+            ent = self._entries.get(norm)
+            if ent is not None and (self.ttl_s <= 0 or now - ent[0] <= self.ttl_s):
+                self._entries.move_to_end(norm)
+                return ent[1]
+            if not self.prefix_match:
+                return None
+            words = norm.split()
+            for key in reversed(self._entries):
+                created, result = self._entries[key]
+                if self.ttl_s > 0 and now - created > self.ttl_s:
+                    continue
+                if self._matches(words, key.split()):
+                    return result
+        return None
+
+    def store(self, text: str, result: dict) -> None:
+        if not self.max_entries:
+            return
+        norm = normalize_text(text)
+        with self._lock:
+            self._entries.pop(norm, None)
+            self._entries[norm] = (time.time(), result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,141 @@
+# app/corpora.py
+"""Per-user corpora: one FAISS store per corpus id, loaded on demand and cached.
+
+A corpus `alice` is a store directory `CORPORA_DIR/alice` built with
+`python scripts/build_index.py --data-dir data/alice --out-dir store/corpora/alice`.
+"""
+from __future__ import annotations
+
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Dict, Optional, Tuple
+
+from app.retriever import Retriever
+
+CORPUS_ID_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_-]{0,63}$")
+
+
+def valid_corpus_id(corpus: str) -> str:
+    """Return `corpus` if it is a safe directory name, else raise ValueError."""
+    if not isinstance(corpus, str) or not CORPUS_ID_RE.match(corpus):
+        raise ValueError("corpus must be 1-64 letters, digits, '_' or '-'")
+    return corpus
+
+
+def retriever_bytes(r: Retriever) -> int:
+    """Approximate resident size: the index is read fully into memory; binary metadata
+    is memory-mapped (page cache, not counted) while JSON metadata is a list of dicts;
+    the BM25 index holds every posting list as arrays."""
+    total = r.bm25.nbytes() if r.bm25 is not None else 0
+    idx_path = os.path.join(r.store_dir, "index.faiss")
+    if os.path.exists(idx_path):
+        total += os.path.getsize(idx_path)
+    if isinstance(r.meta, list):
+        meta_path = os.path.join(r.store_dir, "meta.json")
+        if os.path.exists(meta_path):
+            total += 3 * os.path.getsize(meta_path)
+    return total
+
+
+class CorpusCache:
+    """Loaded Retrievers keyed by corpus id, LRU-evicted by approximate memory footprint.
+
+    Concurrent lookups of a corpus that is still loading wait for the one load. An
+    evicted Retriever stays valid for searches that already hold it. A corpus whose
+    `index.faiss` changed on disk is reloaded on its next lookup. A failed load is
+    remembered the same way, so a broken store is retried only once it is rebuilt.
+    """
+
+    def __init__(self, root: str, *, max_bytes: int = 512 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # corpus -> (retriever, bytes, index mtime); order is LRU (oldest first)
+        self._entries: "OrderedDict[str, Tuple[Retriever, int, int]]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        # corpus -> index mtime of the last failed load
+        self._failed: Dict[str, int] = {}
+        self.loads = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls) -> "CorpusCache":
+        return cls(
+            os.getenv("CORPORA_DIR", os.path.join("store", "corpora")),
+            max_bytes=int(float(os.getenv("CORPORA_CACHE_MB", "512")) * 1024 * 1024),
+        )
+
+    def path(self, corpus: str) -> str:
+        return os.path.join(self.root, valid_corpus_id(corpus))
+
+    def _mtime(self, corpus: str) -> int:
+        try:
+            return os.stat(os.path.join(self.path(corpus), "index.faiss")).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self, corpus: str) -> Optional[Retriever]:
+        """The corpus's Retriever, loading it if needed; None if it has no built store."""
+        mtime = self._mtime(corpus)
+        if not mtime:
+            return None
+        with self._lock:
+            ent = self._entries.get(corpus)
+            if ent is not None and ent[2] == mtime:
+                self._entries.move_to_end(corpus)
+                return ent[0]
+            if self._failed.get(corpus) == mtime:
+                return None
+            fut = self._loading.get(corpus)
+            owner = fut is None
+            if owner:
+                fut = self._loading[corpus] = Future()
+        if not owner:
+            return fut.result()
+
+        try:
+            r = Retriever(self.path(corpus)).load()
+        except Exception as e:
+            print(f"[corpora] error loading {corpus}:", e, file=sys.stderr, flush=True)
+            r = None
+        with self._lock:
+            self._loading.pop(corpus, None)
+            if r is None:
+                self._failed[corpus] = mtime
+            else:
+                self._failed.pop(corpus, None)
+                self._entries.pop(corpus, None)
+                self._entries[corpus] = (r, retriever_bytes(r), mtime)
+                self.loads += 1
+                self._evict_locked(keep=corpus)
+        fut.set_result(r)
+        return r
+
+    def _evict_locked(self, *, keep: str) -> None:
+        total = sum(b for _, b, _ in self._entries.values())
+        for corpus in list(self._entries):
+            if total <= self.max_bytes:
+                break
+            if corpus == keep:
+                continue
+            _, size, _ = self._entries.pop(corpus)
+            total -= size
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = [(c, b) for c, (_, b, _) in self._entries.items()]
+            failed = sorted(self._failed)
+        return {
+            "root": self.root,
+            "loaded": [{"corpus": c, "bytes": b} for c, b in items],
+            "failed": failed,
+            "bytes_total": sum(b for _, b in items),
+            "max_bytes": self.max_bytes,
+            "loads_total": self.loads,
+            "evicted_total": self.evicted,
+        }
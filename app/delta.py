@@ -0,0 +1,111 @@
+# app/delta.py
+"""Delta-encoded emit frames for `/ws?proto=delta`.
+
+The long-lived parts of an emit, `usage` and the notes, form a per-session document.
+Each emit frame bumps the document version `v` and carries either a full `snapshot`
+or a JSON merge patch (RFC 7386) `patch` against version `base`, the last version the
+client acknowledged with `{"ack": v, "session_id": ...}`. The rest of the payload
+(transcript, coach output) is per turn and sent as before.
+
+Merge patches use null to delete a key, so a key whose value becomes null is
+dropped on the client rather than set to null.
+"""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict
+
+
+def merge_diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Smallest merge patch turning `old` into `new` (dicts recurse, anything else is replaced)."""
+    patch: Dict[str, Any] = {}
+    for k, v in new.items():
+        if k not in old:
+            patch[k] = v
+        elif isinstance(v, dict) and isinstance(old[k], dict):
+            sub = merge_diff(old[k], v)
+            if sub:
+                patch[k] = sub
+        elif old[k] != v:
+            patch[k] = v
+    for k in old:
+        if k not in new:
+            patch[k] = None
+    return patch
+
+
+def apply_merge_patch(doc: Any, patch: Any) -> Any:
+    if not isinstance(patch, dict):
+        return patch
+    out = dict(doc) if isinstance(doc, dict) else {}
+    for k, v in patch.items():
+        if v is None:
+            out.pop(k, None)
+        else:
+            out[k] = apply_merge_patch(out.get(k), v)
+    return out
+
+
+@dataclass
+class _Stream:
+    version: int = 0
+    acked: int = 0  # 0: the client holds no document, send a snapshot
+    last_snapshot: int = 0
+    latest: Dict[str, Any] = field(default_factory=dict)
+    history: Dict[int, Dict[str, Any]] = field(default_factory=dict)  # sent, not yet superseded by an ack
+
+
+class DeltaEncoder:
+    """Per-connection encoder. A snapshot is sent every `snapshot_every` versions, and
+    whenever the client has no acknowledged version or is more than `max_unacked` behind."""
+
+    def __init__(self, *, snapshot_every: int = 20, max_unacked: int = 8):
+        self.snapshot_every = max(1, snapshot_every)
+        self.max_unacked = max(1, max_unacked)
+        self._streams: Dict[str, _Stream] = {}
+
+    def encode(self, session_id: str, frame: Dict[str, Any]) -> Dict[str, Any]:
+        data = frame.get("data")
+        if not frame.get("emit") or not isinstance(data, dict):
+            return frame
+        s = self._streams.setdefault(session_id, _Stream())
+        data = dict(data)
+        doc = dict(s.latest)  # keys absent from this emit (e.g. notes in coach mode) carry over
+        if "usage" in data:
+            doc["usage"] = data.pop("usage")
+        if isinstance(data.get("notes_final"), dict):
+            doc["notes"] = data.pop("notes_final").get("notes")
+        # Detach from the live session state (and normalize tuples etc. as JSON would).
+        doc = json.loads(json.dumps(doc, default=list))
+
+        v = s.version + 1
+        base = s.history.get(s.acked)
+        out = {k: val for k, val in frame.items() if k != "data"}
+        out["data"] = data
+        out["v"] = v
+        if base is None or v - s.last_snapshot >= self.snapshot_every or v - s.acked > self.max_unacked:
+            out["snapshot"] = doc
+            s.last_snapshot = v
+        else:
+            out["base"] = s.acked
+            out["patch"] = merge_diff(base, doc)
+        s.version, s.latest = v, doc
+        s.history[v] = doc
+        for old in [k for k in s.history if k < v - self.max_unacked and k != s.acked]:
+            del s.history[old]
+        return out
+
+    def ack(self, session_id: str, version: int) -> None:
+        s = self._streams.get(session_id)
+        if s is None or version not in s.history or version <= s.acked:
+            return
+        s.acked = version
+        for old in [k for k in s.history if k < version]:
+            del s.history[old]
+
+    def resync(self, session_id: str) -> None:
+        """The client lost its document: the next frame for the session is a snapshot."""
+        s = self._streams.get(session_id)
+        if s is not None:
+            s.acked = 0
@@ -0,0 +1,138 @@
+# app/embeddings.py
+"""Embedding backends shared by query-time retrieval and scripts/build_index.py.
+
+EMBED_BACKEND selects one:
+  openai  text-embedding-3-small over the API (default)
+  hash    hashed unigrams/bigrams on the CPU; no network, no extra dependencies
+  st      a sentence-transformers model (pip install sentence-transformers),
+          EMBED_LOCAL_MODEL, default all-MiniLM-L6-v2
+
+A store records the backend's `name` and `dim` in index_info.json; queries are only
+embedded against a store built with the same backend.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+try:
+    from openai import OpenAI
+except Exception:  # pragma: no cover
+    OpenAI = None  # type: ignore[assignment]
+
+
+class EmbeddingBackend:
+    name: str = ""
+    remote: bool = False  # network calls that are billed and worth caching
+
+    @property
+    def dim(self) -> int:
+        raise NotImplementedError
+
+    def embed(self, texts: List[str]) -> Tuple[np.ndarray, int]:
+        """Embed a batch; returns (float32 (n, dim) matrix, billed prompt tokens)."""
+        raise NotImplementedError
+
+    def warm_up(self) -> None:
+        """Load models / allocate buffers ahead of the first turn."""
+
+
+class OpenAIBackend(EmbeddingBackend):
+    remote = True
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: int = 1536):
+        self.name = model
+        self._dim = dim
+        self._client: Optional[OpenAI] = None
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def client(self) -> OpenAI:
+        if self._client is None:
+            if OpenAI is None:
+                raise RuntimeError("openai package is not installed. Run: pip install -r requirements.txt")
+            self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        return self._client
+
+    def embed(self, texts: List[str]) -> Tuple[np.ndarray, int]:
+        rsp = self.client().embeddings.create(model=self.name, input=texts)
+        u = getattr(rsp, "usage", None)
+        tokens = int(getattr(u, "prompt_tokens", getattr(u, "total_tokens", 0)) or 0) if u is not None else 0
+        return np.array([d.embedding for d in rsp.data], dtype="float32"), tokens
+
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+class HashingBackend(EmbeddingBackend):
+    """Signed feature hashing of unigrams and bigrams, L2-normalized. Deterministic."""
+
+    def __init__(self, dim: int = 256):
+        self._dim = int(dim)
+        self.name = f"local-hash-{self._dim}"
+
+    @property
+    def dim(self) -> int:
+        return self._dim
+
+    def embed(self, texts: List[str]) -> Tuple[np.ndarray, int]:
+        out = np.zeros((len(texts), self._dim), dtype="float32")
+        for r, t in enumerate(texts):
+            toks = _TOKEN.findall((t or "").lower())
+            for feat in toks + [a + " " + b for a, b in zip(toks, toks[1:])]:
+                h = int.from_bytes(hashlib.blake2b(feat.encode("utf-8"), digest_size=8).digest(), "little")
+                out[r, h % self._dim] += 1.0 if (h >> 63) & 1 else -1.0
+            norm = np.linalg.norm(out[r])
+            if norm > 0:
+                out[r] /= norm
+        return out, 0
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    def __init__(self, model: str = "all-MiniLM-L6-v2", batch_size: int = 64):
+        self.model_name = model
+        self.name = f"st:{model}"
+        self.batch_size = batch_size
+        self._model = None
+
+    def _load(self):
+        if self._model is None:
+            try:
+                from sentence_transformers import SentenceTransformer  # type: ignore
+            except Exception as e:
+                raise RuntimeError(
+                    "EMBED_BACKEND=st needs sentence-transformers. Run: pip install sentence-transformers"
+                ) from e
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model
+
+    @property
+    def dim(self) -> int:
+        return int(self._load().get_sentence_embedding_dimension())
+
+    def embed(self, texts: List[str]) -> Tuple[np.ndarray, int]:
+        vecs = self._load().encode(
+            list(texts), batch_size=self.batch_size, normalize_embeddings=True, show_progress_bar=False
+        )
+        return np.asarray(vecs, dtype="float32"), 0
+
+    def warm_up(self) -> None:
+        self.embed(["warm up"])
+
+
+def make_backend(kind: Optional[str] = None) -> EmbeddingBackend:
+    """Backend named by `kind` or EMBED_BACKEND ("local" is accepted for "hash")."""
+    kind = (kind or os.getenv("EMBED_BACKEND", "openai")).lower()
+    if kind == "openai":
+        return OpenAIBackend()
+    if kind in ("hash", "local"):
+        return HashingBackend(dim=int(os.getenv("EMBED_HASH_DIM", "256")))
+    if kind in ("st", "sentence-transformers"):
+        return SentenceTransformerBackend(os.getenv("EMBED_LOCAL_MODEL", "all-MiniLM-L6-v2"))
+    raise ValueError(f"unknown EMBED_BACKEND {kind!r}: use openai, hash or st")
@@ -0,0 +1,121 @@
+# app/metastore.py
+"""Chunk metadata as a fixed-width offset table plus a UTF-8 text blob.
+
+`meta.idx` holds a 16-byte header (magic, row count) followed by one record per
+chunk: its FAISS id, the byte offset into `meta.bin` and the lengths of its id,
+source and text, stored back to back. Rows are sorted by FAISS id. Both files
+are memory-mapped, so loading is O(1) and a chunk is decoded only when a search
+returns it.
+"""
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+IDX_FILE = "meta.idx"
+BIN_FILE = "meta.bin"
+MAGIC = b"AAMETA2\x00"
+HEADER_BYTES = 16
+
+ROW_DTYPE = np.dtype([
+    ("faiss_id", "<i8"),
+    ("offset", "<u8"),
+    ("id_len", "<u4"),
+    ("source_len", "<u4"),
+    ("text_len", "<u4"),
+    ("_pad", "<u4"),
+])
+
+
+def write_meta_store(out_dir: str, docs: Iterable[Dict[str, Any]]) -> int:
+    """Write `docs` ({"id", "text", "source", optional "faiss_id"}); returns the row count.
+
+    Without "faiss_id" a doc's id is its position, matching an index built without ids.
+    """
+    docs = [dict(d, faiss_id=d.get("faiss_id", i)) for i, d in enumerate(docs)]
+    docs.sort(key=lambda d: d["faiss_id"])
+    rows = []
+    tmp_bin = os.path.join(out_dir, BIN_FILE + ".tmp")
+    offset = 0
+    with open(tmp_bin, "wb") as blob:
+        for d in docs:
+            parts = [str(d.get(k) or "").encode("utf-8") for k in ("id", "source", "text")]
+            for p in parts:
+                blob.write(p)
+            rows.append((int(d["faiss_id"]), offset, len(parts[0]), len(parts[1]), len(parts[2]), 0))
+            offset += sum(len(p) for p in parts)
+    table = np.array(rows, dtype=ROW_DTYPE)
+    tmp_idx = os.path.join(out_dir, IDX_FILE + ".tmp")
+    with open(tmp_idx, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(len(rows)).tobytes())
+        f.write(table.tobytes())
+    os.replace(tmp_bin, os.path.join(out_dir, BIN_FILE))
+    os.replace(tmp_idx, os.path.join(out_dir, IDX_FILE))
+    return len(rows)
+
+
+def has_meta_store(store_dir: str) -> bool:
+    return all(os.path.exists(os.path.join(store_dir, f)) for f in (IDX_FILE, BIN_FILE))
+
+
+class MetaStore:
+    """Read-only, memory-mapped view of a metadata store.
+
+    Indexing by row returns the same dict shape as an entry of the legacy `meta.json`
+    list. Search results carry FAISS ids; `row_of` maps them to rows.
+    """
+
+    def __init__(self, store_dir: str):
+        idx_path = os.path.join(store_dir, IDX_FILE)
+        with open(idx_path, "rb") as f:
+            header = f.read(HEADER_BYTES)
+        if len(header) != HEADER_BYTES or header[:8] != MAGIC:
+            raise ValueError(f"{idx_path} is not a metadata store")
+        n = int(np.frombuffer(header[8:], dtype="<u8")[0])
+        self._rows = (
+            np.memmap(idx_path, dtype=ROW_DTYPE, mode="r", offset=HEADER_BYTES, shape=(n,))
+            if n else np.zeros(0, dtype=ROW_DTYPE)
+        )
+        fids = np.asarray(self._rows["faiss_id"])
+        self._identity = bool(n == 0 or (fids[0] == 0 and fids[-1] == n - 1))
+        bin_path = os.path.join(store_dir, BIN_FILE)
+        self._blob = (
+            np.memmap(bin_path, dtype=np.uint8, mode="r")
+            if os.path.getsize(bin_path) else np.zeros(0, dtype=np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return int(self._rows.shape[0])
+
+    def _field(self, start: int, length: int) -> str:
+        return bytes(self._blob[start:start + length]).decode("utf-8")
+
+    def row_of(self, faiss_id: int) -> int:
+        """Row holding `faiss_id`, or -1 if it is not in the store."""
+        n = len(self)
+        if self._identity:
+            return int(faiss_id) if 0 <= faiss_id < n else -1
+        r = int(np.searchsorted(self._rows["faiss_id"], faiss_id))
+        return r if r < n and int(self._rows[r]["faiss_id"]) == faiss_id else -1
+
+    def id(self, i: int) -> str:
+        r = self._rows[i]
+        return self._field(int(r["offset"]), int(r["id_len"]))
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        if not -len(self) <= i < len(self):
+            raise IndexError(i)
+        r = self._rows[i]
+        off, n_id, n_src = int(r["offset"]), int(r["id_len"]), int(r["source_len"])
+        return {
+            "id": self._field(off, n_id),
+            "source": self._field(off + n_id, n_src) or None,
+            "text": self._field(off + n_id + n_src, int(r["text_len"])),
+            "faiss_id": int(r["faiss_id"]),
+        }
+
+    def ids(self, rows: Iterable[int]) -> List[str]:
+        return [self.id(int(i)) for i in rows]
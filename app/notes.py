@@ -0,0 +1,137 @@
+# app/notes.py
+"""Heuristic meeting notes: one compiled matcher over a rule table, bounded sections.
+
+Every cue of every rule goes into a single regex that is run once per turn. The
+list sections of `state.notes` are deques with a maxlen, so appending never
+re-slices. Extraction rules can be added to the table without another scan per turn.
+"""
+from __future__ import annotations
+
+import re
+from collections import deque
+from dataclasses import dataclass
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Stored length of each list section; the oldest entries fall off.
+SECTION_LIMITS: Dict[str, int] = {
+    "bullets": 60,
+    "action_items": 30,
+    "decisions": 20,
+    "follow_ups": 30,
+    "topics": 80,
+    "open_questions": 15,
+}
+DEFAULT_SECTION_LIMIT = 30
+
+
+@dataclass(frozen=True)
+class Rule:
+    """Cues (case-insensitive substrings) that send a turn to a notes section.
+
+    Rules with `tag` set label the turn's topic instead; the first matching tag rule in
+    table order wins.
+    """
+    section: str
+    cues: Sequence[str]
+    tag: Optional[str] = None
+
+
+DEFAULT_RULES: List[Rule] = [
+    Rule("decisions", ("we decided", "decision:", "let's go with", "we will proceed with")),
+    Rule("action_items", ("action item", "todo", "we need to", "we should", "i will", "i'll")),
+    Rule("follow_ups", ("follow up", "follow-up")),
+    Rule("open_questions", ("?",)),
+    Rule("topics", ("deadline", "date", "next week", "q", "quarter"), tag="timing"),
+    Rule("topics", ("metric", "kpi", "impact", "result", "%", "percent"), tag="impact"),
+    Rule("topics", ("roadmap", "plan", "strategy"), tag="planning"),
+]
+
+
+def new_notes() -> Dict[str, Any]:
+    notes: Dict[str, Any] = {k: deque(maxlen=n) for k, n in SECTION_LIMITS.items()}
+    notes.update(summary_so_far=None, current_topic=None)
+    return notes
+
+
+def ensure_sections(notes: Dict[str, Any]) -> Dict[str, Any]:
+    """Turn list sections (e.g. from a JSON-decoded session) back into bounded deques."""
+    for k, v in list(notes.items()):
+        if isinstance(v, list) or (k in SECTION_LIMITS and not isinstance(v, deque)):
+            set_section(notes, k, v or [])
+    for k, n in SECTION_LIMITS.items():
+        if k not in notes:
+            notes[k] = deque(maxlen=n)
+    return notes
+
+
+def set_section(notes: Dict[str, Any], name: str, items: Iterable[Any]) -> None:
+    notes[name] = deque(items, maxlen=SECTION_LIMITS.get(name, DEFAULT_SECTION_LIMIT))
+
+
+def tail(section: Optional[Iterable[Any]], n: int) -> List[Any]:
+    """Last `n` items of a section as a list."""
+    if not section:
+        return []
+    if isinstance(section, deque):
+        skip = max(0, len(section) - n)
+        return list(islice(section, skip, None))
+    return list(section)[-n:]
+
+
+def snapshot(notes: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-ready copy: deques become lists."""
+    return {k: list(v) if isinstance(v, deque) else v for k, v in notes.items()}
+
+
+class NotesEngine:
+    def __init__(self, rules: Sequence[Rule] = DEFAULT_RULES):
+        self.rules = list(rules)
+        cue_rules: Dict[str, List[int]] = {}
+        for i, r in enumerate(self.rules):
+            for cue in r.cues:
+                cue_rules.setdefault(cue.lower(), []).append(i)
+        # At each position the regex reports only the longest cue; the shorter cues that
+        # match there are its prefixes, so each cue also carries their rules.
+        self._cue_rules = {
+            cue: sorted({i for other, rules in cue_rules.items() if cue.startswith(other) for i in rules})
+            for cue in cue_rules
+        }
+        # Longest cues first so overlapping cues at one position resolve to the longer one;
+        # the lookahead lets matches overlap, so every cue occurrence is seen in one pass.
+        alts = "|".join(re.escape(c) for c in sorted(cue_rules, key=len, reverse=True))
+        self._pattern = re.compile(f"(?=({alts}))") if alts else None
+
+    def matched_rules(self, text: str) -> List[int]:
+        """Indexes of rules with at least one cue in `text`, in table order."""
+        if self._pattern is None:
+            return []
+        hit = set()
+        for m in self._pattern.finditer(text.lower()):
+            hit.update(self._cue_rules[m.group(1)])
+        return sorted(hit)
+
+    def update(self, notes: Dict[str, Any], *, speaker: str, text: str, intent: str = "unknown") -> Optional[str]:
+        """Record one turn; returns its bullet (None for empty text)."""
+        t = (text or "").strip()
+        if not t:
+            return None
+        bullet = f"{speaker}: {t}"
+        notes["bullets"].append(bullet)
+        tag = "other"
+        for i in self.matched_rules(t):
+            rule = self.rules[i]
+            if rule.tag is not None:
+                if tag == "other":
+                    tag = rule.tag
+                continue
+            section = notes.get(rule.section)
+            if section is None:
+                section = notes[rule.section] = deque(
+                    maxlen=SECTION_LIMITS.get(rule.section, DEFAULT_SECTION_LIMIT)
+                )
+            section.append(bullet)
+        # Extremely lightweight topic labeling: intent plus a coarse tag.
+        notes["topics"].append({"intent": intent, "tag": tag})
+        notes["current_topic"] = tag
+        return bullet
@@ -1,11 +1,48 @@
 from __future__ import annotations
 
+import asyncio
+import functools
 import hashlib
+import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 
-from .agent import AgentState, process_turn, EndOfThought
+from .agent import AgentState, process_turn, prefetch, EndOfThought, TurnCancelled
+from .schemas import DeltaIn
+from .sessions import SessionConflict
+
+
+# Turn processing makes blocking OpenAI calls (classifier, embeddings, drafter).
+# Async entry points run it on this bounded pool so the event loop stays free.
+TURN_WORKERS = int(os.getenv("TURN_WORKERS", "8"))
+_TURN_POOL = ThreadPoolExecutor(max_workers=TURN_WORKERS, thread_name_prefix="turn")
+
+
+# One end-of-thought detector shared by /ingest and /ws.
+DETECTOR = EndOfThought(
+    pause_ms=int(os.getenv("EOT_PAUSE_MS", "900")),
+    stable_n=2,
+    min_words=int(os.getenv("EOT_MIN_WORDS", "10")),
+    max_words=int(os.getenv("EOT_MAX_WORDS", "60")),
+)
+
+# Turn history kept per session; older turns are dropped (notes/usage keep the aggregates).
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", "200"))
+
+
+# Session-wide parts of a turn's payload; the session already holds them once.
+_SESSION_KEYS = ("usage", "notes_final")
+
+
+def _record_turn(st: AgentState, out: Optional[Dict[str, Any]]) -> None:
+    if out is not None:
+        out = {k: v for k, v in out.items() if k not in _SESSION_KEYS}
+    st.turns.append({"speaker": getattr(st, "buffer_speaker", None), "user": st.buffer_text, "assistant": out})
+    if len(st.turns) > SESSION_MAX_TURNS:
+        del st.turns[: len(st.turns) - SESSION_MAX_TURNS]
 
 
 def _h(s: str) -> str:
@@ -58,13 +95,14 @@ def maybe_emit(
     *,
     final: bool,
     detector: EndOfThought,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancel: Optional[threading.Event] = None,
 ) -> IngestResult:
+    """`cancel` applies to detector-driven (speculative) turns only; finals always complete."""
     # If we deferred because speaker changed, flush current buffer now.
     if getattr(st, "pending_speaker_flush", False) and st.buffer_text.strip():
-        out = process_turn(st, kind="final")
-        st.turns.append(
-            {"speaker": getattr(st, "buffer_speaker", None), "user": st.buffer_text, "assistant": out}
-        )
+        out = process_turn(st, kind="final", on_partial=on_partial)
+        _record_turn(st, out)
         st.buffer_text = ""
         st.last_emit_ts = time.time()
         st.pending_speaker_flush = False
@@ -94,8 +132,8 @@ def maybe_emit(
             return IngestResult(emit=False, kind="none", reason="duplicate_final")
         st.last_final_hash = h
 
-        out = process_turn(st, kind="final")
-        st.turns.append({"speaker": getattr(st, "buffer_speaker", None), "user": st.buffer_text, "assistant": out})
+        out = process_turn(st, kind="final", on_partial=on_partial)
+        _record_turn(st, out)
         st.buffer_text = ""
         st.last_emit_ts = time.time()
         return IngestResult(emit=True, data=out, kind="final", reason="final")
@@ -103,11 +141,139 @@ def maybe_emit(
     # Otherwise gate on end-of-thought detector
     if detector.should_emit(st):
         # Treat detector-driven emits as speculative by default: fast, lightweight suggestions.
-        out = process_turn(st, kind="speculative")
-        st.turns.append({"speaker": getattr(st, "buffer_speaker", None), "user": st.buffer_text, "assistant": out})
+        try:
+            out = process_turn(st, kind="speculative", cancel=cancel)
+        except TurnCancelled:
+            # Newer text arrived while this turn ran; leave the buffer for the next frame.
+            return IngestResult(emit=False, kind="none", reason="superseded")
+        _record_turn(st, out)
         st.buffer_text = ""
         st.last_emit_ts = time.time()
         return IngestResult(emit=True, data=out, kind="speculative", reason="eot")
 
+    # Nothing to emit yet: let the (opt-in) prefetcher get ahead of the next emit.
+    prefetch(st, min_words=detector.min_words)
     return IngestResult(emit=False, kind="none", reason="no_emit")
 
+
+
+def emit_response(st: AgentState, res: IngestResult) -> Dict[str, Any]:
+    """Response body shared by /ingest and /ws."""
+    if not res.emit:
+        return {"emit": False, "kind": res.kind, "reason": res.reason}
+    out = dict(res.data) if res.data else {}
+    out["created_at"] = getattr(st, "created_at", None)
+    out["last_seen_at"] = getattr(st, "last_seen_at", None)
+    if out.get("usage") is not None and isinstance(out["usage"], dict):
+        out["usage"]["created_at"] = out["created_at"]
+        out["usage"]["last_seen_at"] = out["last_seen_at"]
+    return {"emit": True, "kind": res.kind, "data": out, "reason": res.reason}
+
+
+def turn_lock(st: AgentState) -> asyncio.Lock:
+    """Per-session lock so two connections never run turns on one state concurrently."""
+    if st.turn_lock is None:
+        st.turn_lock = asyncio.Lock()
+    return st.turn_lock
+
+
+# A save that loses to another worker's write reloads the session and redoes the change.
+SAVE_ATTEMPTS = 3
+T = TypeVar("T")
+
+
+async def run_locked(
+    st: AgentState,
+    body: Callable[[], Awaitable[T]],
+    *,
+    store: Any = None,
+    save_if: Optional[Callable[[T], bool]] = None,
+) -> T:
+    """Run `body()` under the session's turn lock on its latest stored data, then save it.
+
+    turn_lock only covers this process. With a shared store (SQLite) the session is
+    refreshed first, and if the save still races another worker (SessionConflict) it is
+    refreshed again and `body` runs again. `save_if(result)` False skips the save, for
+    frames that changed nothing worth persisting. Store I/O runs off the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    async with turn_lock(st):
+        for attempt in range(SAVE_ATTEMPTS):
+            if store is not None and store.shared:
+                await loop.run_in_executor(None, store.refresh, st)
+            result = await body()
+            if store is None or (save_if is not None and not save_if(result)):
+                return result
+            try:
+                await loop.run_in_executor(None, store.save, st)
+                return result
+            except SessionConflict:
+                if attempt == SAVE_ATTEMPTS - 1:
+                    raise
+                print(f"[sessions] sid={st.session_id} was saved by another worker; retrying", flush=True)
+
+
+async def maybe_emit_async(
+    st: AgentState,
+    *,
+    final: bool,
+    detector: EndOfThought,
+    on_partial: Optional[Callable[[Dict[str, Any]], None]] = None,
+    cancel: Optional[threading.Event] = None,
+) -> IngestResult:
+    """Same as maybe_emit, but runs on the turn pool instead of blocking the event loop.
+
+    `on_partial` is called from the worker thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _TURN_POOL,
+        functools.partial(
+            maybe_emit, st, final=final, detector=detector, on_partial=on_partial, cancel=cancel
+        ),
+    )
+
+
+def _is_replace(f: DeltaIn) -> bool:
+    return (f.mode or "append") == "replace"
+
+
+def _mergeable(prev: DeltaIn, f: DeltaIn) -> bool:
+    if prev.session_id != f.session_id or prev.final:
+        return False
+    # Never merge across a speaker change: it has flush semantics of its own.
+    return not (prev.speaker and f.speaker and prev.speaker != f.speaker)
+
+
+def _merge(prev: DeltaIn, f: DeltaIn) -> DeltaIn:
+    common = {
+        "speaker": f.speaker or prev.speaker,
+        "session_mode": f.session_mode or prev.session_mode,
+        "corpus": f.corpus or prev.corpus,
+    }
+    if _is_replace(f):
+        # A replace carries the full utterance: everything pending before it is superseded.
+        return f.model_copy(update=common)
+    delta = (f.text_delta if f.text_delta is not None else (f.text or "")).strip()
+    if _is_replace(prev):
+        text = " ".join(p for p in ((prev.text or "").strip(), delta) if p)
+        return prev.model_copy(update={**common, "text": text, "final": f.final, "ts": f.ts})
+    before = (prev.text_delta if prev.text_delta is not None else (prev.text or "")).strip()
+    text_delta = " ".join(p for p in (before, delta) if p)
+    return prev.model_copy(update={**common, "text_delta": text_delta, "text": None, "final": f.final, "ts": f.ts})
+
+
+def coalesce(frames: List[DeltaIn]) -> List[DeltaIn]:
+    """Collapse queued frames so each pending run for a session is handled once.
+
+    Consecutive frames for the same session and speaker merge: append deltas are
+    concatenated, a replace drops everything pending before it, and a final frame
+    closes the run.
+    """
+    out: List[DeltaIn] = []
+    for f in frames:
+        if out and _mergeable(out[-1], f):
+            out[-1] = _merge(out[-1], f)
+        else:
+            out.append(f)
+    return out
@@ -0,0 +1,45 @@
+# app/planner.py
+"""Which model-call stages a turn needs, by (mode, kind).
+
+process_turn runs only the planned stages. usage.turn.skipped_stages lists the stages
+that did not run, which can differ from the plan (e.g. a lexical-only retrieval still
+embeds when the store has no keyword index). Notes turns need neither the classifier nor retrieval:
+their notes come from the heuristic engine and the background refiner.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Tuple
+
+STAGES = ("classify", "embed", "retrieve", "draft", "notes_refine")
+
+# The stages a (mode, kind) turn uses when every feature is on; plan_turn applies the flags.
+PLANS: Dict[Tuple[str, str], FrozenSet[str]] = {
+    ("coach", "final"): frozenset({"classify", "embed", "retrieve", "draft"}),
+    ("coach", "speculative"): frozenset({"classify", "embed", "retrieve"}),
+    ("notes", "final"): frozenset({"notes_refine"}),
+    ("notes", "speculative"): frozenset(),
+}
+
+
+@dataclass(frozen=True)
+class Plan:
+    stages: FrozenSet[str]
+
+    def needs(self, stage: str) -> bool:
+        return stage in self.stages
+
+    def skipped(self) -> List[str]:
+        return [s for s in STAGES if s not in self.stages]
+
+
+def plan_turn(mode: str, kind: str, *, lexical_speculative: bool = False, refine_notes: bool = False) -> Plan:
+    """`lexical_speculative`: speculative retrieval is keyword-only, so no embedding.
+    `refine_notes`: the LLM notes refiner is on (USE_OAI_NOTES)."""
+    key = (mode, kind) if (mode, kind) in PLANS else ("coach", kind)
+    stages = set(PLANS.get(key, STAGES))
+    if kind == "speculative" and lexical_speculative:
+        stages.discard("embed")
+    if not refine_notes:
+        stages.discard("notes_refine")
+    return Plan(frozenset(stages))
@@ -0,0 +1,152 @@
+# app/refiner.py
+"""Background LLM notes refinement (USE_OAI_NOTES), debounced per session.
+
+A final turn emits its heuristic notes right away and only schedules a refinement.
+Once the session has been quiet for `debounce_s` (or `max_wait_s` after the first
+final still waiting), one notes-model call covers every final since the last call.
+`push` then gets an updated notes_final frame. Finals that arrive during a call queue
+exactly one more call, which is skipped if its inputs did not change.
+
+The same pass advances the meeting's hierarchical summary (app/summarizer.py), and
+the refinement call gets it as `earlier_summary`, so `summary_so_far` covers the
+whole session instead of the last dozen bullets.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from . import agent
+from .agent import AgentState
+from .pipeline import IngestResult, emit_response, run_locked, turn_lock
+from .sessions import STORE
+
+Push = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+
+def refined_frame(state: AgentState) -> Dict[str, Any]:
+    data = {
+        "kind": "final",
+        "response_type": "notes_final",
+        "refined": True,
+        "usage": state.usage,
+        "notes_final": {"notes": agent._notes_payload(state)},
+    }
+    return emit_response(state, IngestResult(emit=True, data=data, kind="final", reason="notes_refined"))
+
+
+def _refine(
+    request: Dict[str, Any], tree: Optional[Dict[str, Any]], state: AgentState
+) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Worker-thread half of a pass: catch the summary tree up, then refine the recent notes."""
+    if tree is not None:
+        try:
+            agent.SUMMARIZER.catch_up(tree, state=state)
+        except Exception as e:
+            # Segments finished before the error are kept; the rest is retried next pass.
+            print("[notes-summary] error:", e, flush=True)
+        if tree["meeting"]:
+            request = dict(request, earlier_summary=tree["meeting"])
+    return agent.refine_notes(request, state=state), tree
+
+
+class NotesRefiner:
+    def __init__(
+        self,
+        *,
+        debounce_s: float = 1.5,
+        max_wait_s: float = 10.0,
+        store: Any = None,
+    ):
+        """`store`: the session store to refresh from and save to (None: neither)."""
+        self.debounce_s = debounce_s
+        self.max_wait_s = max(debounce_s, max_wait_s)
+        self.store = store
+        self.calls = 0
+        self._due: Dict[str, float] = {}
+        self._first: Dict[str, float] = {}
+        self._push: Dict[str, Push] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+
+    def schedule(self, state: AgentState, *, push: Optional[Push] = None) -> None:
+        """Call on the event loop after a final turn; a no-op unless the turn plan has notes_refine."""
+        if not agent.plan_for(state, "final").needs("notes_refine"):
+            return
+        loop = asyncio.get_running_loop()
+        sid = state.session_id
+        now = loop.time()
+        first = self._first.setdefault(sid, now)
+        self._due[sid] = min(now + self.debounce_s, first + self.max_wait_s)
+        if push is not None:
+            self._push[sid] = push
+        if sid not in self._tasks:
+            self._tasks[sid] = loop.create_task(self._run(state))
+
+    def detach(self, push: Push) -> None:
+        """Stop pushing through a closed connection; pending refinements still run."""
+        for sid in [s for s, p in self._push.items() if p == push]:
+            del self._push[sid]
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def _run(self, state: AgentState) -> None:
+        sid = state.session_id
+        loop = asyncio.get_running_loop()
+        last: Optional[Dict[str, Any]] = None
+        try:
+            while sid in self._due:
+                delay = self._due[sid] - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                    continue
+                del self._due[sid]
+                self._first.pop(sid, None)
+                async with turn_lock(state):
+                    if self.store is not None:
+                        self.store.refresh(state)  # another worker may have added turns
+                    request = agent.notes_refine_request(state)
+                    base = agent.notes_refine_base(state)
+                    due = agent.SUMMARIZER.due(state.summary)
+                    tree = agent.SUMMARIZER.snapshot(state.summary) if due else None
+                if request is None or (request == last and tree is None):
+                    continue
+                last = request
+                self.calls += 1
+                # Model calls run without the turn lock, so turns keep flowing meanwhile.
+                data, tree = await loop.run_in_executor(None, _refine, request, tree, state)
+                if not data and tree is None:
+                    continue
+
+                async def apply() -> Dict[str, Any]:
+                    # run_locked refreshes `state` first, so this lands on top of turns saved
+                    # during the call, by this worker or another.
+                    if tree is not None:
+                        agent.SUMMARIZER.commit(state.summary, tree)
+                    if data:
+                        # Keep heuristic items that turns added while the call ran.
+                        agent.apply_notes_refinement(state, data, base=base)
+                    if (not data or "summary" not in data) and state.summary.get("meeting"):
+                        state.notes["summary_so_far"] = state.summary["meeting"]
+                    return refined_frame(state)
+
+                frame = await run_locked(state, apply, store=self.store)
+                push = self._push.get(sid)
+                if push is not None and state.mode == "notes":
+                    await push(sid, frame)
+        except Exception as e:
+            print("[notes-refine] error:", e, flush=True)
+            self._due.pop(sid, None)
+            self._first.pop(sid, None)
+        finally:
+            self._tasks.pop(sid, None)
+            if sid not in self._due:
+                self._push.pop(sid, None)
+
+
+NOTES_REFINER = NotesRefiner(
+    debounce_s=int(os.getenv("NOTES_REFINE_DEBOUNCE_MS", "1500")) / 1000.0,
+    max_wait_s=int(os.getenv("NOTES_REFINE_MAX_WAIT_MS", "10000")) / 1000.0,
+    store=STORE,
+)
@@ -0,0 +1,113 @@
+# app/reloader.py
+"""Reload the FAISS store in the background and swap it in without a restart."""
+from __future__ import annotations
+
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.bm25 import BM25_FILE
+from app.retriever import INFO_FILE, STORE_DIR, Retriever
+
+# Files whose change means the store was rebuilt.
+WATCHED = ("index.faiss", "meta.idx", "meta.bin", "meta.json", BM25_FILE, INFO_FILE)
+
+
+class StoreReloader:
+    """Loads a fresh Retriever off the request path and hands it to `install`.
+
+    Callers snapshot the retriever they search with (see agent.retrieve_context), so
+    a swap is a single reference assignment: searches already running finish against
+    the old index, and the next one sees the new index. The new index is warmed with one
+    search before the swap, and a store whose metadata does not match its index is
+    never installed.
+    """
+
+    def __init__(
+        self,
+        install: Callable[[Retriever], None],
+        store_dir: str = STORE_DIR,
+        *,
+        poll_interval_s: float = 2.0,
+    ):
+        self.install = install
+        self.store_dir = store_dir
+        self.poll_interval_s = poll_interval_s
+        self.generation = 0
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._lock = threading.Lock()  # one load at a time
+        self._fingerprint: Optional[Tuple] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def fingerprint(self) -> Tuple:
+        out = []
+        for name in WATCHED:
+            try:
+                st = os.stat(os.path.join(self.store_dir, name))
+            except FileNotFoundError:
+                continue
+            out.append((name, st.st_mtime_ns, st.st_size, st.st_ino))
+        return tuple(out)
+
+    def reload(self) -> Dict[str, Any]:
+        """Load, check and warm the store, then install it. The current index stays on failure."""
+        with self._lock:
+            fp = self.fingerprint()
+            t0 = time.perf_counter()
+            try:
+                r = Retriever(self.store_dir).load()
+                if len(r.meta) != r.index.ntotal:
+                    raise RuntimeError(f"metadata has {len(r.meta)} chunks but the index has {r.index.ntotal}")
+                if r.index.ntotal:
+                    r.search(np.ones(r.index.d, dtype="float32"), k=1)
+            except Exception as e:
+                self.last_error = str(e)
+                self._fingerprint = fp  # don't retry the same broken files on every poll
+                print("[reload] error:", e, file=sys.stderr, flush=True)
+                return {"reloaded": False, "error": self.last_error, "generation": self.generation}
+            self.install(r)
+            self.generation += 1
+            self.loaded_at = time.time()
+            self.last_error = None
+            self._fingerprint = fp
+            ms = (time.perf_counter() - t0) * 1000.0
+            print(f"[reload] store generation {self.generation}: {len(r.meta)} chunks ({ms:.0f} ms)",
+                  file=sys.stderr, flush=True)
+            return {"reloaded": True, "generation": self.generation, "chunks": len(r.meta), "load_ms": round(ms, 1)}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "generation": self.generation,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+            "watching": self._thread is not None and self._thread.is_alive(),
+        }
+
+    # -------- File watcher --------
+    def start_watcher(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="store-watcher", daemon=True)
+        self._thread.start()
+
+    def stop_watcher(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_interval_s + 1)
+        self._thread = None
+
+    def _watch(self) -> None:
+        seen = self.fingerprint()
+        while not self._stop.wait(self.poll_interval_s):
+            fp = self.fingerprint()
+            # Reload once the files stop changing, so a build in progress is not picked up.
+            if fp == seen and fp and fp != self._fingerprint:
+                self.reload()
+            seen = fp
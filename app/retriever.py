@@ -1,53 +1,307 @@
-import os, json
-from typing import List, Dict, Any
+import os, json, threading, time
+from collections import deque
+from concurrent.futures import Future
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 try:
     import faiss  # type: ignore
 except Exception:  # pragma: no cover
     faiss = None  # type: ignore[assignment]
 
+from app.bm25 import BM25_FILE, BM25Index
+from app.metastore import MetaStore, has_meta_store
+
 STORE_DIR = "store"
+INFO_FILE = "index_info.json"  # index type, build params, dim (written by scripts/build_index.py)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+BM25_SCORE_HALF = 5.0  # BM25 score that maps to 0.5 in lexical hits
+
+# "cosine": inner product over L2-normalized vectors; "l2": legacy squared-L2 stores.
+METRICS = ("cosine", "l2")
+
+
+def _base_index(index):
+    """Unwrap id maps so the concrete index type is visible."""
+    index = faiss.downcast_index(index)
+    while hasattr(index, "id_map") and hasattr(index, "index"):
+        index = faiss.downcast_index(index.index)
+    return index
+
+
+def detect_index_type(index) -> str:
+    base = _base_index(index)
+    if isinstance(base, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(base, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(base, faiss.IndexIVF):
+        return "ivf_flat"
+    return "flat"
+
+
+def build_faiss_index(
+    vecs: np.ndarray,
+    index_type: str = "flat",
+    *,
+    metric: str = "cosine",
+    nlist: int = 0,
+    pq_m: int = 16,
+    pq_nbits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 80,
+    ids: Optional[np.ndarray] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    """Build and train an index over `vecs`; returns (index, params actually used).
+
+    Parameters are clamped to what a corpus of this size can train (nlist <= n,
+    2**pq_nbits <= n, pq_m divides the dimension). With metric="cosine" the vectors
+    are L2-normalized (in place on the copy) and indexed by inner product. With
+    `ids`, the index is wrapped in an IndexIDMap2 and row i is stored under ids[i].
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is not installed. Run: pip install -r requirements.txt")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"index_type must be one of {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+    vecs = np.array(vecs, dtype="float32", order="C")
+    n, dim = vecs.shape
+    if metric == "cosine":
+        faiss.normalize_L2(vecs)
+        mt = faiss.METRIC_INNER_PRODUCT
+    else:
+        mt = faiss.METRIC_L2
+    params: Dict[str, Any] = {}
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, mt)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, mt)
+        index.hnsw.efConstruction = ef_construction
+        params.update(hnsw_m=hnsw_m, ef_construction=ef_construction)
+    else:
+        nlist = nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        quantizer = faiss.IndexFlat(dim, mt)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, mt)
+        else:
+            while pq_m > 1 and dim % pq_m:
+                pq_m -= 1
+            pq_nbits = max(1, min(pq_nbits, int(np.log2(max(2, n)))))
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_nbits, mt)
+            params.update(pq_m=pq_m, pq_nbits=pq_nbits)
+        index.train(vecs)
+        params.update(nlist=nlist)
+    if ids is None:
+        index.add(vecs)
+    else:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(vecs, np.ascontiguousarray(ids, dtype="int64"))
+    return index, params
+
 
 class Retriever:
-    def __init__(self, store_dir: str = STORE_DIR):
+    def __init__(self, store_dir: str = STORE_DIR, *, nprobe: int = 0, ef_search: int = 0):
         self.store_dir = store_dir
         self.index = None
         self.meta = []
+        self.info: Dict[str, Any] = {}
+        self.index_type = "flat"
+        self.metric = "l2"
+        self._rows: Optional[Dict[int, int]] = None  # faiss id -> meta row, for id-mapped JSON meta
+        self.bm25: Optional[BM25Index] = None  # keyword index, if the store has bm25.json
+        # Hits scoring below this (cosine similarity, see _hits) are dropped.
+        self.min_score = float(os.getenv("RETRIEVER_MIN_SCORE", "0.0"))
+        # Keyword hits scoring below this (squashed BM25, see search_lexical) are dropped.
+        self.min_lexical_score = float(os.getenv("RETRIEVER_MIN_LEXICAL_SCORE", "0.0"))
+        # Search-time recall/latency knobs for IVF (nprobe) and HNSW (efSearch) indexes.
+        self.nprobe = nprobe or int(os.getenv("RETRIEVER_NPROBE", "8"))
+        self.ef_search = ef_search or int(os.getenv("RETRIEVER_EF_SEARCH", "64"))
 
     def load(self):
         if faiss is None:
             raise RuntimeError("faiss is not installed. Run: pip install -r requirements.txt")
         idx_path = os.path.join(self.store_dir, "index.faiss")
         meta_path = os.path.join(self.store_dir, "meta.json")
-        if not (os.path.exists(idx_path) and os.path.exists(meta_path)):
+        binary_meta = has_meta_store(self.store_dir)
+        if not (os.path.exists(idx_path) and (binary_meta or os.path.exists(meta_path))):
             raise RuntimeError("FAISS store not found. Run scripts/build_index.py first.")
         self.index = faiss.read_index(idx_path)
-        with open(meta_path, "r", encoding="utf-8") as f:
-            self.meta = json.load(f)
+        if binary_meta:
+            self.meta = MetaStore(self.store_dir)
+        else:  # stores built before meta.idx/meta.bin existed
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if self.meta and "faiss_id" in self.meta[0]:
+                self._rows = {int(m["faiss_id"]): r for r, m in enumerate(self.meta)}
+        info_path = os.path.join(self.store_dir, INFO_FILE)
+        if os.path.exists(info_path):
+            with open(info_path, "r", encoding="utf-8") as f:
+                self.info = json.load(f)
+        if os.path.exists(os.path.join(self.store_dir, BM25_FILE)):
+            self.bm25 = BM25Index.load(self.store_dir)
+        self.index_type = detect_index_type(self.index)
+        self.metric = "cosine" if self.index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+        self.set_search_params(nprobe=self.nprobe, ef_search=self.ef_search)
         return self
 
-    def search(self, query_vec: np.ndarray, k: int = 4) -> List[Dict[str, Any]]:
+    def set_search_params(self, *, nprobe: int = 0, ef_search: int = 0) -> None:
+        """Trade recall for latency: more IVF lists probed / a wider HNSW beam = better recall."""
+        base = _base_index(self.index)
+        if nprobe and isinstance(base, faiss.IndexIVF):
+            self.nprobe = nprobe
+            base.nprobe = min(nprobe, base.nlist)
+        if ef_search and isinstance(base, faiss.IndexHNSW):
+            self.ef_search = ef_search
+            base.hnsw.efSearch = ef_search
+
+    def search(self, query_vec: np.ndarray, k: int = 4, *, ids_only: bool = False) -> List[Dict[str, Any]]:
+        return self.search_batch(query_vec.reshape(1, -1), k=k, ids_only=ids_only)[0]
+
+    def search_batch(
+        self, query_vecs: np.ndarray, k: int = 4, *, ids_only: bool = False
+    ) -> List[List[Dict[str, Any]]]:
+        """Search an (n, d) matrix of queries with one index call; one hit list per row.
+
+        With `ids_only`, hits carry just "id" and "score" and no chunk text is decoded.
+        """
         if self.index is None:
             raise RuntimeError("Retriever not loaded.")
-        if query_vec.ndim == 1:
-            query_vec = query_vec.reshape(1, -1).astype("float32")
-        D, I = self.index.search(query_vec, k)
-        # IndexFlatL2 returns L2 distance (smaller = better). Convert to similarity-ish [0..1]
+        Q = np.array(np.atleast_2d(query_vecs), dtype="float32", order="C")
+        if self.metric == "cosine":
+            faiss.normalize_L2(Q)
+        D, I = self.index.search(Q, k)
+        return [self._hits(D[r], I[r], ids_only=ids_only) for r in range(Q.shape[0])]
+
+    def _hits(self, drow: np.ndarray, irow: np.ndarray, *, ids_only: bool = False) -> List[Dict[str, Any]]:
+        """Absolute scores in [0..1], comparable across queries.
+
+        Cosine indexes return the similarity directly. Legacy L2 stores hold unit
+        vectors (OpenAI embeddings are normalized), where squared L2 distance d
+        maps to cosine similarity as 1 - d/2.
+        """
         out: List[Dict[str, Any]] = []
-        if len(D) and len(I):
-            mind = float(np.min(D))
-            maxd = float(np.max(D))
-            den = (maxd - mind + 1e-9)
-            for rank, idx in enumerate(I[0]):
-                if idx == -1:
-                    continue
-                m = self.meta[idx]
-                dist = float(D[0][rank])
-                sim = 1.0 - ((dist - mind) / den)  # normalize & invert
-                out.append({
-                    "id": m["id"],
-                    "text": m["text"],
-                    "score": round(sim, 3),
-                    "meta": {"source": m.get("source")}
-                })
+        for dist, idx in zip(drow, irow):
+            row = self._row(int(idx))
+            if row < 0:
+                continue
+            sim = float(dist) if self.metric == "cosine" else 1.0 - float(dist) / 2.0
+            sim = min(1.0, max(0.0, sim))
+            if sim < self.min_score:
+                continue
+            out.append(self._hit(row, sim, ids_only=ids_only))
         return out
+
+    def search_lexical(self, text: str, k: int = 4, *, ids_only: bool = False) -> List[Dict[str, Any]]:
+        """BM25 keyword search: no embedding call. Empty if the store has no bm25.json.
+
+        BM25 scores are unbounded; they are squashed to s / (s + BM25_SCORE_HALF) so that
+        they sit in [0..1) like cosine scores. They are filtered by min_lexical_score, not
+        min_score: the two scales are not comparable.
+        """
+        if self.bm25 is None:
+            return []
+        out: List[Dict[str, Any]] = []
+        for fid, s in self.bm25.search(text, k):
+            row = self._row(fid)
+            score = s / (s + BM25_SCORE_HALF)
+            if row >= 0 and score >= self.min_lexical_score:
+                out.append(self._hit(row, score, ids_only=ids_only))
+        return out
+
+    def _hit(self, row: int, score: float, *, ids_only: bool = False) -> Dict[str, Any]:
+        if ids_only:
+            return {"id": self._id(row), "score": round(score, 3)}
+        m = self.meta[row]
+        return {
+            "id": m["id"],
+            "text": m["text"],
+            "score": round(score, 3),
+            "meta": {"source": m.get("source")}
+        }
+
+    def _row(self, faiss_id: int) -> int:
+        if faiss_id < 0:
+            return -1
+        if isinstance(self.meta, MetaStore):
+            return self.meta.row_of(faiss_id)
+        if self._rows is not None:
+            return self._rows.get(faiss_id, -1)
+        return faiss_id if faiss_id < len(self.meta) else -1
+
+    def _id(self, row: int) -> str:
+        if isinstance(self.meta, MetaStore):
+            return self.meta.id(row)
+        return self.meta[row]["id"]
+
+
+class MicroBatcher:
+    """Collects single-query searches from concurrent callers and runs them as one batch.
+
+    A background thread waits up to `window_ms` after the first queued query (or until
+    `max_batch` are queued), then issues one `search_batch` per retriever and hands each
+    caller its own hits. Callers block in `search` as with `Retriever.search`.
+    """
+
+    def __init__(self, window_ms: float = 2.0, max_batch: int = 64):
+        self.window_s = max(0.0, window_ms) / 1000.0
+        self.max_batch = max(1, max_batch)
+        self._queue: "deque[Tuple[Retriever, np.ndarray, int, Future]]" = deque()
+        self._cv = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.queries = 0
+
+    def search(self, retriever: "Retriever", query_vec: np.ndarray, k: int = 4) -> List[Dict[str, Any]]:
+        fut: Future = Future()
+        with self._cv:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+                self._thread.start()
+            self._queue.append((retriever, np.asarray(query_vec, dtype="float32").reshape(-1), k, fut))
+            self._cv.notify()
+        return fut.result()
+
+    def _take(self) -> List[Tuple["Retriever", np.ndarray, int, Future]]:
+        with self._cv:
+            while not self._queue:
+                self._cv.wait()
+            deadline = time.monotonic() + self.window_s
+            while len(self._queue) < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cv.wait(left)
+            n = min(len(self._queue), self.max_batch)
+            return [self._queue.popleft() for _ in range(n)]
+
+    def _run(self) -> None:
+        while True:
+            items = self._take()
+            try:
+                self._dispatch(items)
+            except Exception as e:
+                print("[search-batcher] error:", e, flush=True)
+            # Never leave a caller blocked: anything not answered above fails.
+            for item in items:
+                if not item[3].done():
+                    item[3].set_exception(RuntimeError("batched search returned no result"))
+
+    def _dispatch(self, items: List[Tuple["Retriever", np.ndarray, int, Future]]) -> None:
+        groups: Dict[int, List[Tuple["Retriever", np.ndarray, int, Future]]] = {}
+        for item in items:
+            groups.setdefault(id(item[0]), []).append(item)
+        for group in groups.values():
+            retriever = group[0][0]
+            k = max(item[2] for item in group)
+            try:
+                results = retriever.search_batch(np.stack([item[1] for item in group]), k=k)
+            except Exception as e:
+                for item in group:
+                    item[3].set_exception(e)
+                continue
+            self.batches += 1
+            self.queries += len(group)
+            for item, hits in zip(group, results):
+                item[3].set_result(hits[: item[2]])
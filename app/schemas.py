@@ -1,7 +1,9 @@
 # app/schemas.py
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
 from typing import Optional, Dict, Any, List
 
+from app.corpora import valid_corpus_id
+
 
 class DeltaIn(BaseModel):
     session_id: str
@@ -12,6 +14,12 @@ class DeltaIn(BaseModel):
     speaker: Optional[str] = None
     mode: Optional[str] = "append"  # "append" | "replace"
     session_mode: Optional[str] = None  # "coach" | "notes"
+    corpus: Optional[str] = None  # switch the session to this user's corpus
+
+    @field_validator("corpus")
+    @classmethod
+    def _check_corpus(cls, v: Optional[str]) -> Optional[str]:
+        return None if v is None else valid_corpus_id(v)
 
 
 # -------- Explicit response payloads for frontend --------
@@ -32,6 +40,11 @@ class CoachFinalPayload(BaseModel):
     context_ids: List[str]
 
 
+class CoachFinalPartialPayload(BaseModel):
+    """Streaming coach output: suggestions completed so far. A full CoachFinalPayload follows."""
+    suggestions: List[str]
+
+
 class NotesPayload(BaseModel):
     """Structured notes for display."""
     bullets: List[str] = []
@@ -54,7 +67,7 @@ class EmitPayload(BaseModel):
     response_type: str  # "coach_speculative" | "coach_final" | "notes_final"
     speaker: str
     transcript: str
-    usage: Dict[str, Any]
+    usage: Optional[Dict[str, Any]] = None  # omitted on partial frames
 
     coach_speculative: Optional[CoachSpeculativePayload] = None
     coach_final: Optional[CoachFinalPayload] = None
@@ -66,3 +79,4 @@ class AgentResponse(BaseModel):
     kind: str = "none"
     data: Optional[Dict[str, Any]] = None
     reason: Optional[str] = None
+    partial: bool = False  # True for streaming coach_final frames (data.coach_final is a CoachFinalPartialPayload)
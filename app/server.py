@@ -1,18 +1,21 @@
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-import time, sys
+from pydantic import BaseModel, field_validator
+import asyncio, os, time, sys
 from pathlib import Path
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 
 import app.agent as agent               # import the module so we can inject into agent.RETRIEVER
-from app.agent import AgentState, EndOfThought
+from app.agent import AgentState
 from app.retriever import Retriever
-from app.pipeline import append_delta, maybe_emit
+from app.reloader import StoreReloader
+from app.corpora import valid_corpus_id
+from app.notes import snapshot as notes_snapshot
+from app.pipeline import DETECTOR, append_delta, emit_response, maybe_emit_async, run_locked
+from app.refiner import NOTES_REFINER
+from app.sessions import STORE as SESSIONS  # shared with /ws
 
 app = FastAPI()
-SESSIONS = {}
-DETECTOR = EndOfThought(pause_ms=900, stable_n=2)
 
 STATIC_DIR = Path(__file__).parent / "static"
 if STATIC_DIR.exists():
@@ -30,6 +33,12 @@ class TranscriptEvent(BaseModel):
     final: bool = False
     speaker: str | None = None
     session_mode: str | None = None  # "coach" | "notes"
+    corpus: str | None = None  # per-user corpus id (see app/corpora.py)
+
+    @field_validator("corpus")
+    @classmethod
+    def _check_corpus(cls, v: str | None) -> str | None:
+        return None if v is None else valid_corpus_id(v)
 
 
 class SessionModeBody(BaseModel):
@@ -42,6 +51,7 @@ class SessionSummary(BaseModel):
     created_at: float
     last_seen_at: float
     roles: dict[str, str]
+    corpus: str | None = None
 
 
 class UsageSummary(BaseModel):
@@ -57,42 +67,74 @@ class NotesSummary(BaseModel):
     mode: str
     notes: dict
 
+def _install_retriever(r: Retriever) -> None:
+    agent.RETRIEVER = r                             # inject the retriever into the agent module
+
+
+# Rebuilt stores are picked up by POST /retriever/reload, or automatically with RETRIEVER_WATCH.
+RELOADER = StoreReloader(
+    _install_retriever, poll_interval_s=float(os.getenv("RETRIEVER_WATCH_INTERVAL_S", "2"))
+)
+
 @app.on_event("startup")
 def _load_retriever():
     """Load FAISS index at startup and inject into agent.RETRIEVER."""
-    try:
-        agent.RETRIEVER = Retriever().load()        # inject the retriever into the agent module
+    res = RELOADER.reload()
+    if res["reloaded"]:
         print("FAISS retriever loaded and injected into agent.", file=sys.stderr, flush=True)
-    except Exception as e:
+    else:
         agent.RETRIEVER = None
-        print(f"FAISS retriever not available: {e}", file=sys.stderr, flush=True)
+        print(f"FAISS retriever not available: {res['error']}", file=sys.stderr, flush=True)
+    try:
+        agent.EMBEDDER.warm_up()  # load a local embedding model before the first turn
+    except Exception as e:
+        print("[embed] warm-up error:", e, file=sys.stderr, flush=True)
+    if os.getenv("RETRIEVER_WATCH", "false").lower() in ("1", "true", "yes"):
+        RELOADER.start_watcher()
+
+@app.on_event("shutdown")
+def _stop_watcher():
+    RELOADER.stop_watcher()
+
+@app.post("/retriever/reload")
+async def reload_retriever():
+    """Load the store from disk off the event loop and swap it in; the old index serves until then."""
+    res = await asyncio.get_running_loop().run_in_executor(None, RELOADER.reload)
+    if not res["reloaded"]:
+        raise HTTPException(status_code=409, detail=res["error"])
+    return res
 
 @app.post("/ingest")
-def ingest(ev: TranscriptEvent):
+async def ingest(ev: TranscriptEvent):
     """Append delta; if final or end-of-thought -> process; otherwise no-op."""
-    st = SESSIONS.get(ev.session_id)
-    if not st:
-        st = AgentState(session_id=ev.session_id)
-        SESSIONS[ev.session_id] = st
-
-    # Touch session activity
-    st.last_seen_at = time.time()
-
-    if ev.session_mode in ("coach", "notes"):
-        st.mode = ev.session_mode
-
-    append_delta(st, ev.text_delta, ts=time.time(), speaker=ev.speaker)
-    res = maybe_emit(st, final=ev.final, detector=DETECTOR)
+    st = SESSIONS.get_or_create(ev.session_id)
+
+    dirty = False
+
+    async def apply():
+        nonlocal dirty
+        # Touch session activity
+        st.last_seen_at = time.time()
+
+        dirty = False
+        if ev.session_mode in ("coach", "notes") and st.mode != ev.session_mode:
+            st.mode = ev.session_mode
+            dirty = True
+        if ev.corpus and st.corpus != ev.corpus:
+            st.corpus = ev.corpus
+            dirty = True
+
+        append_delta(st, ev.text_delta, ts=time.time(), speaker=ev.speaker)
+        return await maybe_emit_async(st, final=ev.final, detector=DETECTOR)
+
+    # The next request may reach another worker, so a shared store also keeps the buffer;
+    # in memory, deltas that emit nothing and change no setting are not saved.
+    res = await run_locked(st, apply, store=SESSIONS, save_if=lambda r: r.emit or dirty or SESSIONS.shared)
+    if res.kind == "final":
+        NOTES_REFINER.schedule(st)  # no socket to push to: refined notes show up on the next read
     if res.emit:
-        out = dict(res.data) if res.data else {}
-        out["created_at"] = getattr(st, "created_at", None)
-        out["last_seen_at"] = getattr(st, "last_seen_at", None)
-        if out.get("usage") and isinstance(out["usage"], dict):
-            out["usage"]["created_at"] = out["created_at"]
-            out["usage"]["last_seen_at"] = out["last_seen_at"]
         print(f"[ingest] emit sid={ev.session_id} kind={res.kind} reason={res.reason}", file=sys.stderr, flush=True)
-        return {"emit": True, "kind": res.kind, "data": out, "reason": res.reason}
-    return {"emit": False, "kind": res.kind, "reason": res.reason}
+    return emit_response(st, res)
 
 
 def _get_session_or_404(session_id: str) -> AgentState:
@@ -111,6 +153,7 @@ def get_session(session_id: str):
         created_at=st.created_at,
         last_seen_at=st.last_seen_at,
         roles=st.roles,
+        corpus=st.corpus,
     )
 
 
@@ -121,15 +164,16 @@ def get_session_mode(session_id: str):
 
 
 @app.post("/session/{session_id}/mode", response_model=SessionModeBody)
-def set_session_mode(session_id: str, body: SessionModeBody):
-    st = SESSIONS.get(session_id)
-    if not st:
-        st = AgentState(session_id=session_id)
-        SESSIONS[session_id] = st
+async def set_session_mode(session_id: str, body: SessionModeBody):
     if body.mode not in ("coach", "notes"):
         raise HTTPException(status_code=400, detail="mode must be 'coach' or 'notes'")
-    st.mode = body.mode
-    st.last_seen_at = time.time()
+    st = SESSIONS.get_or_create(session_id)
+
+    async def apply():
+        st.mode = body.mode
+        st.last_seen_at = time.time()
+
+    await run_locked(st, apply, store=SESSIONS)
     return SessionModeBody(mode=st.mode)
 
 
@@ -151,7 +195,7 @@ def get_session_notes(session_id: str):
     return NotesSummary(
         session_id=session_id,
         mode=st.mode,
-        notes=st.notes,
+        notes=notes_snapshot(st.notes),
     )
 
 @app.get("/health")
@@ -159,11 +203,30 @@ def health():
     status = "loaded" if (agent.RETRIEVER and agent.RETRIEVER.index is not None) else "missing"
     return {"retriever": status}
 
+@app.get("/debug/sessions")
+def debug_sessions():
+    """Session counts, approximate bytes per session, and eviction settings."""
+    return SESSIONS.stats()
+
 @app.get("/debug/retriever")
 def debug_retriever():
-    if not agent.RETRIEVER or not agent.RETRIEVER.index:
-        return {"loaded": False}
-    return {"loaded": True, "chunks": len(agent.RETRIEVER.meta)}
+    r = agent.RETRIEVER
+    if not r or not r.index:
+        return {"loaded": False, **RELOADER.status()}
+    return {
+        "loaded": True,
+        "chunks": len(r.meta),
+        "index_type": r.index_type,
+        "embed_model": r.info.get("embed_model"),
+        "embed_backend": agent.EMBEDDER.name,
+        "embedder_matches": agent.embedder_matches(r),
+        **RELOADER.status(),
+    }
+
+@app.get("/debug/corpora")
+def debug_corpora():
+    """Per-user corpora currently loaded, with approximate bytes and eviction counts."""
+    return agent.CORPORA.stats()
 
 # Simple classifier probe to surface any OpenAI issues quickly
 class ClassifyProbe(BaseModel):
@@ -0,0 +1,424 @@
+# app/sessions.py
+"""Session registry with idle/LRU eviction and approximate memory accounting."""
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import fields
+from typing import Any, Dict, List, Optional
+
+from .agent import AgentState
+from .notes import ensure_sections
+
+
+def _deep_sizeof(obj: Any, seen: set) -> int:
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            size += _deep_sizeof(k, seen) + _deep_sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)) or type(obj).__name__ == "deque":
+        for v in obj:
+            size += _deep_sizeof(v, seen)
+    return size
+
+
+def approx_state_bytes(state: AgentState) -> int:
+    """Approximate resident size of a session's data (runtime handles excluded)."""
+    seen: set = set()
+    total = sys.getsizeof(state)
+    for f in fields(state):
+        if f.metadata.get("runtime"):
+            continue
+        total += _deep_sizeof(getattr(state, f.name), seen)
+    return total
+
+
+def state_to_dict(state: AgentState) -> Dict[str, Any]:
+    """The session's data fields (runtime handles excluded), JSON-serializable."""
+    return {f.name: getattr(state, f.name) for f in fields(state) if not f.metadata.get("runtime")}
+
+
+def state_from_dict(data: Dict[str, Any]) -> AgentState:
+    names = {f.name for f in fields(AgentState) if not f.metadata.get("runtime")}
+    state = AgentState(**{k: v for k, v in data.items() if k in names})
+    ensure_sections(state.notes)  # JSON brings the sections back as plain lists
+    return state
+
+
+class SessionConflict(RuntimeError):
+    """Another worker saved the session after this process last loaded it."""
+
+
+class SessionStore:
+    """In-process sessions keyed by id.
+
+    Sessions idle for longer than `idle_ttl_s` (by `last_seen_at`) are dropped, and
+    when the store holds more than `max_sessions` or more than `memory_budget_bytes`
+    (approximate), the least recently seen sessions are evicted first. A session with
+    a turn in progress is never evicted. Sweeps run at most every `sweep_interval_s`.
+
+    A session's size is measured in `save`, with its turn lock held, when a turn was
+    recorded since the last measurement, and cached; sweeps and stats read only the
+    cached sizes.
+    """
+
+    shared = False  # no other process writes these sessions
+
+    def __init__(
+        self,
+        *,
+        max_sessions: int = 1000,
+        idle_ttl_s: float = 3600.0,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        sweep_interval_s: float = 30.0,
+    ):
+        self.max_sessions = max_sessions
+        self.idle_ttl_s = idle_ttl_s
+        self.memory_budget_bytes = memory_budget_bytes
+        self.sweep_interval_s = sweep_interval_s
+        self._sessions: "OrderedDict[str, AgentState]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}
+        self._measured: Dict[str, Any] = {}  # session id -> last turn record when measured
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> Optional[AgentState]:
+        with self._lock:
+            st = self._sessions.get(session_id)
+            if st is not None:
+                self._sessions.move_to_end(session_id)
+            return st
+
+    def get_or_create(self, session_id: str) -> AgentState:
+        with self._lock:
+            st = self._sessions.get(session_id)
+            if st is None:
+                st = AgentState(session_id=session_id)
+                self._sessions[session_id] = st
+                self._sizes[session_id] = approx_state_bytes(st)
+            else:
+                self._sessions.move_to_end(session_id)
+        self.maybe_sweep()
+        return st
+
+    def save(self, state: AgentState) -> None:
+        """Re-measure `state` if it recorded a turn (objects are shared in-process, so
+        nothing else to persist). Call with the session's turn lock held, so no turn
+        mutates it while it is walked.
+        """
+        sid = state.session_id
+        last = state.turns[-1] if state.turns else None
+        with self._lock:
+            if self._measured.get(sid) is last:
+                return
+        size = approx_state_bytes(state)
+        with self._lock:
+            if self._sessions.get(sid) is state:
+                self._sizes[sid] = size
+                self._measured[sid] = last
+
+    def refresh(self, state: AgentState) -> None:
+        """Sessions live only in this process, so `state` is always current."""
+
+    def pop(self, session_id: str) -> Optional[AgentState]:
+        with self._lock:
+            self._sizes.pop(session_id, None)
+            self._measured.pop(session_id, None)
+            return self._sessions.pop(session_id, None)
+
+    def maybe_sweep(self) -> List[str]:
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval_s and len(self._sessions) <= self.max_sessions:
+            return []
+        return self.sweep(now=now)
+
+    def sweep(self, *, now: Optional[float] = None) -> List[str]:
+        """Evict idle sessions, then LRU sessions until within count and memory limits."""
+        now = time.time() if now is None else now
+        evicted: List[str] = []
+        with self._lock:
+            self._last_sweep = now
+            for sid, st in list(self._sessions.items()):
+                if now - st.last_seen_at > self.idle_ttl_s and not _busy(st):
+                    del self._sessions[sid]
+                    self._sizes.pop(sid, None)
+                    self._measured.pop(sid, None)
+                    evicted.append(sid)
+
+            total = sum(self._sizes.get(sid, 0) for sid in self._sessions)
+            # Oldest activity first; the most recently seen session is always kept.
+            order = sorted(self._sessions.items(), key=lambda kv: kv[1].last_seen_at)[:-1]
+            for sid, st in order:
+                if len(self._sessions) <= self.max_sessions and total <= self.memory_budget_bytes:
+                    break
+                if _busy(st):
+                    continue
+                del self._sessions[sid]
+                total -= self._sizes.pop(sid, 0)
+                self._measured.pop(sid, None)
+                evicted.append(sid)
+        self.evicted += len(evicted)
+        if evicted:
+            print(f"[sessions] evicted {len(evicted)} session(s)", file=sys.stderr, flush=True)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = [(sid, st, self._sizes.get(sid, 0)) for sid, st in self._sessions.items()]
+        per_session = [
+            {
+                "session_id": sid,
+                "bytes": size,
+                "turns": len(st.turns),
+                "last_seen_at": st.last_seen_at,
+            }
+            for sid, st, size in items
+        ]
+        return {
+            "backend": "memory",
+            "sessions": len(per_session),
+            "bytes_total": sum(r["bytes"] for r in per_session),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_s": self.idle_ttl_s,
+            "evicted_total": self.evicted,
+            "per_session": per_session,
+        }
+
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file, so several uvicorn workers can serve one session.
+
+    Each row holds the JSON-encoded session data plus a revision counter. Loaded
+    objects are kept in-process, so runtime handles such as caches and locks survive
+    between frames. A row written by another worker is reloaded into the same object,
+    by `refresh` under the turn lock, or by `get` when no turn is running.
+
+    Writes are optimistic: `save` only replaces the revision this process loaded, and
+    raises SessionConflict if another worker saved the session in between. The caller
+    then refreshes and redoes its change (see pipeline.run_locked).
+    """
+
+    shared = True  # other workers may write the same sessions
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        max_sessions: int = 1000,
+        idle_ttl_s: float = 3600.0,
+        memory_budget_bytes: int = 256 * 1024 * 1024,
+        sweep_interval_s: float = 30.0,
+    ):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.idle_ttl_s = idle_ttl_s
+        self.memory_budget_bytes = memory_budget_bytes
+        self.sweep_interval_s = sweep_interval_s
+        self._lock = threading.Lock()
+        self._live: Dict[str, "tuple[int, AgentState]"] = {}
+        self._last_sweep = time.time()
+        self.evicted = 0
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY, data TEXT NOT NULL, rev INTEGER NOT NULL,"
+            " last_seen_at REAL NOT NULL, bytes INTEGER NOT NULL)"
+        )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row is not None
+
+    def _load_locked(self, session_id: str) -> Optional[AgentState]:
+        row = self._db.execute("SELECT rev FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            self._live.pop(session_id, None)
+            return None
+        live = self._live.get(session_id)
+        if live is not None:
+            # A running turn refreshes under its own lock; never swap data beneath it.
+            if live[0] != row[0] and not _busy(live[1]):
+                self._reload_locked(live[1])
+            return live[1]
+        row = self._db.execute("SELECT rev, data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return None
+        st = state_from_dict(json.loads(row[1]))
+        self._live[session_id] = (row[0], st)
+        return st
+
+    def _reload_locked(self, state: AgentState) -> None:
+        """Bring `state` up to the stored revision in place, keeping its runtime handles."""
+        sid = state.session_id
+        live = self._live.get(sid)
+        row = self._db.execute("SELECT rev, data FROM sessions WHERE session_id = ?", (sid,)).fetchone()
+        if row is None:
+            self._live[sid] = (0, state)  # deleted elsewhere: the next save re-creates it
+            return
+        if live is not None and live[1] is state and live[0] == row[0]:
+            return
+        fresh = state_from_dict(json.loads(row[1]))
+        for f in fields(state):
+            if not f.metadata.get("runtime"):
+                setattr(state, f.name, getattr(fresh, f.name))
+        self._live[sid] = (row[0], state)
+
+    def _insert_locked(self, state: AgentState, data: str) -> bool:
+        cur = self._db.execute(
+            "INSERT INTO sessions (session_id, data, rev, last_seen_at, bytes) VALUES (?, ?, 1, ?, ?)"
+            " ON CONFLICT(session_id) DO NOTHING",
+            (state.session_id, data, state.last_seen_at, len(data)),
+        )
+        if cur.rowcount != 1:
+            return False
+        self._live[state.session_id] = (1, state)
+        return True
+
+    def get(self, session_id: str) -> Optional[AgentState]:
+        with self._lock:
+            return self._load_locked(session_id)
+
+    def get_or_create(self, session_id: str) -> AgentState:
+        with self._lock:
+            st = self._load_locked(session_id)
+            if st is None:
+                st = AgentState(session_id=session_id)
+                if not self._insert_locked(st, json.dumps(state_to_dict(st), default=list)):
+                    st = self._load_locked(session_id) or st  # another worker created it first
+        self.maybe_sweep()
+        return st
+
+    def refresh(self, state: AgentState) -> None:
+        """Reload `state` if another worker saved it. Call with the session's turn lock held."""
+        with self._lock:
+            self._reload_locked(state)
+
+    def save(self, state: AgentState) -> None:
+        """Write `state` over the revision it was loaded at; SessionConflict if that is stale."""
+        data = json.dumps(state_to_dict(state), default=list)
+        sid = state.session_id
+        with self._lock:
+            live = self._live.get(sid)
+            rev = live[0] if live is not None and live[1] is state else 0
+            if not rev:
+                if not self._insert_locked(state, data):
+                    raise SessionConflict(sid)
+                return
+            cur = self._db.execute(
+                "UPDATE sessions SET data = ?, rev = rev + 1, last_seen_at = ?, bytes = ?"
+                " WHERE session_id = ? AND rev = ?",
+                (data, state.last_seen_at, len(data), sid, rev),
+            )
+            if cur.rowcount != 1:
+                raise SessionConflict(sid)
+            self._live[sid] = (rev + 1, state)
+
+    def pop(self, session_id: str) -> Optional[AgentState]:
+        with self._lock:
+            st = self._load_locked(session_id)
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self._live.pop(session_id, None)
+        return st
+
+    def maybe_sweep(self) -> List[str]:
+        if time.time() - self._last_sweep < self.sweep_interval_s:
+            return []
+        return self.sweep()
+
+    def sweep(self, *, now: Optional[float] = None) -> List[str]:
+        """Same policy as SessionStore, using the stored size (encoded bytes) per session."""
+        now = time.time() if now is None else now
+        evicted: List[str] = []
+        with self._lock:
+            self._last_sweep = now
+            rows = self._db.execute(
+                "SELECT session_id, last_seen_at, bytes FROM sessions ORDER BY last_seen_at"
+            ).fetchall()
+            keep = []
+            for sid, seen, size in rows:
+                if now - seen > self.idle_ttl_s and not _busy_live(self._live.get(sid)):
+                    evicted.append(sid)
+                else:
+                    keep.append((sid, size))
+            total = sum(size for _, size in keep)
+            count = len(keep)
+            for sid, size in keep[:-1]:
+                if count <= self.max_sessions and total <= self.memory_budget_bytes:
+                    break
+                if _busy_live(self._live.get(sid)):
+                    continue
+                evicted.append(sid)
+                total -= size
+                count -= 1
+            for sid in evicted:
+                self._db.execute("DELETE FROM sessions WHERE session_id = ?", (sid,))
+                self._live.pop(sid, None)
+        self.evicted += len(evicted)
+        if evicted:
+            print(f"[sessions] evicted {len(evicted)} session(s)", file=sys.stderr, flush=True)
+        return evicted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT session_id, bytes, last_seen_at FROM sessions ORDER BY last_seen_at DESC"
+            ).fetchall()
+        per_session = [{"session_id": sid, "bytes": size, "last_seen_at": seen} for sid, size, seen in rows]
+        return {
+            "backend": "sqlite",
+            "sessions": len(per_session),
+            "bytes_total": sum(r["bytes"] for r in per_session),
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "max_sessions": self.max_sessions,
+            "idle_ttl_s": self.idle_ttl_s,
+            "evicted_total": self.evicted,
+            "per_session": per_session,
+        }
+
+
+def make_store() -> "SessionStore | SQLiteSessionStore":
+    """SESSION_STORE=memory (default) or sqlite (file at SESSION_DB)."""
+    limits = dict(
+        max_sessions=int(os.getenv("SESSION_MAX", "1000")),
+        idle_ttl_s=float(os.getenv("SESSION_IDLE_TTL_S", "3600")),
+        memory_budget_bytes=int(float(os.getenv("SESSION_MEMORY_BUDGET_MB", "256")) * 1024 * 1024),
+        sweep_interval_s=float(os.getenv("SESSION_SWEEP_INTERVAL_S", "30")),
+    )
+    if os.getenv("SESSION_STORE", "memory").lower() == "sqlite":
+        return SQLiteSessionStore(os.getenv("SESSION_DB", "sessions.db"), **limits)
+    return SessionStore(**limits)
+
+
+# One registry shared by /ingest, /session/* and /ws.
+STORE = make_store()
+
+
+def _busy_live(live: "Optional[tuple[int, AgentState]]") -> bool:
+    return live is not None and _busy(live[1])
+
+
+def _busy(st: AgentState) -> bool:
+    lock = st.turn_lock
+    return lock is not None and lock.locked()
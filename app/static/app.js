@@ -61,7 +61,15 @@ function setStatus(s) {
 
 function wsUrl() {
   const proto = location.protocol === "https:" ? "wss:" : "ws:";
-  return `${proto}//${location.host}/ws`;
+  // Delta protocol: usage and notes arrive as versioned merge patches (see app/delta.py).
+  return `${proto}//${location.host}/ws?proto=delta`;
+}
+
+// -------- Delta frames (app/static/delta.js) --------
+const delta = createDeltaClient((obj) => sendMsg(obj));
+
+function resolveDelta(msg) {
+  return delta.resolve(msg, els.sessionId.value);
 }
 
 function sendMsg(obj) {
@@ -309,6 +317,7 @@ if (els.connect) {
       ws.close();
       return;
     }
+    delta.reset();
     ws = new WebSocket(wsUrl());
     setStatus("connecting…");
     ws.onopen = () => {
@@ -330,9 +339,16 @@ if (els.connect) {
       let msg;
       try { msg = JSON.parse(ev.data); } catch (_) { return; }
       if (msg?.error) return;
+      if (msg?.partial && msg?.data?.coach_final) {
+        // Streaming draft: suggestions fill in one by one; the terminal frame follows.
+        renderCoachFinal(msg.data.coach_final);
+        return;
+      }
       if (msg?.emit && msg?.data) {
+        const data = resolveDelta(msg);
+        if (!data) return;
         const kind = msg.kind || "final";
-        renderFromPayload(msg.data, kind);
+        renderFromPayload(data, kind);
       }
     };
   });
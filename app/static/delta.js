@@ -0,0 +1,51 @@
+// Delta frames (/ws?proto=delta): rebuild usage/notes from snapshots and merge patches
+// (see app/delta.py). No DOM access, so tests can run it under node.
+
+function applyMergePatch(doc, patch) {
+  if (patch === null || typeof patch !== "object" || Array.isArray(patch)) return patch;
+  const out = doc && typeof doc === "object" && !Array.isArray(doc) ? { ...doc } : {};
+  for (const [k, v] of Object.entries(patch)) {
+    if (v === null) delete out[k];
+    else out[k] = applyMergePatch(out[k], v);
+  }
+  return out;
+}
+
+// `send(obj)` delivers acks and resync requests to the server.
+function createDeltaClient(send) {
+  let docs = {}; // version -> document ({usage, notes})
+
+  return {
+    reset() {
+      docs = {};
+    },
+
+    // Returns msg.data with usage/notes filled in. If the patch base is gone, asks for a
+    // snapshot and returns msg.data as sent (per-turn output still renders).
+    resolve(msg, sessionId) {
+      if (msg.v == null) return msg.data; // legacy full frame
+      let doc;
+      if (msg.snapshot) {
+        doc = msg.snapshot;
+      } else {
+        const base = docs[msg.base];
+        if (!base) {
+          send({ resync: true, session_id: sessionId });
+          return { ...msg.data };
+        }
+        doc = applyMergePatch(base, msg.patch || {});
+        // The server patches against its last received ack, which never goes backwards,
+        // so older docs are unreachable. A snapshot says nothing about that ack (ours may
+        // still be in flight), so snapshots never prune.
+        for (const v of Object.keys(docs)) if (Number(v) < msg.base) delete docs[v];
+      }
+      docs[msg.v] = doc;
+      send({ ack: msg.v, session_id: sessionId });
+      const data = { ...msg.data, usage: doc.usage };
+      if (data.response_type === "notes_final") data.notes_final = { notes: doc.notes || {} };
+      return data;
+    },
+  };
+}
+
+if (typeof module !== "undefined") module.exports = { applyMergePatch, createDeltaClient };
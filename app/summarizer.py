@@ -0,0 +1,109 @@
+# app/summarizer.py
+"""Rolling hierarchical summary of a whole meeting, for Notes mode.
+
+Bullets are queued as turns finish. Every `segment_turns` bullets become one segment
+summary. `fanin` segments of the same level merge into one summary a level up, in the
+same carry pattern as a binary counter. After each new segment, the open segments are
+combined into the meeting-level summary (once per catch-up). Every call gets a bounded input: one segment
+of bullets, `fanin` summaries, or the open segments. A session of n turns costs about
+at most n / segment_turns * (2 + 1 / (fanin - 1)) calls.
+
+The tree is plain JSON (lists and dicts) so sessions persist it as-is.
+"""
+from __future__ import annotations
+
+import copy
+from typing import Any, Callable, Dict, List
+
+# summarize(kind, texts, state) -> summary text; kind is "segment", "merge" or "meeting".
+Summarize = Callable[[str, List[str], Any], str]
+
+
+def new_tree() -> Dict[str, Any]:
+    return {
+        "turns": 0,  # bullets added so far
+        "summarized": 0,  # bullets folded into segments (or dropped, see add)
+        "pending": [],
+        "segments": [],  # {"level", "start", "end", "text"}, levels non-increasing
+        "meeting": None,
+    }
+
+
+class HierarchicalSummarizer:
+    def __init__(
+        self,
+        summarize: Summarize,
+        *,
+        segment_turns: int = 12,
+        fanin: int = 4,
+        max_chars: int = 600,
+        max_pending_segments: int = 4,
+    ):
+        self.summarize = summarize
+        self.segment_turns = max(1, segment_turns)
+        self.fanin = max(2, fanin)
+        self.max_chars = max_chars
+        self.max_pending = self.segment_turns * max(1, max_pending_segments)
+
+    def add(self, tree: Dict[str, Any], bullet: str) -> None:
+        """Queue one bullet. Cheap; called on the turn path."""
+        tree["pending"].append(bullet[: self.max_chars])
+        tree["turns"] += 1
+        # If summarizing keeps failing, drop the oldest bullets rather than grow without bound.
+        over = len(tree["pending"]) - self.max_pending
+        if over > 0:
+            del tree["pending"][:over]
+            tree["summarized"] += over
+
+    def due(self, tree: Dict[str, Any]) -> bool:
+        return len(tree["pending"]) >= self.segment_turns
+
+    def catch_up(self, tree: Dict[str, Any], *, state: Any = None) -> int:
+        """Summarize every full segment in `tree` and refresh the meeting summary; returns the call count."""
+        calls = 0
+        segs: List[Dict[str, Any]] = tree["segments"]
+        while self.due(tree):
+            chunk = tree["pending"][: self.segment_turns]
+            start = tree["summarized"]
+            text = self._call("segment", chunk, state)
+            calls += 1
+            del tree["pending"][: self.segment_turns]
+            tree["summarized"] += len(chunk)
+            segs.append({"level": 0, "start": start, "end": start + len(chunk), "text": text})
+            while len(segs) >= self.fanin and len({s["level"] for s in segs[-self.fanin:]}) == 1:
+                group = segs[-self.fanin:]
+                merged = self._call("merge", [s["text"] for s in group], state)
+                calls += 1
+                segs[-self.fanin:] = [{
+                    "level": group[0]["level"] + 1,
+                    "start": group[0]["start"],
+                    "end": group[-1]["end"],
+                    "text": merged,
+                }]
+        if calls:
+            if len(segs) == 1:
+                tree["meeting"] = segs[0]["text"]
+            else:
+                tree["meeting"] = self._call("meeting", [s["text"] for s in segs], state)
+                calls += 1
+        return calls
+
+    def _call(self, kind: str, texts: List[str], state: Any) -> str:
+        return (self.summarize(kind, texts, state) or "").strip()[: self.max_chars]
+
+    @staticmethod
+    def snapshot(tree: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy to run `catch_up` on outside the session lock."""
+        return copy.deepcopy(tree)
+
+    @staticmethod
+    def commit(live: Dict[str, Any], done: Dict[str, Any]) -> None:
+        """Fold a caught-up copy back into the live tree, keeping bullets added meanwhile."""
+        # `summarized` is the absolute index of the first pending bullet in both trees.
+        consumed = done["summarized"] - live["summarized"]
+        if consumed > 0:
+            del live["pending"][:consumed]
+            live["summarized"] = done["summarized"]
+        live["segments"] = done["segments"]
+        live["meeting"] = done["meeting"]
+
@@ -1,64 +1,208 @@
 # app/ws.py
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+import asyncio
+import threading
 import time
-from .agent import AgentState, EndOfThought
+from collections import deque
+from .agent import AgentState
+from .delta import DeltaEncoder
 from .schemas import DeltaIn
-from .pipeline import append_delta, maybe_emit
+from .pipeline import DETECTOR, IngestResult, append_delta, coalesce, emit_response, maybe_emit_async, run_locked
+from .refiner import NOTES_REFINER
+from .sessions import STORE as sessions
 import json
+import os
 
 router = APIRouter()
-sessions: dict[str, AgentState] = {}
-DETECTOR = EndOfThought(pause_ms=900, stable_n=2, min_words=10, max_words=60)
+
+# /ws?proto=delta: usage and notes are sent as versioned merge patches (see app/delta.py).
+WS_SNAPSHOT_EVERY = int(os.getenv("WS_SNAPSHOT_EVERY", "20"))
+WS_MAX_UNACKED = int(os.getenv("WS_MAX_UNACKED", "8"))
+
 
 @router.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
+    loop = asyncio.get_running_loop()
+    send_lock = asyncio.Lock()
+    # End-of-thought timers, one per session on this connection. The pause rule has to
+    # fire when the speaker goes silent, i.e. exactly when no new frame will arrive.
+    timers: dict[str, asyncio.TimerHandle] = {}
+    pending: set[asyncio.Task] = set()
+    # Frames are queued by the reader and drained (coalesced) by the processor, so a burst
+    # of deltas behind a slow turn is handled once against the latest text.
+    inbox: deque[DeltaIn] = deque()
+    wake = asyncio.Event()
+    # Cancel flags for in-flight speculative turns, per session.
+    inflight: dict[str, threading.Event] = {}
+    encoder = (
+        DeltaEncoder(snapshot_every=WS_SNAPSHOT_EVERY, max_unacked=WS_MAX_UNACKED)
+        if ws.query_params.get("proto") == "delta" else None
+    )
+
+    def speculative_cancel(session_id: str) -> threading.Event:
+        ev = threading.Event()
+        inflight[session_id] = ev
+        return ev
+
+    async def send(frame: dict) -> None:
+        async with send_lock:
+            await ws.send_json(frame)
+
+    async def send_emit(session_id: str, frame: dict) -> None:
+        async with send_lock:
+            # Encode under the send lock so versions reach the client in order.
+            if encoder is not None:
+                frame = encoder.encode(session_id, frame)
+            await ws.send_json(frame)
+
+    def on_partial(payload: dict) -> None:
+        # Called from the turn worker thread while the drafter streams; block it until the
+        # frame is on the wire so partials always precede the terminal frame.
+        frame = {"emit": True, "kind": "final", "partial": True, "data": payload, "reason": "streaming"}
+        try:
+            asyncio.run_coroutine_threadsafe(send(frame), loop).result(timeout=5)
+        except Exception as e:
+            print(f"[ws] partial send failed: {e}", flush=True)
+
+    async def on_pause(session_id: str) -> None:
+        try:
+            state = sessions.get(session_id)
+            if state is None:
+                return
+
+            async def turn():
+                if not state.buffer_text.strip() or not DETECTOR.should_emit(state):
+                    return None
+                return await maybe_emit_async(
+                    state, final=False, detector=DETECTOR, cancel=speculative_cancel(session_id)
+                )
+
+            res = await run_locked(state, turn, store=sessions, save_if=lambda r: r is not None and r.emit)
+            if res is not None and res.emit:
+                res.reason = "pause"
+                await send_emit(session_id, emit_response(state, res))
+        except Exception as e:
+            print(f"[ws] pause emit failed sid={session_id}: {e}", flush=True)
+
+    def fire(session_id: str) -> None:
+        timers.pop(session_id, None)
+        task = loop.create_task(on_pause(session_id))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    def arm(state: AgentState) -> None:
+        old = timers.pop(state.session_id, None)
+        if old is not None:
+            old.cancel()
+        if not state.buffer_text.strip():
+            return
+        pause_s = DETECTOR.pause_ms / 1000.0
+        delay = min(pause_s, max(0.0, pause_s - (time.time() - state.last_token_ts)))
+        timers[state.session_id] = loop.call_later(delay, fire, state.session_id)
+
+    async def handle(data: DeltaIn) -> None:
+        state = sessions.get_or_create(data.session_id)
+        speaker = data.speaker
+
+        # Turns run on the worker pool; run_locked holds the session's turn lock, so frames
+        # for one session stay ordered while other sessions keep flowing on the event loop.
+        # Keystroke frames that emit nothing and change no setting are not saved.
+        dirty = False
+
+        async def apply() -> IngestResult:
+            nonlocal dirty
+            dirty = False
+            # Touch session activity and track roles
+            state.last_seen_at = time.time()
+            if speaker and speaker not in state.roles:
+                # Default role label is the speaker label itself; can be refined later.
+                state.roles[speaker] = speaker
+                dirty = True
+
+            # Optional session mode switch (coach vs notes).
+            if data.session_mode in ("coach", "notes") and state.mode != data.session_mode:
+                state.mode = data.session_mode
+                dirty = True
+            if data.corpus and state.corpus != data.corpus:
+                state.corpus = data.corpus
+                dirty = True
+
+            # Support both append-delta and replace semantics.
+            if (data.mode or "append") == "replace":
+                # If speaker changes while we have buffered text, flush first to preserve separation.
+                if speaker and state.buffer_text.strip() and state.buffer_speaker != speaker:
+                    flushed = await maybe_emit_async(state, final=True, detector=DETECTOR)
+                    dirty = dirty or flushed.emit
+                    if flushed.kind == "final":
+                        NOTES_REFINER.schedule(state, push=send_emit)
+                state.buffer_text = (data.text or "").strip()
+                if speaker:
+                    state.buffer_speaker = speaker
+                state.last_token_ts = data.ts if data.ts is not None else time.time()
+            else:
+                delta = data.text_delta if data.text_delta is not None else (data.text or "")
+                append_delta(state, delta, ts=data.ts, speaker=speaker)
+
+            res = await maybe_emit_async(
+                state,
+                final=bool(data.final),
+                detector=DETECTOR,
+                on_partial=on_partial,
+                cancel=None if data.final else speculative_cancel(data.session_id),
+            )
+            arm(state)
+            return res
+
+        res = await run_locked(state, apply, store=sessions, save_if=lambda r: r.emit or dirty)
+        await send_emit(data.session_id, emit_response(state, res))
+        if res.kind == "final":
+            # Heuristic notes are already out; the LLM pass follows as its own notes_final frame.
+            NOTES_REFINER.schedule(state, push=send_emit)
+
+    async def process() -> None:
+        while True:
+            await wake.wait()
+            wake.clear()
+            while inbox:
+                batch = coalesce(list(inbox))
+                inbox.clear()
+                for data in batch:
+                    try:
+                        await handle(data)
+                    except Exception as e:
+                        await send({"error": str(e)})
+
+    processor = loop.create_task(process())
     try:
         while True:
             raw = await ws.receive_text()
             try:
                 payload = json.loads(raw)
+                if encoder is not None and isinstance(payload, dict) and ("ack" in payload or "resync" in payload):
+                    sid = str(payload.get("session_id", ""))
+                    if payload.get("resync"):
+                        encoder.resync(sid)
+                    else:
+                        encoder.ack(sid, int(payload["ack"]))
+                    continue
                 data = DeltaIn(**payload)
-                state = sessions.setdefault(data.session_id, AgentState(session_id=data.session_id))
-                speaker = data.speaker
-
-                # Touch session activity and track roles
-                state.last_seen_at = time.time()
-                if speaker:
-                    # Default role label is the speaker label itself; can be refined later.
-                    state.roles.setdefault(speaker, speaker)
-
-                # Optional session mode switch (coach vs notes).
-                if data.session_mode in ("coach", "notes"):
-                    state.mode = data.session_mode
-
-                # Support both append-delta and replace semantics.
-                if (data.mode or "append") == "replace":
-                    # If speaker changes while we have buffered text, flush first to preserve separation.
-                    if speaker and state.buffer_text.strip() and state.buffer_speaker != speaker:
-                        _ = maybe_emit(state, final=True, detector=DETECTOR)
-                    state.buffer_text = (data.text or "").strip()
-                    if speaker:
-                        state.buffer_speaker = speaker
-                    state.last_token_ts = data.ts if data.ts is not None else time.time()
-                else:
-                    delta = data.text_delta if data.text_delta is not None else (data.text or "")
-                    append_delta(state, delta, ts=data.ts, speaker=speaker)
-
-                res = maybe_emit(state, final=bool(data.final), detector=DETECTOR)
-                if res.emit:
-                    out = dict(res.data) if res.data else {}
-                    out["created_at"] = getattr(state, "created_at", None)
-                    out["last_seen_at"] = getattr(state, "last_seen_at", None)
-                    if out.get("usage") is not None and isinstance(out["usage"], dict):
-                        out["usage"]["created_at"] = out["created_at"]
-                        out["usage"]["last_seen_at"] = out["last_seen_at"]
-                    await ws.send_json(
-                        {"emit": True, "kind": res.kind, "data": out, "reason": res.reason}
-                    )
-                else:
-                    await ws.send_json({"emit": False, "kind": res.kind, "reason": res.reason})
             except Exception as e:
-                await ws.send_json({"error": str(e)})
+                await send({"error": str(e)})
+                continue
+            # Newer text makes an in-flight speculative turn for this session obsolete.
+            if data.text or data.text_delta:
+                ev = inflight.pop(data.session_id, None)
+                if ev is not None:
+                    ev.set()
+            inbox.append(data)
+            wake.set()
     except WebSocketDisconnect:
         print("WebSocket disconnected")
+    finally:
+        processor.cancel()
+        NOTES_REFINER.detach(send_emit)
+        for h in timers.values():
+            h.cancel()
+        for t in pending:
+            t.cancel()
@@ -1,16 +1,29 @@
-import os, glob, json
-from typing import List
+import os, sys, glob, json, argparse, hashlib, shutil, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
 import numpy as np
 import faiss
-from openai import OpenAI
+
+# Allow `python scripts/build_index.py` from the repo root to import the app package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.bm25 import build_bm25, write_bm25  # noqa: E402
+from app.embeddings import EmbeddingBackend, make_backend  # noqa: E402
+from app.metastore import write_meta_store  # noqa: E402
+from app.retriever import INDEX_TYPES, INFO_FILE, METRICS, build_faiss_index  # noqa: E402
 
 DATA_DIR = "data"
 OUT_DIR = "store"
-EMBED_MODEL = "text-embedding-3-small"  # 1536-dim
+EMBEDDER: Optional[EmbeddingBackend] = None  # set from --embedder / EMBED_BACKEND in main()
+EMBED_BATCH = 256          # inputs per embeddings.create call (API max is 2048)
+EMBED_CONCURRENCY = 4      # embedding requests in flight
+EMBED_RETRIES = 3
+CHECKPOINT_DIR = "embed_checkpoint"  # under the output dir; one .npy per completed batch
 CHUNK_CHARS = 800
 OVERLAP = 150
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+MANIFEST_FILE = "manifest.json"  # file hashes, chunk hashes -> stable FAISS ids
+VECTORS_FILE = "vectors.npy"     # raw embeddings, row-aligned with VECTOR_IDS_FILE
+VECTOR_IDS_FILE = "vector_ids.npy"
 
 def read_text(path: str) -> str:
     with open(path, "r", encoding="utf-8", errors="ignore") as f:
@@ -26,43 +39,267 @@ def chunk_text(txt: str, size: int = CHUNK_CHARS, overlap: int = OVERLAP) -> Lis
         i = max(0, end - overlap)
     return chunks
 
-def embed_texts(texts: List[str]) -> np.ndarray:
-    resp = client.embeddings.create(model=EMBED_MODEL, input=texts)
-    vecs = [d.embedding for d in resp.data]
-    return np.array(vecs, dtype="float32")
+def sha1(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
 
-def main():
-    os.makedirs(OUT_DIR, exist_ok=True)
-    files = sorted(glob.glob(os.path.join(DATA_DIR, "*")))
-    if not files:
-        raise SystemExit("Put some .txt/.md files in ./data first.")
+def chunk_key(source: str, text: str) -> str:
+    return sha1(f"{source}\x00{text}")
+
+def embedder() -> EmbeddingBackend:
+    global EMBEDDER
+    if EMBEDDER is None:
+        EMBEDDER = make_backend()
+    return EMBEDDER
+
+def embed_model_name() -> str:
+    return embedder().name
+
+def embed_batch(texts: List[str]) -> np.ndarray:
+    """One embeddings request."""
+    return embedder().embed(texts)[0]
+
+def _embed_and_checkpoint(texts: List[str], path: Optional[str]) -> np.ndarray:
+    for attempt in range(EMBED_RETRIES):
+        try:
+            vecs = embed_batch(texts)
+            break
+        except Exception as e:
+            if attempt == EMBED_RETRIES - 1:
+                raise
+            print(f"[embed] batch failed ({e}); retrying", flush=True)
+            time.sleep(2 ** attempt)
+    if path:
+        save_npy(path, vecs)
+    return vecs
+
+def embed_texts(
+    texts: List[str],
+    *,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    checkpoint_dir: Optional[str] = None,
+) -> np.ndarray:
+    """Embed in batches with bounded concurrency.
+
+    With `checkpoint_dir`, each finished batch is saved under a name derived from its
+    texts and the model, so an interrupted run resumes with only the missing batches.
+    """
+    batch_size = max(1, batch_size or EMBED_BATCH)
+    concurrency = max(1, concurrency or EMBED_CONCURRENCY)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    results: List[Optional[np.ndarray]] = [None] * len(batches)
+    paths: List[Optional[str]] = [None] * len(batches)
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        model = embed_model_name()
+        for b, batch in enumerate(batches):
+            paths[b] = os.path.join(checkpoint_dir, sha1(model + "\x00" + "\x00".join(batch)) + ".npy")
+            if os.path.exists(paths[b]):
+                results[b] = np.load(paths[b])
+    pending = [b for b, r in enumerate(results) if r is None]
+    if len(pending) < len(batches):
+        print(f"[embed] resuming: {len(batches) - len(pending)}/{len(batches)} batches from checkpoint", flush=True)
+
+    t0 = time.perf_counter()
+    done_chunks = 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(_embed_and_checkpoint, batches[b], paths[b]): b for b in pending}
+        for n, fut in enumerate(as_completed(futures), 1):
+            b = futures[fut]
+            try:
+                results[b] = fut.result()
+            except Exception:
+                for f in futures:
+                    f.cancel()  # batches already in flight still finish and checkpoint
+                raise
+            done_chunks += len(batches[b])
+            rate = done_chunks / max(1e-9, time.perf_counter() - t0)
+            print(f"[embed] {n}/{len(pending)} batches, {done_chunks} chunks, {rate:.0f} chunks/s", flush=True)
+    if not results:
+        return np.zeros((0, 0), dtype="float32")
+    return np.concatenate(results)
 
-    docs = []
-    for fp in files:
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Build the FAISS store from ./data")
+    p.add_argument("--data-dir", default=DATA_DIR)
+    p.add_argument("--out-dir", default=OUT_DIR)
+    p.add_argument("--full", action="store_true", help="ignore the manifest and re-embed everything")
+    p.add_argument("--embedder", choices=("openai", "hash", "local", "st"), default=None,
+                   help="embedding backend (default: EMBED_BACKEND or openai); hash/local needs no API key")
+    p.add_argument("--batch-size", type=int, default=EMBED_BATCH, help="inputs per embeddings request")
+    p.add_argument("--concurrency", type=int, default=EMBED_CONCURRENCY, help="embedding requests in flight")
+    p.add_argument("--index", choices=INDEX_TYPES, default="flat",
+                   help="flat = exact scan; ivf_flat / ivf_pq / hnsw = approximate, for large corpora")
+    p.add_argument("--metric", choices=METRICS, default="cosine",
+                   help="cosine = inner product over normalized vectors (absolute scores); l2 = legacy")
+    p.add_argument("--nlist", type=int, default=0, help="IVF lists (default 4*sqrt(n))")
+    p.add_argument("--pq-m", type=int, default=16, help="IVF-PQ sub-quantizers")
+    p.add_argument("--pq-nbits", type=int, default=8, help="IVF-PQ bits per sub-quantizer")
+    p.add_argument("--hnsw-m", type=int, default=32, help="HNSW neighbors per node")
+    p.add_argument("--ef-construction", type=int, default=80, help="HNSW build beam width")
+    return p.parse_args(argv)
+
+# -------- Incremental state --------
+def load_manifest(out_dir: str) -> Dict[str, Any]:
+    """Previous build's manifest, or an empty one if missing or built with another model."""
+    model = embed_model_name()
+    empty = {"embed_model": model, "files": {}, "chunks": {}, "next_id": 0}
+    path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return empty
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("embed_model") != model:
+        print(f"Embedding model changed ({manifest.get('embed_model')} -> {model}); re-embedding all chunks.")
+        return empty
+    return manifest
+
+def load_vectors(out_dir: str) -> Dict[int, np.ndarray]:
+    vec_path = os.path.join(out_dir, VECTORS_FILE)
+    ids_path = os.path.join(out_dir, VECTOR_IDS_FILE)
+    if not (os.path.exists(vec_path) and os.path.exists(ids_path)):
+        return {}
+    vecs = np.load(vec_path, mmap_mode="r")
+    ids = np.load(ids_path)
+    return {int(i): vecs[r] for r, i in enumerate(ids)}
+
+def collect_docs(data_dir: str, manifest: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """Chunk every usable file; files whose content hash is unchanged reuse their chunk list."""
+    docs: List[Dict[str, Any]] = []
+    files: Dict[str, Any] = {}
+    for fp in sorted(glob.glob(os.path.join(data_dir, "*"))):
         base = os.path.basename(fp)
         if not any(base.lower().endswith(ext) for ext in (".txt", ".md")):
             continue
         raw = read_text(fp)
         if not raw.strip():
             continue
-        for idx, ch in enumerate(chunk_text(raw)):
+        digest = sha1(raw)
+        prev = manifest["files"].get(base)
+        chunks = prev["chunks"] if prev and prev["sha1"] == digest else chunk_text(raw)
+        files[base] = {"sha1": digest, "chunks": chunks}
+        for idx, ch in enumerate(chunks):
             docs.append({"id": f"{base}::chunk{idx}", "text": ch, "source": base})
+    return docs, files
+
+def plan_ids(docs: List[Dict[str, Any]], manifest: Dict[str, Any], cached: Dict[int, np.ndarray]):
+    """Assign stable FAISS ids; returns (docs needing embeddings, ids no longer present)."""
+    known: Dict[str, int] = manifest["chunks"]
+    next_id = int(manifest["next_id"])
+    chunks: Dict[str, int] = {}
+    todo: List[Dict[str, Any]] = []
+    for d in docs:
+        key = chunk_key(d["source"], d["text"])
+        if key in chunks:  # same text twice in one file: index it once per occurrence
+            key = sha1(f"{key}\x00{d['id']}")
+        fid = known.get(key)
+        if fid is None or fid not in cached:
+            fid = next_id
+            next_id += 1
+            todo.append(d)
+        chunks[key] = fid
+        d["faiss_id"] = fid
+    live = set(chunks.values())
+    removed = sorted(i for i in known.values() if i not in live)
+    manifest.update(chunks=chunks, next_id=next_id)
+    return todo, removed
+
+def save_npy(path: str, arr: np.ndarray) -> None:
+    # Write-then-rename: the previous file may still be memory-mapped by load_vectors.
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, arr)
+    os.replace(path + ".tmp", path)
+
+def reuse_flat_index(out_dir: str, metric: str, index_type: str, prev_info: Dict[str, Any]):
+    """The previous id-mapped flat index, if it can be patched in place."""
+    path = os.path.join(out_dir, "index.faiss")
+    if index_type != "flat" or not os.path.exists(path):
+        return None
+    if prev_info.get("index_type") != "flat" or prev_info.get("metric") != metric or not prev_info.get("id_mapped"):
+        return None
+    return faiss.read_index(path)
+
+def main(argv=None):
+    global EMBEDDER
+    args = parse_args(argv)
+    EMBEDDER = make_backend(args.embedder)
+    out_dir = args.out_dir
+    os.makedirs(out_dir, exist_ok=True)
+    if not glob.glob(os.path.join(args.data_dir, "*")):
+        raise SystemExit("Put some .txt/.md files in ./data first.")
 
+    manifest = {"embed_model": embed_model_name(), "files": {}, "chunks": {}, "next_id": 0} if args.full else load_manifest(out_dir)
+    cached = {} if args.full or not manifest["chunks"] else load_vectors(out_dir)
+    docs, files = collect_docs(args.data_dir, manifest)
     if not docs:
         raise SystemExit("No usable text found to index.")
+    todo, removed = plan_ids(docs, manifest, cached)
+    manifest["files"] = files
 
-    print(f"Embedding {len(docs)} chunks...")
-    vecs = embed_texts([d["text"] for d in docs])
+    print(f"{len(docs)} chunks: {len(docs) - len(todo)} unchanged, {len(todo)} to embed, {len(removed)} removed")
+    if todo:
+        new_vecs = embed_texts(
+            [d["text"] for d in todo], batch_size=args.batch_size, concurrency=args.concurrency,
+            checkpoint_dir=os.path.join(out_dir, CHECKPOINT_DIR),
+        )
+        for d, v in zip(todo, new_vecs):
+            cached[d["faiss_id"]] = v
+    ids = np.array(sorted(d["faiss_id"] for d in docs), dtype="int64")
+    vecs = np.stack([np.asarray(cached[int(i)], dtype="float32") for i in ids])
     dim = vecs.shape[1]
 
-    index = faiss.IndexFlatL2(dim)
-    index.add(vecs)
+    prev_info: Dict[str, Any] = {}
+    info_path = os.path.join(out_dir, INFO_FILE)
+    if os.path.exists(info_path) and not args.full:
+        with open(info_path, "r", encoding="utf-8") as f:
+            prev_info = json.load(f)
+    index = reuse_flat_index(out_dir, args.metric, args.index, prev_info)
+    params: Dict[str, Any] = {}
+    if index is not None and index.d != dim:
+        index = None
+    if index is not None:
+        # Flat: patch the previous index in place, O(changed chunks).
+        if removed:
+            index.remove_ids(np.array(removed, dtype="int64"))
+        if todo:
+            add = np.array([cached[d["faiss_id"]] for d in todo], dtype="float32")
+            if args.metric == "cosine":
+                faiss.normalize_L2(add)
+            index.add_with_ids(add, np.array([d["faiss_id"] for d in todo], dtype="int64"))
+        if index.ntotal != len(ids):
+            print("Previous index is out of sync with the manifest; rebuilding it.")
+            index = None
+    if index is None:
+        # Trained indexes are rebuilt, but from cached vectors: only new chunks were embedded.
+        index, params = build_faiss_index(
+            vecs, args.index, metric=args.metric, ids=ids,
+            nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits,
+            hnsw_m=args.hnsw_m, ef_construction=args.ef_construction,
+        )
 
-    faiss.write_index(index, os.path.join(OUT_DIR, "index.faiss"))
-    with open(os.path.join(OUT_DIR, "meta.json"), "w", encoding="utf-8") as f:
-        json.dump(docs, f, ensure_ascii=False, indent=2)
+    # Write-then-rename so a server watching the store never reads a half-written index.
+    faiss.write_index(index, os.path.join(out_dir, "index.faiss.tmp"))
+    os.replace(os.path.join(out_dir, "index.faiss.tmp"), os.path.join(out_dir, "index.faiss"))
+    # meta.idx/meta.bin are what the server loads; meta.json stays for inspection.
+    write_meta_store(out_dir, docs)
+    by_id = sorted(docs, key=lambda d: d["faiss_id"])
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(by_id, f, ensure_ascii=False, indent=2)
+    # Keyword index: cheap to rebuild in full, needs no embeddings.
+    write_bm25(out_dir, build_bm25([d["text"] for d in by_id], [d["faiss_id"] for d in by_id]))
+    save_npy(os.path.join(out_dir, VECTORS_FILE), vecs)
+    save_npy(os.path.join(out_dir, VECTOR_IDS_FILE), ids)
+    with open(os.path.join(out_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    with open(info_path, "w", encoding="utf-8") as f:
+        json.dump({"index_type": args.index, "params": params or prev_info.get("params", {}), "dim": dim,
+                   "ntotal": int(index.ntotal), "metric": args.metric, "embed_model": embed_model_name(),
+                   "embed_backend": type(EMBEDDER).__name__,
+                   "id_mapped": True}, f, indent=2)
 
-    print(f"OK: {len(docs)} chunks → store/index.faiss (dim={dim})")
+    # Everything is in vectors.npy now; the batch checkpoints are only needed mid-run.
+    shutil.rmtree(os.path.join(out_dir, CHECKPOINT_DIR), ignore_errors=True)
+    print(f"OK: {len(docs)} chunks → {out_dir}/index.faiss ({args.index}, dim={dim})")
 
 if __name__ == "__main__":
     main()
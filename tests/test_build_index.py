@@ -0,0 +1,111 @@
+"""Incremental rebuilds of the FAISS store (scripts/build_index.py) with a stand-in embedder."""
+import importlib.util
+from pathlib import Path
+
+import numpy as np
+
+from app.embeddings import HashingBackend
+from app.retriever import Retriever
+
+_SPEC = importlib.util.spec_from_file_location(
+    "build_index", Path(__file__).resolve().parent.parent / "scripts" / "build_index.py"
+)
+build_index = importlib.util.module_from_spec(_SPEC)
+_SPEC.loader.exec_module(build_index)
+
+
+def _fake_embedder(monkeypatch, calls):
+    def embed(texts, **kwargs):
+        calls.append(list(texts))
+        out = []
+        for t in texts:
+            rng = np.random.default_rng(abs(hash(t)) % (2**32))
+            out.append(rng.standard_normal(16))
+        return np.array(out, dtype="float32")
+
+    monkeypatch.setattr(build_index, "embed_texts", embed)
+
+
+def _run(data, out, *extra):
+    build_index.main(["--data-dir", str(data), "--out-dir", str(out), *extra])
+
+
+def test_rebuild_embeds_only_changed_chunks(tmp_path, monkeypatch):
+    calls = []
+    _fake_embedder(monkeypatch, calls)
+    data, out = tmp_path / "data", tmp_path / "store"
+    data.mkdir()
+    (data / "a.md").write_text("alpha " * 300)
+    (data / "b.txt").write_text("bravo " * 100)
+    _run(data, out)
+    first = sum(len(c) for c in calls)
+    assert first > 2
+
+    calls.clear()
+    _run(data, out)
+    assert calls == []  # nothing changed
+
+    (data / "c.txt").write_text("charlie delta echo")
+    (data / "b.txt").unlink()
+    _run(data, out)
+    assert calls == [["charlie delta echo"]]
+
+    r = Retriever(str(out)).load()
+    assert r.index.ntotal == len(r.meta) == first  # b.txt (one chunk) out, c.txt in
+    assert not any(r.meta[i]["source"] == "b.txt" for i in range(len(r.meta)))
+    qv = build_index.embed_texts(["charlie delta echo"])[0]
+    assert r.search(qv, k=1)[0]["id"] == "c.txt::chunk0"
+
+
+def test_trained_index_is_rebuilt_from_cached_vectors(tmp_path, monkeypatch):
+    calls = []
+    _fake_embedder(monkeypatch, calls)
+    data, out = tmp_path / "data", tmp_path / "store"
+    data.mkdir()
+    for i in range(6):
+        (data / f"n{i}.md").write_text(f"note {i} " * 150)
+    _run(data, out, "--index", "hnsw")
+    calls.clear()
+    (data / "n6.md").write_text("a brand new note")
+    _run(data, out, "--index", "hnsw")
+    assert calls == [["a brand new note"]]
+    r = Retriever(str(out)).load()
+    assert r.index_type == "hnsw" and r.index.ntotal == len(r.meta)
+    assert r.search(build_index.embed_texts(["a brand new note"])[0], k=1)[0]["id"] == "n6.md::chunk0"
+
+
+def test_interrupted_embedding_resumes_from_checkpoint(tmp_path, monkeypatch):
+    data, out = tmp_path / "data", tmp_path / "store"
+    data.mkdir()
+    for i in range(10):
+        (data / f"doc{i}.txt").write_text(f"document number {i} about topic {i % 3}")
+    real = build_index.embed_batch
+    calls = []
+
+    def flaky(texts):
+        calls.append(len(texts))
+        if len(calls) == 3:
+            raise RuntimeError("rate limited")
+        return real(texts)
+
+    monkeypatch.setattr(build_index, "embed_batch", flaky)
+    monkeypatch.setattr(build_index, "EMBED_RETRIES", 1)
+    args = ["--embedder", "local", "--batch-size", "2", "--concurrency", "1"]
+    try:
+        _run(data, out, *args)
+    except RuntimeError:
+        pass
+    else:
+        raise AssertionError("expected the third batch to fail")
+    saved = len(list((out / "embed_checkpoint").glob("*.npy")))
+    assert 2 <= saved < 5
+
+    calls.clear()
+    _run(data, out, *args)
+    assert calls == [2] * (5 - saved)  # only the batches that never finished
+    assert not (out / "embed_checkpoint").exists()
+
+    r = Retriever(str(out)).load()
+    assert r.info["embed_model"].startswith("local-hash")
+    qv = HashingBackend().embed(["document number 7 about topic 1"])[0][0]
+    assert r.search(qv, k=1)[0]["id"] == "doc7.txt::chunk0"
@@ -0,0 +1,130 @@
+"""Tests for the model-call caches."""
+import numpy as np
+
+import app.agent as agent
+from app.agent import AgentState
+from app.cache import EmbeddingCache
+from app.embeddings import OpenAIBackend
+
+
+def test_embedding_cache_lru_and_normalized_keys():
+    cache = EmbeddingCache(max_entries=2, ttl_s=0)
+    cache.put("m", "Hello  World", np.ones(4), tokens=3)
+    cache.put("m", "second", np.zeros(4))
+    vec, tokens = cache.get("m", "hello world")
+    assert tokens == 3 and vec.tolist() == [1, 1, 1, 1]
+    assert cache.get("other-model", "hello world") is None
+
+    cache.put("m", "third", np.full(4, 2.0))  # evicts "second" (least recently used)
+    assert cache.get("m", "second") is None
+    assert cache.get("m", "hello world") is not None
+    assert cache.get("m", "third")[0].tolist() == [2, 2, 2, 2]
+
+
+def test_embedding_cache_ttl(monkeypatch):
+    import app.cache as cache_mod
+    now = [1000.0]
+    monkeypatch.setattr(cache_mod.time, "time", lambda: now[0])
+    cache = EmbeddingCache(max_entries=4, ttl_s=10)
+    cache.put("m", "x", np.ones(2))
+    now[0] += 5
+    assert cache.get("m", "x") is not None
+    now[0] += 6
+    assert cache.get("m", "x") is None
+
+
+def test_embedding_cache_persists(tmp_path):
+    cache = EmbeddingCache(max_entries=8, ttl_s=0, persist_dir=str(tmp_path))
+    cache.put("m", "persist me", np.arange(3, dtype="float32"), tokens=2)
+    cache.flush()
+
+    reopened = EmbeddingCache(max_entries=8, ttl_s=0, persist_dir=str(tmp_path))
+    vec, tokens = reopened.get("m", "persist me")
+    assert vec.tolist() == [0, 1, 2] and tokens == 2
+
+
+def test_embedding_cache_crash_after_row_reuse_is_a_miss(tmp_path):
+    cache = EmbeddingCache(max_entries=2, ttl_s=0, persist_dir=str(tmp_path))
+    cache.put("m", "a", np.zeros(3, dtype="float32"))
+    cache.put("m", "b", np.ones(3, dtype="float32"))
+    cache.flush()
+    cache.put("m", "c", np.full(3, 2.0, dtype="float32"))  # reuses a's row; index not flushed
+
+    # A process killed here left the saved index mapping "a" to c's row.
+    reopened = EmbeddingCache(max_entries=2, ttl_s=0, persist_dir=str(tmp_path))
+    assert reopened.get("m", "a") is None
+    assert reopened.get("m", "b")[0].tolist() == [1, 1, 1]
+
+
+def test_embed_query_cache_counters(monkeypatch):
+    calls = []
+
+    class _Usage:
+        prompt_tokens = 7
+
+    class _Rsp:
+        usage = _Usage()
+        data = [type("D", (), {"embedding": [0.1, 0.2, 0.3]})()]
+
+    class _Client:
+        class embeddings:
+            @staticmethod
+            def create(model, input):
+                calls.append(input)
+                return _Rsp()
+
+    backend = OpenAIBackend()
+    backend._client = _Client()
+    monkeypatch.setattr(agent, "EMBEDDER", backend)
+    monkeypatch.setattr(agent, "EMBED_CACHE", EmbeddingCache(max_entries=16, ttl_s=0))
+
+    state = AgentState(session_id="emb1")
+    v1 = agent.embed_query("Tell me about yourself.", state=state)
+    v2 = agent.embed_query("tell me about  yourself.", state=state)
+    assert len(calls) == 1
+    assert np.allclose(v1, v2)
+    row = state.usage["embed_cache"]
+    assert row["hits"] == 1 and row["misses"] == 1 and row["tokens_saved"] == 7
+
+
+def test_classifier_cache_prefix_policy():
+    from app.cache import ClassifierCache
+    cache = ClassifierCache(max_growth_words=4)
+    cache.store("Tell me about a time you led", {"intent": "behavioral"})
+    assert cache.lookup("tell me about a time you led") is not None
+    assert cache.lookup("Tell me about a time you led a project") is not None
+    # A revised word may be a different question: never a hit
+    assert cache.lookup("Tell me about a time you lead the team") is None
+    cache.store("Tell me about yourself", {"intent": "behavioral"})
+    assert cache.lookup("Tell me about compensation") is None
+    cache.store("What is your expected salary", {"intent": "compensation"})
+    assert cache.lookup("What is your expected start date") is None
+    # Too much new text, or a different utterance
+    assert cache.lookup("Tell me about a time you led a big cross team migration effort") is None
+    assert cache.lookup("What are your salary expectations") is None
+
+
+def test_speculative_classification_reused_by_final(monkeypatch):
+    from app.pipeline import maybe_emit
+    from app.agent import EndOfThought
+    calls = []
+
+    def fake_classify(text: str, **kwargs):
+        calls.append(text)
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return []
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+
+    state = AgentState(session_id="cls1")
+    state.buffer_text = "Tell me about a time you led a project"
+    state.last_token_ts = 0
+    res = maybe_emit(state, final=False, detector=EndOfThought(pause_ms=0, min_words=3))
+    assert res.kind == "speculative"
+
+    state.buffer_text = "Tell me about a time you led a project end to end?"
+    res = maybe_emit(state, final=True, detector=EndOfThought())
+    assert res.kind == "final"
+    assert len(calls) == 1
+    assert state.usage["classifier_cache"]["hits"] == 1
@@ -0,0 +1,102 @@
+"""Per-session corpora: CorpusCache loading/eviction and retrieval routing."""
+import faiss
+import numpy as np
+import pytest
+from pydantic import ValidationError
+
+import app.agent as agent
+from app.agent import AgentState
+from app.corpora import CorpusCache
+from app.embeddings import HashingBackend
+from app.metastore import write_meta_store
+from app.retriever import build_faiss_index
+from app.schemas import DeltaIn
+
+
+def _build(root, corpus, n=20, seed=0):
+    path = root / corpus
+    path.mkdir(parents=True)
+    vecs = np.random.default_rng(seed).standard_normal((n, 8)).astype("float32")
+    index, _ = build_faiss_index(vecs, "flat")
+    faiss.write_index(index, str(path / "index.faiss"))
+    write_meta_store(str(path), [{"id": f"{corpus}::{i}", "text": str(i), "source": corpus} for i in range(n)])
+    return vecs
+
+
+def test_cache_loads_once_and_evicts_lru_by_bytes(tmp_path):
+    for i, c in enumerate(["alice", "bob", "carol"]):
+        _build(tmp_path, c, seed=i)
+    one = (tmp_path / "alice" / "index.faiss").stat().st_size
+    cache = CorpusCache(str(tmp_path), max_bytes=2 * one)
+
+    a = cache.get("alice")
+    assert cache.get("alice") is a and cache.loads == 1
+    cache.get("bob")
+    cache.get("alice")  # alice is now most recent
+    cache.get("carol")  # over budget: bob goes
+    assert [r["corpus"] for r in cache.stats()["loaded"]] == ["alice", "carol"]
+    assert cache.evicted == 1
+    assert cache.get("nobody") is None
+
+
+def test_corpus_size_counts_the_keyword_index(tmp_path):
+    from app.bm25 import build_bm25, write_bm25
+    from app.corpora import retriever_bytes
+
+    _build(tmp_path, "plain")
+    _build(tmp_path, "keyword")
+    texts = [" ".join(f"term{i}_{j}" for j in range(50)) for i in range(20)]
+    write_bm25(str(tmp_path / "keyword"), build_bm25(texts, range(20)))
+    cache = CorpusCache(str(tmp_path))
+
+    plain, keyword = cache.get("plain"), cache.get("keyword")
+    assert keyword.bm25 is not None and keyword.bm25.nbytes() > 20 * 50 * 12
+    assert retriever_bytes(keyword) == retriever_bytes(plain) + keyword.bm25.nbytes()
+
+
+def test_failed_load_is_cached_until_the_index_changes(tmp_path, monkeypatch):
+    import os
+
+    from app.retriever import Retriever
+
+    (tmp_path / "broken").mkdir()
+    idx = tmp_path / "broken" / "index.faiss"
+    idx.write_bytes(b"not an index")
+    loads = []
+    real_load = Retriever.load
+    monkeypatch.setattr(Retriever, "load", lambda self: loads.append(self.store_dir) or real_load(self))
+    cache = CorpusCache(str(tmp_path))
+
+    assert cache.get("broken") is None and cache.get("broken") is None
+    assert len(loads) == 1 and cache.stats()["failed"] == ["broken"]
+
+    # Rebuilt on disk: the next lookup tries again.
+    idx.unlink()
+    (tmp_path / "broken").rmdir()
+    _build(tmp_path, "broken")
+    st = idx.stat()
+    os.utime(idx, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+    assert cache.get("broken") is not None
+    assert len(loads) == 2 and cache.stats()["failed"] == []
+
+
+def test_retrieve_context_uses_the_session_corpus(tmp_path, monkeypatch):
+    alice = _build(tmp_path, "alice", seed=1)
+    monkeypatch.setattr(agent, "CORPORA", CorpusCache(str(tmp_path)))
+    monkeypatch.setattr(agent, "RETRIEVER", None)
+    monkeypatch.setattr(agent, "SEARCH_BATCHER", None)
+    monkeypatch.setattr(agent, "EMBEDDER", HashingBackend(dim=8))
+    monkeypatch.setattr(agent, "embed_query", lambda text, state=None: alice[5])
+
+    st = AgentState(session_id="s1", corpus="alice")
+    assert agent.retrieve_context("anything", k=1, state=st)[0]["id"] == "alice::5"
+    # A corpus without a built store returns nothing rather than the shared store.
+    st.corpus = "bob"
+    assert agent.retrieve_context("anything", k=1, state=st) == []
+
+
+def test_corpus_ids_are_validated():
+    assert DeltaIn(session_id="s", corpus="alice_2").corpus == "alice_2"
+    for bad in ("../etc", "a/b", "", "x" * 65):
+        with pytest.raises(ValidationError):
+            DeltaIn(session_id="s", corpus=bad)
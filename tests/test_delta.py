@@ -0,0 +1,98 @@
+"""Delta-encoded emit frames (app/delta.py and /ws?proto=delta)."""
+from starlette.testclient import TestClient
+
+import app.agent as agent
+from app.delta import DeltaEncoder, apply_merge_patch, merge_diff
+from app.server import app
+
+
+def _frame(usage, notes=None):
+    data = {"response_type": "notes_final" if notes is not None else "coach_final", "usage": usage}
+    if notes is not None:
+        data["notes_final"] = {"notes": notes}
+    return {"emit": True, "kind": "final", "data": data, "reason": "final"}
+
+
+def test_merge_diff_round_trips():
+    old = {"usage": {"cost_usd_total": 0.1, "by_model": {"m": {"tokens": 5}}}, "notes": {"bullets": ["a"], "x": 1}}
+    new = {"usage": {"cost_usd_total": 0.2, "by_model": {"m": {"tokens": 5}}}, "notes": {"bullets": ["a", "b"]}}
+    patch = merge_diff(old, new)
+    assert patch == {"usage": {"cost_usd_total": 0.2}, "notes": {"bullets": ["a", "b"], "x": None}}
+    assert apply_merge_patch(old, patch) == new
+
+
+def test_encoder_patches_against_acked_version_and_snapshots_periodically():
+    enc = DeltaEncoder(snapshot_every=4, max_unacked=8)
+    f1 = enc.encode("s", _frame({"n": 1}, notes={"bullets": ["a"]}))
+    assert f1["v"] == 1 and f1["snapshot"] == {"usage": {"n": 1}, "notes": {"bullets": ["a"]}}
+    assert "usage" not in f1["data"] and "notes_final" not in f1["data"]
+
+    f2 = enc.encode("s", _frame({"n": 2}))
+    assert "snapshot" in f2  # nothing acknowledged yet
+    enc.ack("s", 2)
+    f3 = enc.encode("s", _frame({"n": 3}))  # coach frame: notes carry over unchanged
+    assert f3["base"] == 2 and f3["patch"] == {"usage": {"n": 3}}
+    f4 = enc.encode("s", _frame({"n": 3}, notes={"bullets": ["a", "b"]}))
+    assert f4["base"] == 2 and f4["patch"] == {"usage": {"n": 3}, "notes": {"bullets": ["a", "b"]}}
+    assert "patch" in enc.encode("s", _frame({"n": 4}))
+    f6 = enc.encode("s", _frame({"n": 5}))
+    assert f6["v"] == 6 and "snapshot" in f6  # 4 versions after the last snapshot (v2)
+
+    enc.ack("s", 6)
+    enc.resync("s")
+    assert "snapshot" in enc.encode("s", _frame({"n": 6}))
+
+
+def test_ws_delta_protocol(monkeypatch):
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: [])
+    client = TestClient(app)
+    with client.websocket_connect("/ws?proto=delta") as ws:
+        ws.send_json({"session_id": "delta1", "text_delta": "Tell me about a project you led.", "final": True, "session_mode": "notes"})
+        first = ws.receive_json()
+        assert first["v"] == 1 and "notes" in first["snapshot"] and "usage" in first["snapshot"]
+        ws.send_json({"ack": 1, "session_id": "delta1"})
+        ws.send_json({"session_id": "delta1", "text_delta": "We decided to ship on Friday.", "final": True})
+        second = ws.receive_json()
+        assert second["v"] == 2 and second["base"] == 1
+        doc = apply_merge_patch(first["snapshot"], second["patch"])
+        assert len(doc["notes"]["bullets"]) == 2
+        assert set(second["patch"]["notes"]) < set(first["snapshot"]["notes"])  # only changed sections
+
+
+def test_client_resolves_patches_while_an_ack_is_in_flight_across_a_snapshot():
+    import json
+    import shutil
+    import subprocess
+    from pathlib import Path
+
+    import pytest
+
+    node = shutil.which("node")
+    if node is None:
+        pytest.skip("node is not installed")
+    # Each ack reaches the server one frame late, so the frame after a periodic snapshot
+    # is still patched against the version before it.
+    enc = DeltaEncoder(snapshot_every=3, max_unacked=8)
+    frames, docs = [], []
+    for v in range(1, 10):
+        if v >= 3:
+            enc.ack("s", v - 2)
+        notes = {"bullets": [f"b{i}" for i in range(v)]}
+        frames.append(enc.encode("s", _frame({"n": v}, notes=notes)))
+        docs.append(notes)
+    assert "snapshot" in frames[4] and frames[5]["base"] == 4  # v5 snapshot; ack 5 still in flight
+
+    js = Path(__file__).resolve().parents[1] / "app" / "static" / "delta.js"
+    script = (
+        f"const {{ createDeltaClient }} = require({json.dumps(str(js))});"
+        "const sent = []; const c = createDeltaClient((m) => sent.push(m));"
+        "const frames = JSON.parse(require('fs').readFileSync(0, 'utf8'));"
+        "const out = frames.map((f) => c.resolve(f, 's'));"
+        "console.log(JSON.stringify({ out, sent }));"
+    )
+    res = subprocess.run([node, "-e", script], input=json.dumps(frames), capture_output=True, text=True, check=True)
+    got = json.loads(res.stdout)
+    assert not [m for m in got["sent"] if m.get("resync")]
+    assert [d["notes_final"]["notes"] for d in got["out"]] == docs
+    assert [d["usage"]["n"] for d in got["out"]] == list(range(1, 10))
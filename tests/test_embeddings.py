@@ -0,0 +1,44 @@
+"""Embedding backends and how retrieval treats a store built with another backend."""
+import numpy as np
+import pytest
+
+import app.agent as agent
+from app.bm25 import BM25Index, build_bm25
+from app.embeddings import HashingBackend, OpenAIBackend, make_backend
+from app.retriever import Retriever, build_faiss_index
+
+
+def test_hashing_backend_is_deterministic_and_normalized():
+    b = HashingBackend(dim=64)
+    vecs, tokens = b.embed(["Tell me about a conflict", "tell me about a CONFLICT", ""])
+    assert vecs.shape == (3, 64) and tokens == 0
+    assert np.allclose(vecs[0], vecs[1]) and np.isclose(np.linalg.norm(vecs[0]), 1.0)
+    assert not vecs[2].any()
+
+    assert isinstance(make_backend("local"), HashingBackend)
+    assert isinstance(make_backend("openai"), OpenAIBackend)
+    with pytest.raises(ValueError):
+        make_backend("nope")
+
+
+def test_store_from_another_backend_falls_back_to_keywords(monkeypatch):
+    texts = ["kubernetes migration project", "conflict with a teammate", "mentoring interns"]
+    backend = HashingBackend(dim=32)
+    vecs, _ = backend.embed(texts)
+    r = Retriever()
+    r.index, _ = build_faiss_index(vecs, "flat")
+    r.metric = "cosine"
+    r.info = {"embed_model": backend.name}
+    r.meta = [{"id": f"doc::{i}", "text": t, "source": "t"} for i, t in enumerate(texts)]
+    monkeypatch.setattr(agent, "RETRIEVER", r)
+    monkeypatch.setattr(agent, "SEARCH_BATCHER", None)
+
+    monkeypatch.setattr(agent, "EMBEDDER", backend)
+    assert agent.embedder_matches(r)
+    assert agent.retrieve_context("conflict with a teammate", k=1)[0]["id"] == "doc::1"
+
+    monkeypatch.setattr(agent, "EMBEDDER", OpenAIBackend())  # would need 1536-dim vectors
+    assert not agent.embedder_matches(r)
+    assert agent.retrieve_context("conflict with a teammate", k=1) == []  # no keyword index
+    r.bm25 = BM25Index(build_bm25(texts, range(3)))
+    assert agent.retrieve_context("conflict with a teammate", k=1)[0]["id"] == "doc::1"
@@ -86,3 +86,176 @@ def test_notes_extraction_heuristic():
     assert len(state.notes.get("decisions", [])) >= 1
     agent._update_notes(state, speaker="Alice", text="What about the timeline?")
     assert len(state.notes.get("open_questions", [])) >= 1
+
+
+def test_async_emit_keeps_event_loop_free(monkeypatch):
+    import asyncio, time
+    from app.pipeline import maybe_emit_async
+
+    def slow_classify(text: str, **kwargs):
+        time.sleep(0.3)
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return []
+    monkeypatch.setattr(agent, "classify_question", slow_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+
+    async def run():
+        state = AgentState(session_id="async1")
+        state.buffer_text = "Tell me about a project you led."
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        t = asyncio.create_task(ticker())
+        res = await maybe_emit_async(state, final=True, detector=EndOfThought())
+        t.cancel()
+        return res, ticks
+
+    res, ticks = asyncio.run(run())
+    assert res.emit is True and res.kind == "final"
+    # The loop kept ticking while the slow classifier ran on the worker pool.
+    assert ticks >= 10
+
+
+def test_classify_and_retrieve_fan_out(monkeypatch):
+    import time
+
+    def slow_classify(text: str, **kwargs):
+        time.sleep(0.2)
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def slow_retrieve(query: str, k: int = 4, **kwargs):
+        time.sleep(0.2)
+        return [{"id": "f", "text": "x", "score": 0.9, "meta": {}}]
+    monkeypatch.setattr(agent, "classify_question", slow_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", slow_retrieve, raising=True)
+    monkeypatch.setattr(agent, "PARALLEL_FANOUT", True)
+
+    state = AgentState(session_id="fanout1")
+    state.buffer_text = "Tell me about a time you disagreed with your manager."
+    t0 = time.perf_counter()
+    out = agent.process_turn(state, kind="final")
+    elapsed = time.perf_counter() - t0
+
+    assert out["response_type"] == "coach_final"
+    assert elapsed < 0.35
+    timings = out["usage"]["turn"]["timings_ms"]
+    assert timings["classify"] >= 190 and timings["retrieve"] >= 190
+    assert timings["fanout"] < timings["classify"] + timings["retrieve"]
+
+
+def test_prefetch_reused_by_emit_and_dropped_on_divergence(monkeypatch):
+    retrieved = []
+
+    def fake_classify(text: str, **kwargs):
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        retrieved.append(query)
+        return [{"id": "f", "text": "z", "score": 0.9, "meta": {}}]
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+    monkeypatch.setattr(agent, "PREFETCH", True)
+
+    import time
+    detector = EndOfThought(pause_ms=10_000, min_words=4)
+    state = AgentState(session_id="pf1")
+    append_delta(state, "Tell me about a time you", ts=time.time())
+    assert maybe_emit(state, final=False, detector=detector).emit is False
+    assert state.prefetch is not None
+    state.prefetch.future.result()
+
+    append_delta(state, "led a project?")
+    res = maybe_emit(state, final=True, detector=detector)
+    assert res.emit is True
+    assert retrieved == ["Tell me about a time you"]
+    assert state.usage["prefetch"]["hits"] == 1
+
+    # Diverged text: the old prefetch is replaced rather than reused.
+    state.buffer_text = "How do you handle conflict"
+    state.last_token_ts = time.time()
+    maybe_emit(state, final=False, detector=detector)
+    first = state.prefetch
+    state.buffer_text = "What are your salary expectations here"
+    maybe_emit(state, final=False, detector=detector)
+    assert state.prefetch is not first
+    assert state.prefetch.text == "What are your salary expectations here"
+    # A revised last word is a different text too, not growth.
+    salary = state.prefetch
+    state.buffer_text = "What are your salary expectations there"
+    maybe_emit(state, final=False, detector=detector)
+    assert state.prefetch is not salary
+
+
+def test_prefetch_usage_billed_only_when_reused(monkeypatch):
+    def fake_classify(text: str, *, state=None, **kwargs):
+        agent._record_usage(state, model=agent.CLASSIFIER_MODEL, prompt_tokens=100, completion_tokens=10, feature="classifier")
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: [], raising=True)
+    monkeypatch.setattr(agent, "PREFETCH", True)
+
+    import time
+    detector = EndOfThought(pause_ms=10_000, min_words=4)
+    state = AgentState(session_id="pf_usage")
+    append_delta(state, "Walk me through your last", ts=time.time())
+    maybe_emit(state, final=False, detector=detector)
+    state.prefetch.future.result()
+    assert "classifier" not in state.usage["by_feature"]  # not billed while unused
+
+    # Abandoned: diverged text replaces the prefetch, whose usage is dropped.
+    state.buffer_text = "How do you prioritize work"
+    maybe_emit(state, final=False, detector=detector)
+    state.prefetch.future.result()
+    assert "classifier" not in state.usage["by_feature"]
+
+    append_delta(state, "across teams?")
+    maybe_emit(state, final=True, detector=detector)
+    assert state.usage["by_feature"]["classifier"]["prompt_tokens"] == 100
+    assert state.usage["turn"]["by_model"][agent.CLASSIFIER_MODEL]["prompt_tokens"] == 100
+
+
+def test_coalesce_frames():
+    from app.pipeline import coalesce
+    from app.schemas import DeltaIn
+
+    frames = [
+        DeltaIn(session_id="c", text_delta="We should", speaker="Me"),
+        DeltaIn(session_id="c", text_delta="ship it", speaker="Me"),
+        DeltaIn(session_id="c", mode="replace", text="So we", speaker="Me"),
+        DeltaIn(session_id="c", mode="replace", text="So we should ship", speaker="Me", session_mode="notes"),
+        DeltaIn(session_id="c", text_delta="today.", speaker="Me", final=True),
+        DeltaIn(session_id="c", text_delta="Next", speaker="Me"),
+        DeltaIn(session_id="c", text_delta="Agreed.", speaker="Interviewer"),
+    ]
+    out = coalesce(frames)
+    assert len(out) == 3
+    assert out[0].mode == "replace" and out[0].text == "So we should ship today."
+    assert out[0].final is True and out[0].session_mode == "notes"
+    assert out[1].text_delta == "Next"  # a final closes the run
+    assert out[2].speaker == "Interviewer"  # speaker change is never merged
+
+
+def test_cancelled_speculative_turn_keeps_buffer(monkeypatch):
+    import threading
+
+    cancel = threading.Event()
+
+    def fake_classify(text: str, **kwargs):
+        cancel.set()  # newer text arrives while the turn is in flight
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return []
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+
+    state = AgentState(session_id="cancel1")
+    state.buffer_text = "Tell me about a time you led a team."
+    state.last_token_ts = 0
+    res = maybe_emit(state, final=False, detector=EndOfThought(pause_ms=0, min_words=1), cancel=cancel)
+    assert res.emit is False and res.reason == "superseded"
+    assert state.buffer_text == "Tell me about a time you led a team."
+    assert state.turns == [] and state.intent_history == []
@@ -0,0 +1,47 @@
+"""Tests for the rule-table notes engine."""
+import json
+
+from app.notes import NotesEngine, Rule, DEFAULT_RULES, ensure_sections, new_notes, snapshot
+
+
+def test_one_pass_routes_every_matching_section():
+    eng = NotesEngine()
+    notes = new_notes()
+    eng.update(notes, speaker="Me", text="We decided to ship; action item: I'll follow up on the KPI deadline?", intent="plan")
+    for section in ("decisions", "action_items", "follow_ups", "open_questions"):
+        assert list(notes[section]) == [notes["bullets"][-1]]
+    # Tag rules keep table precedence: timing ("deadline") wins over impact ("kpi").
+    assert notes["topics"][-1] == {"intent": "plan", "tag": "timing"} and notes["current_topic"] == "timing"
+
+    eng.update(notes, speaker="Me", text="The roadmap looks fine", intent="plan")
+    assert notes["current_topic"] == "planning" and len(notes["decisions"]) == 1
+
+
+def test_sections_are_bounded_and_round_trip_through_json():
+    eng = NotesEngine()
+    notes = new_notes()
+    for i in range(100):
+        eng.update(notes, speaker="Me", text=f"we should do thing {i}")
+    assert len(notes["bullets"]) == 60 and notes["bullets"][-1] == "Me: we should do thing 99"
+    assert len(notes["action_items"]) == 30 and len(notes["topics"]) == 80
+
+    back = ensure_sections(json.loads(json.dumps(snapshot(notes))))
+    assert back["bullets"].maxlen == 60 and list(back["bullets"]) == list(notes["bullets"])
+    eng.update(back, speaker="Me", text="one more")
+    assert len(back["bullets"]) == 60
+
+
+def test_custom_rules_extend_the_table():
+    eng = NotesEngine(DEFAULT_RULES + [Rule("risks", ("blocker", "risk"))])
+    notes = new_notes()
+    eng.update(notes, speaker="Me", text="The main risk is the vendor")
+    assert list(notes["risks"]) == ["Me: The main risk is the vendor"]
+
+
+def test_overlapping_cues_from_two_rules_both_match():
+    eng = NotesEngine([Rule("decisions", ("plan",)), Rule("action_items", ("plan to",))])
+    assert eng.matched_rules("we plan to ship") == [0, 1]
+    notes = new_notes()
+    eng.update(notes, speaker="Me", text="we plan to ship")
+    assert list(notes["decisions"]) == list(notes["action_items"]) == ["Me: we plan to ship"]
+    assert eng.matched_rules("a plan") == [0]
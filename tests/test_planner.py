@@ -0,0 +1,71 @@
+"""Per-(mode, kind) stage planning (app/planner.py)."""
+import app.agent as agent
+from app.agent import AgentState, process_turn
+from app.planner import plan_turn
+
+
+def test_plan_table():
+    assert plan_turn("coach", "final").skipped() == ["notes_refine"]
+    assert plan_turn("coach", "speculative", lexical_speculative=True).skipped() == ["embed", "draft", "notes_refine"]
+    assert plan_turn("notes", "final", refine_notes=True).skipped() == ["classify", "embed", "retrieve", "draft"]
+    assert plan_turn("notes", "speculative", refine_notes=True).skipped() == ["classify", "embed", "retrieve", "draft", "notes_refine"]
+
+
+def test_notes_turn_makes_no_classify_or_retrieve_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: calls.append("classify") or {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: calls.append("retrieve") or [])
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", False)
+
+    st = AgentState(session_id="plan_notes", mode="notes")
+    st.buffer_text = "We decided to ship on Friday."
+    out = process_turn(st, kind="final")
+    assert calls == [] and out["response_type"] == "notes_final"
+    assert out["notes_final"]["notes"]["decisions"] == ["Speaker 1: We decided to ship on Friday."]
+    assert st.usage["turn"]["skipped_stages"] == ["classify", "embed", "retrieve", "draft", "notes_refine"]
+
+    st.mode = "coach"
+    st.buffer_text = "What is a hash map and how does it work?"
+    process_turn(st, kind="speculative")
+    assert sorted(calls) == ["classify", "retrieve"]
+
+
+def test_skipped_stages_report_what_ran(monkeypatch):
+    import faiss
+    import numpy as np
+    from app.embeddings import HashingBackend
+    from app.retriever import Retriever
+
+    vecs = np.eye(8, dtype="float32")
+    r = Retriever()
+    r.index = faiss.IndexFlatL2(8)
+    r.index.add(vecs)
+    r.meta = [{"id": f"doc::{i}", "text": f"chunk {i}", "source": "test"} for i in range(8)]
+    monkeypatch.setattr(agent, "RETRIEVER", r)
+    monkeypatch.setattr(agent, "SEARCH_BATCHER", None)
+    monkeypatch.setattr(agent, "EMBEDDER", HashingBackend(dim=8))
+    monkeypatch.setattr(agent, "SPECULATIVE_LEXICAL", True)
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+
+    # The plan drops embed for speculative turns, but without bm25.json retrieval still embeds.
+    st = AgentState(session_id="plan_ran")
+    st.buffer_text = "Tell me about a conflict with a teammate."
+    process_turn(st, kind="speculative")
+    assert agent.plan_for(st, "speculative").skipped() == ["embed", "draft", "notes_refine"]
+    assert st.usage["turn"]["skipped_stages"] == ["draft", "notes_refine"]
+
+
+def test_only_notes_turns_queue_summary_bullets(monkeypatch):
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", True)
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: [])
+
+    st = AgentState(session_id="plan_summary")
+    st.buffer_text = "Tell me about a time you disagreed with a teammate."
+    process_turn(st, kind="speculative")
+    assert st.summary["pending"] == []  # coach mode: the refiner never drains this queue
+
+    st.mode = "notes"
+    st.buffer_text = "We decided to ship on Friday."
+    process_turn(st, kind="final")
+    assert st.summary["pending"] == ["Speaker 1: We decided to ship on Friday."]
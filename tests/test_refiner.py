@@ -0,0 +1,127 @@
+"""Background, debounced notes refinement (app/refiner.py)."""
+import asyncio
+import time
+
+from starlette.testclient import TestClient
+
+import app.agent as agent
+from app.agent import AgentState
+from app.refiner import NOTES_REFINER, NotesRefiner
+from app.server import app
+
+
+def test_finals_within_debounce_share_one_call(monkeypatch):
+    calls = []
+
+    def fake_refine(request, *, state=None):
+        calls.append(request["bullets"])
+        return {"summary": f"{len(request['bullets'])} bullets"}
+
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", True)
+    monkeypatch.setattr(agent, "refine_notes", fake_refine)
+    st = AgentState(session_id="refine1", mode="notes")
+    pushed = []
+
+    async def push(sid, frame):
+        pushed.append(frame)
+
+    async def run():
+        r = NotesRefiner(debounce_s=0.05, max_wait_s=1.0)
+        for i in range(3):
+            agent._update_notes(st, speaker="Me", text=f"point {i}")
+            r.schedule(st, push=push)
+            await asyncio.sleep(0.01)
+        while r.pending():
+            await asyncio.sleep(0.01)
+        return r
+
+    r = asyncio.run(run())
+    assert r.calls == 1 and len(calls[0]) == 3
+    assert len(pushed) == 1 and pushed[0]["reason"] == "notes_refined"
+    assert pushed[0]["data"]["notes_final"]["notes"]["summary_so_far"] == "3 bullets"
+
+
+def test_ws_emits_heuristic_notes_first_then_refined(monkeypatch):
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: [])
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", True)
+
+    def slow_refine(request, *, state=None):
+        time.sleep(0.1)
+        return {"summary": "We agreed to ship."}
+
+    monkeypatch.setattr(agent, "refine_notes", slow_refine)
+    monkeypatch.setattr(NOTES_REFINER, "debounce_s", 0.01)
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"session_id": "refine_ws", "text_delta": "We decided to ship on Friday.", "final": True, "session_mode": "notes"})
+        first = ws.receive_json()
+        assert first["reason"] == "final" and first["data"]["notes_final"]["notes"]["summary_so_far"] is None
+        second = ws.receive_json()
+        assert second["reason"] == "notes_refined" and second["data"]["refined"] is True
+        assert second["data"]["notes_final"]["notes"]["summary_so_far"] == "We agreed to ship."
+
+
+def test_refinement_sees_the_whole_meeting_summary(monkeypatch):
+    from app.summarizer import HierarchicalSummarizer
+
+    requests = []
+
+    def fake_refine(request, *, state=None):
+        requests.append(request)
+        return {"summary": "recent + " + request.get("earlier_summary", "-")}
+
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", True)
+    monkeypatch.setattr(agent, "refine_notes", fake_refine)
+    monkeypatch.setattr(agent, "SUMMARIZER", HierarchicalSummarizer(
+        lambda kind, texts, state: f"{kind}({len(texts)})", segment_turns=3, fanin=2,
+    ))
+    st = AgentState(session_id="refine_summary", mode="notes")
+
+    async def run():
+        r = NotesRefiner(debounce_s=0.0)
+        for i in range(7):
+            agent._update_notes(st, speaker="Me", text=f"point {i}")
+            r.schedule(st)
+            while r.pending():
+                await asyncio.sleep(0.005)
+
+    asyncio.run(run())
+    # Turns 0-5 are two segments merged into one; turn 6 is still pending.
+    assert st.summary["summarized"] == 6 and len(st.summary["pending"]) == 1
+    assert requests[-1]["earlier_summary"] == "merge(2)"
+    assert st.notes["summary_so_far"] == "recent + merge(2)"
+
+
+def test_refinement_keeps_items_added_during_the_call_and_skips_turn_ledger(monkeypatch):
+    import json
+    from types import SimpleNamespace
+
+    st = AgentState(session_id="refine_merge", mode="notes")
+
+    def create(**kwargs):
+        # A turn lands while the model call is in flight.
+        agent._update_notes(st, speaker="Me", text="We should update the docs")
+        content = json.dumps({"action_items": [{"text": "Ship v2", "owner": "Bob"}], "decisions": []})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=200, completion_tokens=50),
+        )
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(agent, "_oai_client", lambda: client)
+    monkeypatch.setattr(agent, "USE_OAI_NOTES", True)
+    agent._update_notes(st, speaker="Me", text="We decided to ship. I'll write the plan.")
+    st.usage["turn"] = {"by_model": {}, "cost_usd": 0.0}
+
+    async def run():
+        r = NotesRefiner(debounce_s=0.0)
+        r.schedule(st)
+        while r.pending():
+            await asyncio.sleep(0.005)
+
+    asyncio.run(run())
+    assert list(st.notes["action_items"]) == ["Ship v2 (owner=Bob)", "Me: We should update the docs"]
+    assert list(st.notes["decisions"]) == []
+    assert st.usage["by_feature"]["notes_refine"]["prompt_tokens"] == 200
+    assert st.usage["turn"] == {"by_model": {}, "cost_usd": 0.0}
@@ -0,0 +1,66 @@
+"""Hot reload of the FAISS store (app/reloader.py and POST /retriever/reload)."""
+import time
+
+import faiss
+import numpy as np
+from starlette.testclient import TestClient
+
+import app.agent as agent
+import app.server as server
+from app.metastore import write_meta_store
+from app.reloader import StoreReloader
+from app.retriever import build_faiss_index
+
+
+def _write_store(path, n, seed=0):
+    vecs = np.random.default_rng(seed).standard_normal((n, 8)).astype("float32")
+    index, _ = build_faiss_index(vecs, "flat")
+    faiss.write_index(index, str(path / "index.faiss"))
+    write_meta_store(str(path), [{"id": f"gen{seed}::{i}", "text": str(i), "source": "t"} for i in range(n)])
+    return vecs
+
+
+def test_reload_swaps_and_keeps_old_index_on_bad_store(tmp_path):
+    installed = []
+    reloader = StoreReloader(installed.append, str(tmp_path))
+    assert reloader.reload()["reloaded"] is False  # nothing built yet
+
+    _write_store(tmp_path, 10, seed=1)
+    res = reloader.reload()
+    assert res["reloaded"] and res["chunks"] == 10 and res["generation"] == 1
+    old = installed[-1]
+
+    # Metadata from a different build than the index: refused, old retriever stays.
+    write_meta_store(str(tmp_path), [{"id": "x", "text": "x", "source": "t"}])
+    res = reloader.reload()
+    assert res["reloaded"] is False and "metadata" in res["error"]
+    assert installed == [old] and reloader.generation == 1
+
+
+def test_watcher_picks_up_rebuilt_store(tmp_path):
+    installed = []
+    _write_store(tmp_path, 5, seed=1)
+    reloader = StoreReloader(installed.append, str(tmp_path), poll_interval_s=0.05)
+    reloader.reload()
+    reloader.start_watcher()
+    try:
+        time.sleep(0.15)
+        vecs = _write_store(tmp_path, 7, seed=2)
+        deadline = time.time() + 3
+        while reloader.generation < 2 and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        reloader.stop_watcher()
+    assert reloader.generation == 2
+    assert installed[-1].search(vecs[3], k=1)[0]["id"] == "gen2::3"
+
+
+def test_reload_endpoint_installs_into_agent(tmp_path, monkeypatch):
+    _write_store(tmp_path, 4, seed=3)
+    monkeypatch.setattr(agent, "RETRIEVER", None)
+    monkeypatch.setattr(server, "RELOADER", StoreReloader(server._install_retriever, str(tmp_path)))
+    client = TestClient(server.app)
+    res = client.post("/retriever/reload").json()
+    assert res["reloaded"] and res["chunks"] == 4
+    assert agent.RETRIEVER is not None and len(agent.RETRIEVER.meta) == 4
+    assert client.get("/debug/retriever").json()["generation"] == 1
@@ -0,0 +1,226 @@
+"""Tests for Retriever search paths, using a small in-memory index."""
+import json
+import threading
+
+import faiss
+import numpy as np
+import pytest
+
+from app.bm25 import BM25Index, build_bm25, rrf_fuse
+from app.embeddings import HashingBackend
+from app.metastore import MetaStore, write_meta_store
+from app.retriever import MicroBatcher, Retriever, build_faiss_index, detect_index_type
+
+
+def _retriever(n: int = 32, d: int = 8, seed: int = 0) -> Retriever:
+    rng = np.random.default_rng(seed)
+    vecs = rng.standard_normal((n, d)).astype("float32")
+    r = Retriever()
+    r.index = faiss.IndexFlatL2(d)
+    r.index.add(vecs)
+    r.meta = [{"id": f"doc::{i}", "text": f"chunk {i}", "source": "test"} for i in range(n)]
+    r._vecs = vecs
+    return r
+
+
+def test_search_batch_matches_single_search():
+    r = _retriever()
+    queries = r._vecs[[3, 7, 11]] + 0.01
+    batch = r.search_batch(queries, k=3)
+    assert [hits[0]["id"] for hits in batch] == ["doc::3", "doc::7", "doc::11"]
+    for q, hits in zip(queries, batch):
+        assert r.search(q, k=3) == hits
+
+
+def test_micro_batcher_fans_results_back_out():
+    r = _retriever()
+    batcher = MicroBatcher(window_ms=20, max_batch=64)
+    results = {}
+
+    def worker(i):
+        results[i] = batcher.search(r, r._vecs[i], k=2 if i % 2 else 4)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    for i in range(16):
+        assert results[i][0]["id"] == f"doc::{i}"
+        assert len(results[i]) == (2 if i % 2 else 4)
+    assert batcher.queries == 16 and batcher.batches < 16
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf_flat", "ivf_pq", "hnsw"])
+def test_load_detects_index_type_and_finds_self(tmp_path, index_type):
+    rng = np.random.default_rng(1)
+    vecs = rng.standard_normal((300, 16)).astype("float32")
+    index, params = build_faiss_index(vecs, index_type, nlist=8, pq_m=4, pq_nbits=6)
+    faiss.write_index(index, str(tmp_path / "index.faiss"))
+    meta = [{"id": f"doc::{i}", "text": f"chunk {i}", "source": "test"} for i in range(len(vecs))]
+    (tmp_path / "meta.json").write_text(json.dumps(meta))
+    (tmp_path / "index_info.json").write_text(json.dumps({"index_type": index_type, "params": params}))
+
+    r = Retriever(str(tmp_path), nprobe=8, ef_search=32).load()
+    assert r.index_type == index_type == detect_index_type(r.index)
+    hits = r.search(vecs[5], k=3)
+    assert "doc::5" in [h["id"] for h in hits]
+
+
+def test_set_search_params_reaches_the_index():
+    rng = np.random.default_rng(2)
+    vecs = rng.standard_normal((200, 8)).astype("float32")
+    r = Retriever()
+    r.index, _ = build_faiss_index(vecs, "ivf_flat", nlist=10)
+    r.set_search_params(nprobe=4)
+    assert faiss.downcast_index(r.index).nprobe == 4
+    r.index, _ = build_faiss_index(vecs, "hnsw", hnsw_m=8)
+    r.set_search_params(ef_search=48)
+    assert faiss.downcast_index(r.index).hnsw.efSearch == 48
+
+
+def test_scores_are_absolute_and_thresholded():
+    rng = np.random.default_rng(3)
+    vecs = rng.standard_normal((64, 16)).astype("float32")
+    r = Retriever()
+    r.index, _ = build_faiss_index(vecs, "flat", metric="cosine")
+    r.metric = "cosine"
+    r.meta = [{"id": f"doc::{i}", "text": f"chunk {i}", "source": "test"} for i in range(len(vecs))]
+
+    exact = r.search(vecs[9] * 3.0, k=2)
+    assert exact[0]["id"] == "doc::9" and exact[0]["score"] == 1.0
+
+    # An unrelated query no longer gets a top score of 1.0.
+    weak = r.search(rng.standard_normal(16).astype("float32"), k=4)
+    assert weak and weak[0]["score"] < 0.9
+
+    r.min_score = 0.95
+    assert r.search(vecs[9], k=4) == exact[:1]
+    assert r.search(rng.standard_normal(16).astype("float32"), k=4) == []
+
+
+def test_legacy_l2_store_maps_distance_to_cosine():
+    vecs = np.eye(4, dtype="float32")
+    r = Retriever()
+    r.index = faiss.IndexFlatL2(4)
+    r.index.add(vecs)
+    r.meta = [{"id": f"doc::{i}", "text": "", "source": "test"} for i in range(4)]
+    q = np.array([0.8, 0.6, 0.0, 0.0], dtype="float32")
+    hits = r.search(q, k=2)
+    assert [(h["id"], h["score"]) for h in hits] == [("doc::0", 0.8), ("doc::1", 0.6)]
+
+
+def test_binary_meta_store_round_trip_and_ids_only(tmp_path):
+    docs = [{"id": f"notes.md::chunk{i}", "text": f"chunk {i} — naïve text", "source": "notes.md"} for i in range(50)]
+    docs.append({"id": "empty::chunk0", "text": "", "source": None})
+    assert write_meta_store(str(tmp_path), docs) == len(docs)
+    store = MetaStore(str(tmp_path))
+    assert len(store) == len(docs)
+    assert store[7] == dict(docs[7], faiss_id=7) and store[-1] == dict(docs[-1], faiss_id=50)
+    assert store.ids([3, 1]) == ["notes.md::chunk3", "notes.md::chunk1"]
+
+    rng = np.random.default_rng(4)
+    vecs = rng.standard_normal((len(docs), 8)).astype("float32")
+    index, _ = build_faiss_index(vecs, "flat")
+    faiss.write_index(index, str(tmp_path / "index.faiss"))
+
+    r = Retriever(str(tmp_path)).load()  # no meta.json: the binary store is enough
+    assert isinstance(r.meta, MetaStore)
+    full = r.search(vecs[12], k=3)
+    assert full[0]["id"] == "notes.md::chunk12" and full[0]["text"] == docs[12]["text"]
+    assert r.search(vecs[12], k=3, ids_only=True) == [{"id": h["id"], "score": h["score"]} for h in full]
+
+
+def test_bm25_lexical_search_and_rrf_fusion():
+    texts = [
+        "Led the migration of the billing service to Kubernetes",
+        "Resolved a conflict with a teammate over code review style",
+        "Cut p99 latency of the search API by caching embeddings",
+        "Mentored two interns on testing practices",
+    ]
+    r = Retriever()
+    r.meta = [{"id": f"star::{i}", "text": t, "source": "star.md"} for i, t in enumerate(texts)]
+    r.bm25 = BM25Index(build_bm25(texts, list(range(len(texts)))))
+
+    hits = r.search_lexical("Tell me about a conflict with a teammate", k=2)
+    assert [h["id"] for h in hits] == ["star::1"]
+    assert 0 < hits[0]["score"] < 1 and hits[0]["text"] == texts[1]
+    assert r.search_lexical("latency", k=4, ids_only=True) == [
+        {"id": "star::2", "score": r.search_lexical("latency", k=1)[0]["score"]}
+    ]
+    assert r.search_lexical("unrelated words only", k=4) == []
+
+    a, b, c = ({"id": x} for x in "abc")
+    assert [h["id"] for h in rrf_fuse([[a, b], [b, c]], k=3)] == ["b", "a", "c"]
+
+
+def test_retrieve_context_lexical_path_skips_embedding(monkeypatch):
+    import app.agent as agent
+
+    r = _retriever(n=4)
+    texts = ["kubernetes migration", "conflict with a teammate", "latency caching", "mentoring interns"]
+    r.meta = [dict(m, text=t) for m, t in zip(r.meta, texts)]
+    r.bm25 = BM25Index(build_bm25(texts, range(4)))
+    monkeypatch.setattr(agent, "RETRIEVER", r)
+    monkeypatch.setattr(agent, "SEARCH_BATCHER", None)
+    monkeypatch.setattr(agent, "EMBEDDER", HashingBackend(dim=8))
+
+    def no_network(*a, **kw):
+        raise AssertionError("lexical-only retrieval must not embed")
+
+    monkeypatch.setattr(agent, "embed_query", no_network)
+    hits = agent.retrieve_context("a conflict at work", k=2, lexical_only=True)
+    assert [h["id"] for h in hits] == ["doc::1"]
+
+    monkeypatch.setattr(agent, "embed_query", lambda text, state=None: r._vecs[3])
+    fused = agent.retrieve_context("a conflict at work", k=2)
+    assert {h["id"] for h in fused} == {"doc::1", "doc::3"}  # keyword hit + vector hit
+
+
+def test_micro_batcher_survives_a_bad_batch():
+    r = _retriever()
+
+    class Short:
+        def search_batch(self, vecs, k):
+            return []  # fewer results than queries
+
+    batcher = MicroBatcher(window_ms=0)
+    with pytest.raises(RuntimeError):
+        batcher.search(Short(), r._vecs[0], k=2)
+    assert batcher.search(r, r._vecs[3], k=1)[0]["id"] == "doc::3"
+
+
+def test_hybrid_retrieval_honours_min_score(monkeypatch):
+    import app.agent as agent
+
+    texts = ["kubernetes migration", "a project I am proud of"] + [f"topic {w}" for w in "cdefgh"]
+    r = _retriever(n=8)
+    r.meta = [dict(m, text=t) for m, t in zip(r.meta, texts)]
+    r.bm25 = BM25Index(build_bm25(texts, range(8)))
+    r.metric = "cosine"
+    r.index = faiss.IndexFlatIP(8)
+    r.index.add(np.eye(8, dtype="float32"))
+    qv = np.array([1.0, 0, 0.9, 0.8, 0.7, 0, 0, 0], dtype="float32")
+    qv /= np.linalg.norm(qv)  # nearest docs 0, 2, 3, 4; doc 1 matches by keyword only
+    monkeypatch.setattr(agent, "RETRIEVER", r)
+    monkeypatch.setattr(agent, "SEARCH_BATCHER", None)
+    monkeypatch.setattr(agent, "HYBRID_RETRIEVAL", True)
+    monkeypatch.setattr(agent, "EMBEDDER", HashingBackend(dim=8))
+    monkeypatch.setattr(agent, "embed_query", lambda text, state=None: qv)
+    query = "What project are you proud of?"
+
+    # No threshold: the keyword-only hit is fused in, without a cosine score.
+    hits = agent.retrieve_context(query, k=2)
+    assert [h["id"] for h in hits] == ["doc::0", "doc::1"]
+    assert hits[1]["score"] == 0.0 and hits[1]["lexical_score"] > 0
+    assert agent.confidence(hits, 0.0) == round(0.5 * hits[0]["score"], 2)
+
+    r.min_score = 0.6
+    assert r.search(qv, k=4) == []
+    assert agent.retrieve_context(query, k=2) == []
+
+    r.min_lexical_score = 0.1
+    assert [h["id"] for h in agent.retrieve_context(query, k=2)] == ["doc::1"]
+    r.min_lexical_score = 0.99
+    assert agent.retrieve_context(query, k=2) == []
@@ -0,0 +1,159 @@
+"""Tests for the session store: eviction and memory accounting."""
+from starlette.testclient import TestClient
+
+from app.server import app
+from app.sessions import SessionStore, approx_state_bytes
+
+
+def test_idle_sessions_are_evicted():
+    store = SessionStore(idle_ttl_s=60, sweep_interval_s=3600)
+    old = store.get_or_create("old")
+    old.last_seen_at -= 120
+    store.get_or_create("fresh")
+    evicted = store.sweep()
+    assert evicted == ["old"]
+    assert "old" not in store and "fresh" in store
+
+
+def test_lru_eviction_over_budget_and_count():
+    store = SessionStore(max_sessions=2, idle_ttl_s=3600, sweep_interval_s=3600)
+    for i, sid in enumerate(["a", "b", "c"]):
+        st = store.get_or_create(sid)
+        st.last_seen_at += i
+    assert len(store) == 2 and "a" not in store
+
+    big = SessionStore(memory_budget_bytes=1, sweep_interval_s=3600)
+    for sid in ("x", "y"):
+        big.get_or_create(sid)
+    big.get("y").last_seen_at += 10
+    assert big.sweep() == ["x"]  # the most recently seen session is always kept
+
+
+def test_approx_bytes_grows_with_turns_and_endpoint():
+    store = SessionStore()
+    st = store.get_or_create("acct")
+    before = approx_state_bytes(st)
+    st.turns.append({"speaker": "Me", "user": "x" * 10_000, "assistant": None})
+    assert approx_state_bytes(st) - before >= 10_000
+
+    client = TestClient(app)
+    data = client.get("/debug/sessions").json()
+    assert "bytes_total" in data and "per_session" in data
+
+
+def test_sweep_reads_sizes_cached_at_save(monkeypatch):
+    import app.sessions as sessions
+
+    store = SessionStore(memory_budget_bytes=30_000, sweep_interval_s=3600)
+    a = store.get_or_create("a")
+    store.get_or_create("b").last_seen_at += 10
+    a.turns.append({"speaker": "Me", "user": "x" * 40_000, "assistant": None})
+    assert store.sweep() == []  # not re-measured until the turn saves
+    store.save(a)
+    assert store.stats()["per_session"][0]["bytes"] >= 40_000
+    a.mode = "notes"
+    calls = []
+    monkeypatch.setattr(sessions, "approx_state_bytes", lambda st: calls.append(st) or 0)
+    store.save(a)  # no new turn: the cached size stands
+    assert calls == [] and store.stats()["per_session"][0]["bytes"] >= 40_000
+
+    def walk(_):
+        raise AssertionError("sweep walked a session")
+
+    monkeypatch.setattr(sessions, "approx_state_bytes", walk)
+    assert store.sweep() == ["a"]
+    assert store.stats()["bytes_total"] < 30_000
+
+
+def test_sqlite_store_shared_between_workers(tmp_path):
+    from app.sessions import SQLiteSessionStore
+    db = str(tmp_path / "sessions.db")
+    w1 = SQLiteSessionStore(db)
+    w2 = SQLiteSessionStore(db)  # a second worker process on the same file
+
+    st = w1.get_or_create("shared")
+    st.mode = "notes"
+    st.notes["bullets"].append("Me: hello")
+    w1.save(st)
+    assert w1.get("shared") is st  # revision unchanged: same live object
+
+    seen = w2.get("shared")
+    assert seen.mode == "notes" and list(seen.notes["bullets"]) == ["Me: hello"]
+    seen.buffer_text = "from worker two"
+    w2.save(seen)
+    assert w1.get("shared").buffer_text == "from worker two"
+    assert w1.get("shared") is st  # reloaded in place: runtime handles survive
+
+
+def test_sqlite_store_interleaved_writes_keep_both_turns(tmp_path):
+    import asyncio
+
+    import pytest
+
+    from app.pipeline import run_locked
+    from app.sessions import SessionConflict, SQLiteSessionStore
+    db = str(tmp_path / "sessions.db")
+    w1, w2 = SQLiteSessionStore(db), SQLiteSessionStore(db)
+    a = w1.get_or_create("race")
+    b = w2.get("race")
+
+    # Both workers loaded revision 1; the second plain save must not discard the first.
+    a.turns.append({"user": "one"})
+    w1.save(a)
+    b.turns.append({"user": "two"})
+    with pytest.raises(SessionConflict):
+        w2.save(b)
+
+    # run_locked reloads and redoes the change when another worker saves in between.
+    calls = []
+
+    async def turn():
+        calls.append(len(calls))
+        if len(calls) == 1:
+            a.turns.append({"user": "three"})
+            w1.save(a)  # lands while worker two's turn is running
+        b.turns.append({"user": "two"})
+
+    asyncio.run(run_locked(b, turn, store=w2))
+    assert len(calls) == 2
+    assert [t["user"] for t in w1.get("race").turns] == ["one", "three", "two"]
+
+
+def test_ws_session_visible_over_rest(monkeypatch):
+    import app.agent as agent
+
+    def fake_classify(text: str, **kwargs):
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return []
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"session_id": "shared_ws", "session_mode": "notes",
+                      "text_delta": "We decided to ship.", "final": True})
+        assert ws.receive_json().get("emit") is True
+    assert client.get("/session/shared_ws/usage").status_code == 200
+    notes = client.get("/session/shared_ws/notes").json()["notes"]
+    assert notes["decisions"]
+
+
+def test_ws_saves_only_frames_that_change_the_session(monkeypatch):
+    import app.agent as agent
+    import app.ws as ws_mod
+
+    monkeypatch.setattr(agent, "classify_question", lambda text, **kw: {"intent": "behavioral", "entities": {}, "confidence": 0.9})
+    monkeypatch.setattr(agent, "retrieve_context", lambda q, k=4, **kw: [])
+    saved = []
+    monkeypatch.setattr(ws_mod.sessions, "save", lambda st: saved.append(st.session_id))
+
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as ws:
+        frames = [{"text_delta": "we"}, {"text_delta": "decided"}, {"text_delta": "to ship.", "final": True}]
+        for f in frames:
+            ws.send_json({"session_id": "save_gate", "session_mode": "notes", **f})
+            ws.receive_json()
+    assert saved == ["save_gate", "save_gate"]  # the mode switch, then the final
+    turn = ws_mod.sessions.get("save_gate").turns[-1]["assistant"]
+    assert turn["response_type"] == "notes_final" and "usage" not in turn and "notes_final" not in turn
@@ -0,0 +1,40 @@
+"""Rolling hierarchical meeting summary (app/summarizer.py)."""
+from app.summarizer import HierarchicalSummarizer, new_tree
+
+
+def test_whole_session_covered_with_bounded_inputs_and_linear_calls():
+    seen = []
+
+    def fake(kind, texts, state):
+        seen.append((kind, len(texts)))
+        return f"{kind} of {len(texts)}"
+
+    s = HierarchicalSummarizer(fake, segment_turns=4, fanin=3)
+    tree = new_tree()
+    n = 4 * 27
+    for i in range(n):
+        s.add(tree, f"Me: point {i}")
+        s.catch_up(tree)
+
+    assert tree["summarized"] == n and not tree["pending"]
+    # 27 segments = 1000 in base 3: everything has merged into one level-3 summary.
+    assert [(seg["level"], seg["start"], seg["end"]) for seg in tree["segments"]] == [(3, 0, n)]
+    assert tree["meeting"] == tree["segments"][0]["text"]
+    assert max(k for kind, k in seen if kind != "meeting") <= 4
+    # The meeting call sees at most fanin - 1 open summaries per level.
+    assert max(k for kind, k in seen if kind == "meeting") <= (3 - 1) * 3
+    segments = n // 4
+    assert len(seen) <= segments * (2 + 1 / (3 - 1))
+
+
+def test_commit_keeps_bullets_added_during_catch_up():
+    s = HierarchicalSummarizer(lambda kind, texts, state: "summary", segment_turns=3, fanin=4)
+    live = new_tree()
+    for i in range(4):
+        s.add(live, f"b{i}")
+    done = s.snapshot(live)
+    s.add(live, "b4")  # arrives while the copy is being summarized
+    assert s.catch_up(done) == 1
+    s.commit(live, done)
+    assert live["pending"] == ["b3", "b4"] and live["summarized"] == 3
+    assert live["segments"][0]["end"] == 3 and live["meeting"] == "summary"
@@ -16,3 +16,30 @@ def test_websocket_connection():
         assert response.get("emit") is False
         assert "reason" in response
         assert "kind" in response
+
+
+def test_pause_emits_without_new_frame(monkeypatch):
+    import time
+    import app.agent as agent
+
+    def fake_classify(text: str, **kwargs):
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return []
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+
+    with client.websocket_connect("/ws") as websocket:
+        websocket.send_json({
+            "session_id": "pause_session",
+            "text_delta": "Tell me about a time you led a project.",
+            "final": False,
+        })
+        t0 = time.time()
+        first = websocket.receive_json()
+        assert first.get("emit") is False
+        # The speaker went silent: the pause timer pushes a speculative emit on its own.
+        second = websocket.receive_json()
+        assert second.get("emit") is True
+        assert second.get("kind") == "speculative" and second.get("reason") == "pause"
+        assert time.time() - t0 < 2.0
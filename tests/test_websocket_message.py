@@ -34,3 +34,46 @@ def test_websocket_message_flow(monkeypatch):
         assert "suggestions" in cf and isinstance(cf["suggestions"], list) and len(cf["suggestions"]) >= 1
         assert "follow_up" in cf and "bridge" in cf and "confidence" in cf and "context_ids" in cf
         assert "speaker" in data and "transcript" in data and "usage" in data
+
+
+def test_streaming_coach_final_partials(monkeypatch):
+    from types import SimpleNamespace as NS
+
+    def fake_classify(text: str, **kwargs):
+        return {"intent": "behavioral", "entities": {}, "confidence": 0.9}
+
+    def fake_retrieve(query: str, k: int = 4, **kwargs):
+        return [{"id": "fake::0", "text": "demo STAR note", "score": 0.92, "meta": {"source": "fake"}}]
+
+    pieces = ['{"options": ["First opt', 'ion.", "Sec', 'ond option."], ', '"follow_up": "More?", "bridge": "Sure."}']
+
+    class _Completions:
+        @staticmethod
+        def create(stream=False, **kwargs):
+            assert stream is True
+            chunks = [NS(usage=None, choices=[NS(delta=NS(content=p))]) for p in pieces]
+            chunks.append(NS(usage=NS(prompt_tokens=10, completion_tokens=20), choices=[]))
+            return iter(chunks)
+
+    monkeypatch.setattr(agent, "classify_question", fake_classify, raising=True)
+    monkeypatch.setattr(agent, "retrieve_context", fake_retrieve, raising=True)
+    monkeypatch.setattr(agent, "USE_OAI_DRAFTER", True)
+    monkeypatch.setattr(agent, "_oai_client", lambda: NS(chat=NS(completions=_Completions())))
+
+    client = TestClient(app)
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({
+            "session_id": "ws_stream_1",
+            "text_delta": "Tell me about a time you led a project end to end?",
+            "final": True,
+        })
+        p1 = ws.receive_json()
+        p2 = ws.receive_json()
+        final = ws.receive_json()
+    assert p1["partial"] is True and p1["data"]["coach_final"]["suggestions"] == ["First option."]
+    assert p2["data"]["coach_final"]["suggestions"] == ["First option.", "Second option."]
+    assert "partial" not in final
+    cf = final["data"]["coach_final"]
+    assert cf["suggestions"] == ["First option.", "Second option."]
+    assert cf["follow_up"] == "More?" and "confidence" in cf
+    assert final["data"]["usage"]["by_feature"]["coach_drafter"]["completion_tokens"] == 20